@@ -0,0 +1,255 @@
+from argparse import ArgumentParser
+from typing import Any, Callable
+from pathlib import Path
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import src.main as main
+
+STAGES = ["generate_testlist", "cells_normalization", "add_examcells", "rearrange_cells", "expandvars", "create_excel", "adjusttable", "save"]
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+def generate_sheet(directory: str | Path, items: int, depth: int=4, sections: int=4, reuse: float=0.2, includes: int=0, seed: int=0) -> Path:
+  """
+  ベンチマーク用の試験票(Markdownファイル)を生成する
+
+  Parameters
+  ----
+  directory: 出力先ディレクトリ
+  items: 試験項目数(最下層の見出しの数)
+  depth: 見出しの階層数(TestItemsLabelの数に対応)
+  sections: 試験項目ごとの試験内容(::)の数
+  reuse: 試験内容を && で前の試験項目から引き継ぐ割合(0〜1)
+  includes: 試験項目のうち &include で読み込むものの数
+  seed: 乱数のシード
+
+  Returns
+  ----
+  生成した試験票のパス
+  """
+  directory = Path(directory)
+  directory.mkdir(parents=True, exist_ok=True)
+  rng = random.Random(seed)
+  fanout = max(2, math.ceil(items ** (1 / depth)))
+  includeevery = items // includes if includes > 0 else 0
+  fragments = min(includes, 5)
+  for i in range(fragments):
+    with open(directory / f"fragment{i}.md", mode="w", encoding="utf-8") as f:
+      f.write(f"{'#' * depth} //**title**//\n")
+      for s in range(sections):
+        f.write(f":: 項目{s}\n* //**value**// {i}-{s}\n* {{{{Environment}}}}で確認する\n")
+  path = directory / "bench.md"
+  with open(path, mode="w", encoding="utf-8") as f:
+    for n in range(items):
+      # open every heading level whose index changed since the previous item
+      digits = []
+      rest = n
+      for _ in range(depth):
+        digits.append(rest % fanout)
+        rest //= fanout
+      digits.reverse()
+      for level in range(depth - 1):
+        if n == 0 or all(d == 0 for d in digits[level + 1:]):
+          f.write(f"{'#' * (level + 1)} 見出し{level + 1}-{n}\n")
+      if includeevery and n % includeevery == 0 and n // includeevery < includes:
+        f.write(f'&include({{"name":"fragment{(n // includeevery) % fragments}.md","title":"項目{n}","value":"値{n}"}})\n')
+        continue
+      f.write(f"{'#' * depth} 項目{n}\n")
+      for s in range(sections):
+        if n > 0 and rng.random() < reuse:
+          f.write(f":: 項目{s} &&\n")
+        else:
+          f.write(f":: 項目{s}\n* 手順{n}-{s}\n* {{{{Environment}}}}で確認する\n")
+      f.write("\n")
+  return path
+
+def bench_config(config: dict[Any], depth: int) -> dict[Any]:
+  """
+  設定データをベンチマーク用に調整する(TestItemsLabelを階層数に合わせ、定数とRearrangeを必ず設定する)
+  """
+  config = json.loads(json.dumps(config))
+  labels = config["Headers"]["TestItemsLabel"]
+  config["Headers"]["TestItemsLabel"] = (labels + [f"Level{i + 1}" for i in range(len(labels), depth)])[:depth]
+  config.setdefault("Consts", {}).setdefault("Environment", "試験環境")
+  config.setdefault("Rearrange", ["no", "itemname", "content", "results"])
+  return config
+
+def run_stages(config: dict[Any], path: Path, measure: Callable[[str, Callable[[], Any]], Any], streaming: bool=False, engine: str="openpyxl") -> None:
+  """
+  パイプラインの各段階をmeasureに渡して実行する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  path: 試験票のパス
+  measure: (段階名, 処理)を受け取って処理を実行し、その戻り値を返す関数
+  streaming: create_excel_streamingで出力するかどうか
+  engine: fastの場合はcreate_excel_fastで出力する(保存まで含めてcreate_excelとして計測する)
+  """
+  with open(path, mode="r", encoding="utf-8") as f:
+    lines = f.read()
+  # the pipeline parses into ExamRecords; generate_testlist adds the conversion to dicts
+  exams = measure("generate_testlist", lambda: list(main.iter_records(lines, base=path.parent, includes=main.IncludeEngine())))
+  cells = measure("cells_normalization", lambda: main.normalize_table(config["Headers"]["TestItemsLabel"], exams))
+  cells = measure("add_examcells", lambda: main.add_examcells(config["Headers"]["TestResult"], cells))
+  cells = measure("rearrange_cells", lambda: main.rearrange_cells(config["Headers"], cells, config["Rearrange"]))
+  cells = measure("expandvars", lambda: main.expandvars(cells, config["Consts"]))
+  if engine == "fast":
+    measure("create_excel", lambda: main.create_excel_fast(config, cells, io.BytesIO()))
+    return
+  if streaming:
+    wb = measure("create_excel", lambda: main.create_excel_streaming(config, cells))
+  else:
+    wb = measure("create_excel", lambda: main.create_excel(config, cells))
+    if "ColumnSet" in config:
+      measure("adjusttable", lambda: main.adjusttable(wb.worksheets[-1], config["ColumnSet"]))
+  measure("save", lambda: wb.save(io.BytesIO()))
+
+def bench_size(config: dict[Any], path: Path, repeat: int=1, memory: bool=True, streaming: bool=False, engine: str="openpyxl") -> dict[str, dict[str, float]]:
+  """
+  一つの試験票について各段階の実行時間とピークメモリを計測する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  path: 試験票のパス
+  repeat: 実行時間の計測回数(最小値を採用する)
+  memory: ピークメモリを計測するかどうか(計測用に一回多く実行する)
+  streaming: create_excel_streamingで出力するかどうか
+  engine: 出力に使うエンジン(openpyxlまたはfast)
+
+  Returns
+  ----
+  段階名をキーとし、time(秒)、cpu(秒)、peak(バイト)を値とする辞書
+  """
+  results: dict[str, dict[str, float]] = {}
+  def timed(name: str, fn: Callable[[], Any]) -> Any:
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    value = fn()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    entry = results.setdefault(name, {"time": wall, "cpu": cpu})
+    entry["time"] = min(entry["time"], wall)
+    entry["cpu"] = min(entry["cpu"], cpu)
+    return value
+  def traced(name: str, fn: Callable[[], Any]) -> Any:
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    value = fn()
+    results[name]["peak"] = tracemalloc.get_traced_memory()[1] - base
+    return value
+  with contextlib.redirect_stdout(io.StringIO()):
+    for _ in range(repeat):
+      run_stages(config, path, timed, streaming, engine)
+    if memory:
+      tracemalloc.start()
+      try:
+        run_stages(config, path, traced, streaming, engine)
+      finally:
+        tracemalloc.stop()
+  return results
+
+def run(args) -> int:
+  with open(args.config, mode="r", encoding="utf-8") as f: config = bench_config(yaml.safe_load(f), args.depth)
+  report = {
+    "meta": {
+      "date": datetime.datetime.now().isoformat(timespec="seconds"),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "openpyxl": openpyxl.__version__,
+      "params": {n: getattr(args, n) for n in ["depth", "sections", "reuse", "includes", "repeat", "streaming", "engine", "seed"]},
+    },
+    "results": [],
+  }
+  with tempfile.TemporaryDirectory() as tmp:
+    for size in args.sizes:
+      path = generate_sheet(Path(tmp) / str(size), size, args.depth, args.sections, args.reuse, args.includes, args.seed)
+      stages = bench_size(config, path, args.repeat, not args.no_memory, args.streaming, args.engine)
+      report["results"].append({"items": size, "stages": stages})
+      for name, v in stages.items():
+        peak = f"{v['peak'] / 1048576:9.1f} MiB" if "peak" in v else ""
+        print(f"> {size:>7} {name:<20} {v['time']:9.3f} s {peak}", file=sys.stderr)
+  text = json.dumps(report, indent=1, ensure_ascii=False)
+  if args.out:
+    with open(args.out, mode="w", encoding="utf-8") as f: f.write(text)
+  else:
+    print(text)
+  return 0
+
+def compare(baseline: dict[Any], current: dict[Any], threshold: float=0.2, mintime: float=0.01, minpeak: int=1048576) -> list[dict[str, Any]]:
+  """
+  二つのベンチマーク結果を比較し、性能が劣化した項目を返す
+
+  Parameters
+  ----
+  baseline: 基準となるベンチマーク結果
+  current: 比較するベンチマーク結果
+  threshold: 劣化とみなす増加率(0.2なら20%)
+  mintime: 劣化とみなす実行時間の最小の増加量(秒)
+  minpeak: 劣化とみなすピークメモリの最小の増加量(バイト)
+
+  Returns
+  ----
+  劣化した項目(items, stage, metric, baseline, current)のリスト
+  """
+  regressions = []
+  base = {r["items"]: r["stages"] for r in baseline["results"]}
+  for result in current["results"]:
+    if not result["items"] in base: continue
+    for stage, values in result["stages"].items():
+      before = base[result["items"]].get(stage)
+      if before is None: continue
+      for metric, minimum in [("time", mintime), ("peak", minpeak)]:
+        if not metric in values or not metric in before: continue
+        if values[metric] > before[metric] * (1 + threshold) and values[metric] - before[metric] > minimum:
+          regressions.append({"items": result["items"], "stage": stage, "metric": metric, "baseline": before[metric], "current": values[metric]})
+  return regressions
+
+def compare_command(args) -> int:
+  with open(args.baseline, mode="r", encoding="utf-8") as f: baseline = json.load(f)
+  with open(args.current, mode="r", encoding="utf-8") as f: current = json.load(f)
+  regressions = compare(baseline, current, args.threshold, args.min_time, args.min_peak)
+  for r in regressions:
+    print(f"> REGRESSION {r['items']:>7} {r['stage']:<20} {r['metric']:<5} {r['baseline']:.4g} -> {r['current']:.4g} (+{(r['current'] / r['baseline'] - 1) * 100 if r['baseline'] else math.inf:.0f}%)")
+  print(f"> {len(regressions)} regression(s)")
+  return 1 if regressions else 0
+
+if __name__ == "__main__":
+  p = ArgumentParser(description="TestSheetMaker benchmark")
+  sub = p.add_subparsers(dest="command", required=True)
+  r = sub.add_parser("run", help="Generate synthetic test sheets and measure every pipeline stage.")
+  r.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of test items to measure.")
+  r.add_argument("--depth", type=int, default=4, help="Heading depth (number of TestItemsLabel levels).")
+  r.add_argument("--sections", type=int, default=4, help="Sections (::) per test item.")
+  r.add_argument("--reuse", type=float, default=0.2, help="Ratio of sections inherited with &&.")
+  r.add_argument("--includes", type=int, default=0, help="Number of test items written with &include.")
+  r.add_argument("--repeat", type=int, default=1, help="Timed runs per size (the fastest is reported).")
+  r.add_argument("--seed", type=int, default=0, help="Random seed for the generator.")
+  r.add_argument("--streaming", action="store_true", help="Measure create_excel_streaming instead of create_excel + adjusttable.")
+  r.add_argument("--engine", choices=["openpyxl", "fast"], default="openpyxl", help="Writer backend to measure ('fast' includes saving in create_excel).")
+  r.add_argument("--no-memory", action="store_true", help="Skip the traced run that measures peak memory.")
+  r.add_argument("-c", "--config", default="sample/config.yml", type=str, help="Config file used for the sheets.")
+  r.add_argument("-o", "--out", type=str, help="JSON output file (default: stdout).")
+  c = sub.add_parser("compare", help="Compare two JSON results and flag regressions.")
+  c.add_argument("baseline", type=str, help="Stored baseline JSON.")
+  c.add_argument("current", type=str, help="JSON to check against the baseline.")
+  c.add_argument("--threshold", type=float, default=0.2, help="Relative increase treated as a regression (default: 0.2).")
+  c.add_argument("--min-time", type=float, default=0.01, help="Ignore time increases smaller than this many seconds.")
+  c.add_argument("--min-peak", type=int, default=1048576, help="Ignore peak memory increases smaller than this many bytes.")
+  args = p.parse_args()
+  sys.exit(run(args) if args.command == "run" else compare_command(args))
@@ -0,0 +1,17 @@
+"""
+試験票作成ツール
+
+Markdownで書いた試験票から、Excelなどの形式の試験票を作成する。
+
+  import testsheetmaker
+  table = testsheetmaker.build(text, "config.yml")
+  testsheetmaker.write(table, "tests.xlsx")
+"""
+from .api import build, write, load_config
+from .table import Table
+from .parser import IncludeEngine
+from .profiler import Profiler
+from .cache import BuildCache
+from .config import Config
+
+__all__ = ["build", "write", "load_config", "Table", "IncludeEngine", "Profiler", "BuildCache", "Config"]
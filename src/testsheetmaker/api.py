@@ -0,0 +1,77 @@
+"""
+Pythonから試験票を作成するためのAPI
+
+一度読み込んだモジュールはプロセス内で使い回されるため、常駐するプログラムから繰り返し呼び出せる。
+"""
+from __future__ import annotations
+from typing import Any
+from pathlib import Path
+
+from .table import Table
+from .pipeline import table_from_lines, write_file
+from .profiler import Profiler
+from .config import Config
+from .cache import BuildCache
+
+def load_config(path: str | Path, cache: BuildCache | None=None) -> Config:
+  """
+  設定ファイル(YAML形式)を読み込み、検証・コンパイルする
+
+  Parameters
+  ----
+  path: 設定ファイルのパス
+  cache: コンパイル済みの設定データを保存・再利用するキャッシュ(省略時は毎回コンパイルする)
+
+  Returns
+  ----
+  コンパイル済みの設定データ
+  """
+  if cache is not None:
+    return cache.load_config(path)
+  import yaml
+  with open(path, mode="r", encoding="utf-8") as f: return Config(yaml.safe_load(f))
+
+def build(markdown_text: str, config: dict[Any] | str | Path, base: str | Path=".", profiler: Profiler | None=None, parallel: int | None=None) -> Table:
+  """
+  試験票の内容からテーブルデータを作成する
+
+  Parameters
+  ----
+  markdown_text: 試験票(Markdown)の内容
+  config: 設定データを示す構造体、または設定ファイルのパス
+  base: &includeの基準ディレクトリパス
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  parallel: 並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ(作成に使った設定データをconfigに持つ)
+  """
+  if not isinstance(config, dict):
+    config = load_config(config)
+  table = table_from_lines(config, markdown_text, str(base), profiler=profiler, parallel=parallel)
+  table.config = config
+  return table
+
+def write(table: Table | list[list[str]], path: str | Path, config: dict[Any] | str | Path | None=None, format: str | None=None, engine: str="openpyxl", streaming: bool=False, profiler: Profiler | None=None, template: str | Path | None=None) -> None:
+  """
+  テーブルデータをファイルに出力する
+
+  Parameters
+  ----
+  table: buildで作成したテーブルデータ
+  path: 出力先のパス
+  config: 設定データを示す構造体、または設定ファイルのパス(省略時はbuildに渡した設定データ)
+  format: 出力形式(xlsx, csv, tsv, jsonl, html。省略時は出力先の拡張子から決める)
+  engine: xlsxの出力に使うエンジン(openpyxlまたはfast)
+  streaming: xlsxを書き込み専用ワークシートで出力するかどうか
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  template: 表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する)
+  """
+  if config is None:
+    config = getattr(table, "config", None)
+    if config is None:
+      raise Exception("config is required for a table that was not created by build()")
+  elif not isinstance(config, dict):
+    config = load_config(config)
+  write_file(config, table, str(path), streaming, profiler, engine, format, str(template) if template is not None else None)
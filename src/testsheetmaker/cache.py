@@ -0,0 +1,239 @@
+"""
+差分ビルド用のキャッシュ
+"""
+from __future__ import annotations
+from typing import Any, Iterable
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+
+from .config import Config
+
+class BuildCache:
+  """
+  差分ビルド用のキャッシュ。
+
+  試験票・インクルードしたファイル・設定データのハッシュをマニフェストに記録し、作成したテーブルデータを
+  JSONで保存する。いずれも変更がなければテーブルデータの作成を省略し、出力するワークブックの入力が
+  すべて変更されていなければワークブックの書き込みも省略する。
+  """
+  # config sections that affect build_table output
+  TABLE_SECTIONS = ["Headers", "Rearrange", "Consts"]
+  VERSION = 1
+
+  def __init__(self, directory: str, force: bool=False) -> None:
+    self.directory = Path(directory)
+    self.force = force
+    self.hits = {"tables": 0, "outputs": 0}
+    self.misses = {"tables": 0, "outputs": 0}
+    self.confighit: bool | None = None
+    self.digests: dict[str, str | None] = {}
+    self.manifest = {"version": self.VERSION, "tables": {}, "outputs": {}}
+    try:
+      with open(self.directory / "manifest.json", mode="r", encoding="utf-8") as f:
+        manifest = json.load(f)
+      if manifest.get("version") == self.VERSION:
+        self.manifest = manifest
+    except (OSError, ValueError):
+      pass
+
+  @staticmethod
+  def filehash(path: str | Path) -> str | None:
+    """
+    ファイルのハッシュを返す(ファイルが存在しない場合はNone)
+    """
+    try:
+      with open(path, mode="rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+      return None
+
+  @staticmethod
+  def confighash(config: dict[Any], sections: list[str] | None=None) -> str:
+    """
+    設定データ(sectionsを指定した場合はその項目のみ)のハッシュを返す
+    """
+    data = config if sections is None else {n: config.get(n) for n in sections}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+  def load_config(self, path: str | Path) -> Config:
+    """
+    設定ファイルを読み込み、コンパイル済みの設定データを返す。
+    同じ内容の設定ファイルをコンパイルしたことがあれば、YAMLの解析とコンパイルを省略する
+
+    Parameters
+    ----
+    path: 設定ファイルのパス
+
+    Returns
+    ----
+    コンパイル済みの設定データ
+    """
+    import yaml
+    with open(path, mode="rb") as f: data = f.read()
+    key = hashlib.sha256(data + f"\n{self.VERSION}.{Config.VERSION}".encode("utf-8")).hexdigest()
+    pickled = self.directory / "configs" / f"{key}.pickle"
+    if not self.force:
+      try:
+        with open(pickled, mode="rb") as f: config = pickle.load(f)
+        if isinstance(config, Config):
+          self.confighit = True
+          return config
+      except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+    self.confighit = False
+    config = Config(yaml.safe_load(data.decode("utf-8")))
+    pickled.parent.mkdir(parents=True, exist_ok=True)
+    tmp = pickled.with_suffix(".tmp")
+    with open(tmp, mode="wb") as f: pickle.dump(config, f)
+    os.replace(tmp, pickled)
+    return config
+
+  def digest(self, config: dict[Any], tests: str) -> str | None:
+    """
+    試験票のキャッシュが有効であれば、その入力全体を示すハッシュを返す
+
+    Parameters
+    ----
+    config: 設定データを示す構造体
+    tests: 試験票のファイルパス
+
+    Returns
+    ----
+    入力全体を示すハッシュ。キャッシュがないか、入力が変更されている場合はNone
+    """
+    key = str(Path(tests).resolve())
+    if key in self.digests:
+      return self.digests[key]
+    entry = self.manifest["tables"].get(key)
+    digest = None
+    if (not self.force and entry is not None
+      and entry["source"] == self.filehash(tests)
+      and entry["config"] == self.confighash(config, self.TABLE_SECTIONS)
+      and all(self.filehash(n) == v for n, v in entry["includes"].items())):
+      digest = entry["digest"]
+    self.digests[key] = digest
+    return digest
+
+  def load_table(self, config: dict[Any], tests: str) -> list[list[str]] | None:
+    """
+    キャッシュされたテーブルデータを返す
+
+    Parameters
+    ----
+    config: 設定データを示す構造体
+    tests: 試験票のファイルパス
+
+    Returns
+    ----
+    テーブルデータ。キャッシュがないか、入力が変更されている場合はNone
+    """
+    if self.digest(config, tests) is not None:
+      try:
+        with open(self.directory / self.manifest["tables"][str(Path(tests).resolve())]["table"], mode="r", encoding="utf-8") as f:
+          cells = json.load(f)
+        self.hits["tables"] += 1
+        return cells
+      except (OSError, ValueError):
+        pass
+    self.misses["tables"] += 1
+    return None
+
+  def store_table(self, config: dict[Any], tests: str, cells: list[list[str]], includes: Iterable[str]) -> None:
+    """
+    テーブルデータとその入力のハッシュをキャッシュに記録する
+
+    Parameters
+    ----
+    config: 設定データを示す構造体
+    tests: 試験票のファイルパス
+    cells: テーブルデータ
+    includes: 試験票が直接・間接にインクルードしたファイルのパス
+    """
+    key = str(Path(tests).resolve())
+    entry = {
+      "source": self.filehash(tests),
+      "config": self.confighash(config, self.TABLE_SECTIONS),
+      "includes": {n: self.filehash(n) for n in includes},
+    }
+    entry["digest"] = hashlib.sha256(json.dumps(entry, sort_keys=True).encode("utf-8")).hexdigest()
+    entry["table"] = f"tables/{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json"
+    (self.directory / "tables").mkdir(parents=True, exist_ok=True)
+    with open(self.directory / entry["table"], mode="w", encoding="utf-8") as f:
+      json.dump(list(cells), f, ensure_ascii=False)
+    self.manifest["tables"][key] = entry
+    self.digests[key] = entry["digest"]
+
+  def output_key(self, config: dict[Any], tests: list[str], options: dict[str, Any]) -> str | None:
+    """
+    出力するワークブックの入力全体を示すキーを返す
+
+    Parameters
+    ----
+    config: 設定データを示す構造体
+    tests: ワークブックに含まれる試験票のファイルパスのリスト
+    options: 出力結果に影響するオプション
+
+    Returns
+    ----
+    キー。いずれかの試験票のキャッシュがないか、入力が変更されている場合はNone
+    """
+    digests = [self.digest(config, t) for t in tests]
+    if None in digests:
+      return None
+    data = [digests, self.confighash(config), options]
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+  def output_fresh(self, out: str, key: str | None) -> bool:
+    """
+    出力先のワークブックが最新かどうかを返す
+
+    Parameters
+    ----
+    out: 出力先のパス
+    key: output_keyの戻り値
+
+    Returns
+    ----
+    最新であればTrue
+    """
+    fresh = (not self.force and key is not None and Path(out).exists()
+      and self.manifest["outputs"].get(str(Path(out).resolve())) == key)
+    if fresh:
+      self.hits["outputs"] += 1
+    else:
+      self.misses["outputs"] += 1
+    return fresh
+
+  def store_output(self, out: str, key: str | None) -> None:
+    """
+    出力したワークブックのキーを記録する
+
+    Parameters
+    ----
+    out: 出力先のパス
+    key: output_keyの戻り値
+    """
+    if key is not None:
+      self.manifest["outputs"][str(Path(out).resolve())] = key
+
+  def save(self) -> None:
+    """
+    マニフェストを保存する
+    """
+    self.directory.mkdir(parents=True, exist_ok=True)
+    tmp = self.directory / "manifest.json.tmp"
+    with open(tmp, mode="w", encoding="utf-8") as f:
+      json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, self.directory / "manifest.json")
+
+  def report(self) -> str:
+    """
+    キャッシュのヒット・ミスの件数を示す文字列を返す
+    """
+    report = ", ".join(f"{n} {self.hits[n]} hit / {self.misses[n]} miss" for n in self.hits)
+    if self.confighit is not None:
+      report += ", config " + ("hit" if self.confighit else "miss")
+    return report
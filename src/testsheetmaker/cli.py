@@ -0,0 +1,238 @@
+"""
+コマンドラインインターフェース
+"""
+from __future__ import annotations
+from argparse import ArgumentParser
+from pathlib import Path
+import glob
+import json
+import logging
+import sys
+
+from .formats import FORMATS, output_format
+from .parser import PARALLEL_THRESHOLD
+
+logger = logging.getLogger("testsheetmaker")
+
+def main(argv: list[str] | None=None) -> int:
+  """
+  コマンドライン引数に従って試験票を作成する
+
+  Parameters
+  ----
+  argv: コマンドライン引数(省略時はsys.argv)
+
+  Returns
+  ----
+  終了コード(一括作成で失敗したファイルがあれば1)
+  """
+  if argv is None:
+    argv = sys.argv[1:]
+  if argv[:1] == ["harvest"]:
+    return harvest(argv[1:])
+  if argv[:1] == ["serve"]:
+    return serve(argv[1:])
+  p = ArgumentParser(prog="testsheetmaker", description="Test Sheet Creation Tool", epilog="Run 'testsheetmaker harvest -h' to collect the results entered in finished workbooks, 'testsheetmaker serve -h' to run a local render service.")
+  p.add_argument("tests", type=str, nargs="+", help="Markdown file that defines a test item. Multiple files or glob patterns can be given with --outdir.")
+  p.add_argument("-o", "--out", type=str, help="Excel file output destination.")
+  p.add_argument("-d", "--outdir", type=str, help="Output directory for batch mode. Each Markdown file is written to <outdir>/<name>.xlsx.")
+  p.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes in batch and sheets mode (default: number of CPUs).")
+  p.add_argument("--sheets", action="store_true", help="Write every Markdown file (or every *.md in a given directory) to its own sheet of the single workbook given by -o/--out.")
+  p.add_argument("--summary", action="store_true", help="Add a summary sheet with the item count of each file (with --sheets).")
+  p.add_argument("-c", "--config", default="sample/config.yml", type=str, help="Configured file that defines basic information of the test vote.")
+  p.add_argument("--streaming", action="store_true", help="Write the sheet with a write-only worksheet to keep memory flat on large tests.")
+  p.add_argument("--low-memory", action="store_true", help="Parse, convert and write one test item at a time without building the table, so memory does not grow with the number of items (single xlsx file). The test file is read twice unless Headers.Sections declares the section columns.")
+  p.add_argument("--select", type=str, action="append", default=None, metavar="QUERY", help="Write only the test items matching QUERY: a heading path glob from the top level separated by '/' (everything below it is included) and/or '[tag]' annotations of the headings, e.g. 'STEP 1/*/正常*' or '[smoke]'. Can be repeated (any query matches). An index of the headings is kept next to each test file (<file>.index) so that only the selected parts are read.")
+  p.add_argument("--template", type=str, default=None, metavar="XLSX", help="Write the table into a copy of this workbook, keeping its other sheets, defined names, styles and print settings. The table replaces the rows from the result title row of the sheet named by Sheet.Name (a new sheet is added if there is none). Data validations, conditional formats and the print area that cover the first body row are extended to the last row.")
+  p.add_argument("--format", choices=list(FORMATS), default=None, help="Output format (default: from the extension of -o/--out, xlsx otherwise). csv/tsv/jsonl/html do not load openpyxl.")
+  p.add_argument("--engine", choices=["openpyxl", "fast"], default=None, help="Writer backend (default: openpyxl, fast with --watch). 'fast' writes the XLSX directly without openpyxl (not available with --sheets).")
+  p.add_argument("--cache", type=str, default=None, help="Build cache directory. Unchanged tests are not parsed again and unchanged workbooks are not written again.")
+  p.add_argument("--force", action="store_true", help="Ignore the build cache and rebuild everything (the cache is updated). With --update, rewrite the workbook even if no test item changed.")
+  p.add_argument("--update", type=str, default=None, metavar="XLSX", help="Rebuild an existing workbook and carry over the values entered in its test result columns to the test items with the same heading path. The workbook is overwritten unless -o/--out is given.")
+  p.add_argument("--parallel-parse", type=int, nargs="?", const=PARALLEL_THRESHOLD, default=None, metavar="LINES", help=f"Parse a single large test file in worker processes, split at top-level headings, when it has at least LINES lines after include expansion (default: {PARALLEL_THRESHOLD}).")
+  p.add_argument("--watch", action="store_true", help="Stay resident and rebuild the output whenever the test file, its includes or the config is saved. Only the changed top-level sections are parsed again.")
+  p.add_argument("-v", "--verbose", action="count", default=0, help="Show progress (-v) or every row and column as it is written (-vv).")
+  p.add_argument("--profile", type=str, default=None, help="Write a JSON report with the wall/CPU time of each stage, the rows/columns/cells processed and the peak RSS.")
+  p.add_argument("--profile-dump", type=str, default=None, help="Write cProfile stats (pstats format) of the slowest stage.")
+  args = p.parse_args(argv)
+  if args.engine is None:
+    args.engine = "fast" if args.watch and not args.streaming and args.template is None and output_format(args.out or "", args.format) == "xlsx" else "openpyxl"
+  if args.update is not None:
+    if args.outdir is not None or args.sheets or args.cache is not None or args.engine != "openpyxl":
+      p.error("--update cannot be used with -d/--outdir, --sheets, --cache or --engine fast")
+    if args.out is None:
+      args.out = args.update
+    if (args.format or output_format(args.out)) != "xlsx" or output_format(args.update) != "xlsx":
+      p.error("--update can only be used with xlsx workbooks")
+  if (args.out is None) == (args.outdir is None):
+    p.error("either -o/--out or -d/--outdir is required")
+  if args.out is not None and not args.sheets and (len(args.tests) > 1 or glob.has_magic(args.tests[0])):
+    p.error("multiple test files require -d/--outdir or --sheets")
+  if args.sheets and args.out is None:
+    p.error("--sheets requires -o/--out")
+  if args.engine == "fast" and (args.sheets or args.streaming):
+    p.error("--engine fast cannot be used with --sheets or --streaming")
+  format = args.format or (output_format(args.out) if args.out is not None else "xlsx")
+  if format != "xlsx" and (args.sheets or args.streaming or args.engine != "openpyxl"):
+    p.error("--sheets, --streaming and --engine can only be used with xlsx output")
+  if args.parallel_parse is not None and (args.outdir is not None or args.sheets):
+    p.error("--parallel-parse can only be used for a single test file (-o without --sheets)")
+  if args.outdir is not None and (args.profile is not None or args.profile_dump is not None):
+    p.error("--profile and --profile-dump cannot be used with -d/--outdir")
+  if args.watch and (args.outdir is not None or args.sheets or args.update is not None or args.cache is not None or args.profile is not None or args.profile_dump is not None):
+    p.error("--watch can only be used for a single test file (-o without --sheets, --update, --cache or --profile)")
+  if args.low_memory and (args.outdir is not None or args.sheets or args.update is not None or args.cache is not None or args.watch or args.parallel_parse is not None or args.engine != "openpyxl" or format != "xlsx"):
+    p.error("--low-memory can only be used for a single xlsx file (-o without --sheets, --update, --cache, --watch, --parallel-parse or --engine fast)")
+  if args.template is not None and (args.sheets or args.streaming or args.low_memory or args.update is not None or args.engine != "openpyxl" or format != "xlsx"):
+    p.error("--template can only be used for xlsx output with the openpyxl engine (not with --sheets, --streaming, --low-memory or --update)")
+  if args.select is not None and (args.sheets or args.update is not None or args.cache is not None or args.watch or args.low_memory or args.parallel_parse is not None):
+    p.error("--select cannot be used with --sheets, --update, --cache, --watch, --low-memory or --parallel-parse")
+  # watch mode always reports each rebuild
+  logging.basicConfig(format="> %(message)s", level=[logging.WARNING, logging.INFO, logging.DEBUG][min(max(args.verbose, 1 if args.watch else 0), 2)])
+  logger.info("prepare")
+
+  if args.watch:
+    from .watch import Watcher
+    Watcher(args.config, args.tests[0], args.out, args.streaming, args.engine, format, args.template).run()
+    return 0
+
+  # the pipeline is loaded only once the arguments are valid
+  from .api import load_config
+  from .cache import BuildCache
+  from .pipeline import build_file_cached, build_multisheet, expand_inputs, run_batch
+  from .profiler import Profiler, profile_stage
+  profiler = Profiler(args.profile_dump is not None) if args.profile is not None or args.profile_dump is not None else None
+  cache = BuildCache(args.cache, args.force) if args.cache is not None else None
+  with profile_stage(profiler, "load_config"): config = load_config(args.config, cache)
+  select = None
+  if args.select is not None:
+    from .query import Selector
+    try:
+      select = Selector(args.select)
+    except ValueError as e:
+      p.error(str(e))
+  failed = 0
+  if args.outdir is not None:
+    results = run_batch(config, expand_inputs(args.tests), args.outdir, args.jobs, args.streaming, cache, args.engine, format, args.template, select)
+    for tests, out, error in results:
+      if error is None:
+        logger.info("ok %s -> %s", tests, out)
+      else:
+        logger.error("NG %s -> %s (%s)", tests, out, error)
+    failed = len([r for r in results if r[2] is not None])
+    logger.info("finished! (%d succeeded, %d failed)", len(results) - failed, failed)
+  elif args.sheets:
+    tests = expand_inputs(args.tests)
+    options = {"mode": "sheets", "streaming": args.streaming, "summary": args.summary, "tests": tests}
+    if cache is not None and cache.output_fresh(args.out, cache.output_key(config, tests, options)):
+      logger.info("up to date")
+    else:
+      wb = build_multisheet(config, tests, args.jobs, args.streaming, args.summary, cache, profiler)
+      path = Path(args.out)
+      if not path.parent.exists(): path.parent.mkdir(parents=True)
+      with profile_stage(profiler, "save"): wb.save(path)
+      if cache is not None:
+        cache.store_output(args.out, cache.output_key(config, tests, options))
+      logger.info("finished!")
+  elif args.low_memory:
+    from .stream import build_file_stream
+    count = build_file_stream(config, args.tests[0], args.out, profiler)
+    logger.info("finished! (%d items)", count)
+  elif args.update is not None:
+    from .update import update_file
+    written, stats = update_file(config, args.tests[0], args.update, args.out, args.streaming, profiler, args.force, args.parallel_parse)
+    logger.info("update: %d unchanged, %d changed, %d new, %d removed", stats["unchanged"], stats["changed"], stats["new"], stats["removed"])
+    logger.info("finished!" if written else "up to date")
+  else:
+    if not build_file_cached(config, args.tests[0], args.out, args.streaming, cache, profiler, args.engine, format, args.parallel_parse, args.template, select):
+      logger.info("up to date")
+    else:
+      logger.info("finished!")
+  if cache is not None:
+    cache.save()
+    logger.info("cache: %s", cache.report())
+  if profiler is not None:
+    if args.profile is not None:
+      with open(args.profile, mode="w", encoding="utf-8") as f: json.dump(profiler.report(), f, indent=1, ensure_ascii=False)
+    if args.profile_dump is not None and profiler.slowest() is not None:
+      profiler.dump(args.profile_dump)
+  return 1 if failed else 0
+
+def harvest(argv: list[str]) -> int:
+  """
+  harvestコマンド。結果を入力したワークブックから試験結果を集計する
+
+  Parameters
+  ----
+  argv: harvest以降のコマンドライン引数
+
+  Returns
+  ----
+  終了コード(読み込めなかったワークブックがあれば1)
+  """
+  p = ArgumentParser(prog="testsheetmaker harvest", description="Collect the results entered in workbooks made by testsheetmaker and count pass/fail/other/blank by heading and attempt.")
+  p.add_argument("workbooks", type=str, nargs="+", help="Workbooks to read. Directories (*.xlsx directly under them) and glob patterns can be given.")
+  p.add_argument("-o", "--out", type=str, required=True, help="Summary output (.json or .csv).")
+  p.add_argument("--format", choices=["json", "csv"], default=None, help="Summary format (default: from the extension of -o/--out, json otherwise).")
+  p.add_argument("--workbook", type=str, default=None, help="Also write the summary to this workbook.")
+  p.add_argument("-c", "--config", default="sample/config.yml", type=str, help="Config file the workbooks were made with. Headers.TestResult.Verdict selects the result label and the pass/fail values.")
+  p.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs).")
+  p.add_argument("--levels", type=int, default=None, help="Count only the first LEVELS heading levels (default: all).")
+  p.add_argument("-v", "--verbose", action="count", default=0, help="Show every workbook as it is read.")
+  args = p.parse_args(argv)
+  if args.levels is not None and args.levels < 0:
+    p.error("--levels must not be negative")
+  logging.basicConfig(format="> %(message)s", level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)])
+
+  from .api import load_config
+  from .harvest import create_harvest_workbook, harvest_files, write_harvest
+  from .pipeline import expand_inputs
+  config = load_config(args.config)
+  result = harvest_files(config, expand_inputs(args.workbooks, ".xlsx"), args.jobs, args.levels)
+  write_harvest(config, result, args.out, args.format)
+  if args.workbook is not None:
+    create_harvest_workbook(config, result, args.workbook)
+  failed = len([f for f in result.files if f[3] is not None])
+  logger.info("finished! (%d workbooks, %d items, %d failed)", len(result.files) - failed, result.items(), failed)
+  return 1 if failed else 0
+
+def serve(argv: list[str]) -> int:
+  """
+  serveコマンド。試験票を作成するローカルのHTTPサーバを起動する
+
+  Parameters
+  ----
+  argv: serve以降のコマンドライン引数
+
+  Returns
+  ----
+  終了コード
+  """
+  p = ArgumentParser(prog="testsheetmaker serve", description="Run a local HTTP server that renders test sheets. POST Markdown to /render?config=NAME[&format=xlsx|csv|tsv|jsonl|html][&engine=openpyxl|fast]; GET /stats for queue and latency metrics.")
+  p.add_argument("--configs", type=str, default="sample", help="Directory of config files. NAME in a request refers to <configs>/NAME.yml.")
+  p.add_argument("--base", type=str, default=".", help="Base directory of &include in requests. Files outside of it cannot be included.")
+  p.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+  p.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+  p.add_argument("--socket", type=str, default=None, help="Listen on this Unix domain socket instead of a TCP port.")
+  p.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs).")
+  p.add_argument("--queue", type=int, default=16, help="Requests that may wait for a worker; further requests get 503.")
+  p.add_argument("--cache-size", type=int, default=32, help="Compiled configs and include files each worker keeps (least recently used are dropped).")
+  p.add_argument("--template", type=str, default=None, metavar="XLSX", help="Write xlsx output of the openpyxl engine into this template workbook (see --template of the main command). Each worker loads it once.")
+  p.add_argument("-v", "--verbose", action="count", default=0, help="Log every request.")
+  args = p.parse_args(argv)
+  if args.queue < 0 or args.cache_size < 1:
+    p.error("--queue must not be negative and --cache-size must be positive")
+  logging.basicConfig(format="> %(message)s", level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)])
+
+  from .serve import RenderService, create_server
+  service = RenderService(args.configs, args.base, args.jobs, args.queue, args.cache_size, args.template)
+  server = create_server(service, args.host, args.port, args.socket)
+  logger.warning("serving on %s", args.socket or "http://%s:%d" % server.server_address[:2])
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    service.close()
+  return 0
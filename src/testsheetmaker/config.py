@@ -0,0 +1,252 @@
+"""
+設定データの検証とコンパイル
+
+YAMLから読み込んだ設定データを出力前にまとめて検証し、列ごとのHeader/Bodyの書式と置換文字列を
+Commonと合成した状態で保持する。
+"""
+from __future__ import annotations
+from typing import Any
+import re
+
+from .table import Table
+from .expression import Replacement
+
+# keyword arguments of openpyxl.styles.Font / Alignment that Font* / Align* properties map to
+FONT_PROPERTIES = ["name", "sz", "b", "i", "charset", "u", "strike", "color", "scheme", "family", "size", "bold", "italic", "strikethrough", "underline", "vertAlign", "outline", "shadow", "condense", "extend"]
+ALIGN_PROPERTIES = ["horizontal", "vertical", "textRotation", "wrapText", "shrinkToFit", "indent", "relativeIndent", "justifyLastLine", "readingOrder", "text_rotation", "wrap_text", "shrink_to_fit", "mergeCell"]
+# ColumnSet keys that are not column names
+COLUMNSET_SECTIONS = ["Common", "TestResultHeader", "HeaderRow"]
+# colors are RGB or aRGB hex values, as openpyxl accepts them
+RE_COLOR = re.compile(r"^([0-9A-Fa-f]{2})?[0-9A-Fa-f]{6}$")
+# characters openpyxl rejects in sheet titles, and the longest title Excel reads
+RE_INVALID_TITLE = re.compile(r"[\\*?:/\[\]]")
+MAX_TITLE = 31
+
+def _fail(path: str, message: str) -> None:
+  raise Exception(f"Invalid config: {path}: {message}")
+
+def _mapping(value: Any, path: str) -> dict[Any]:
+  if not isinstance(value, dict):
+    _fail(path, "must be a mapping")
+  return value
+
+def _strings(value: Any, path: str) -> list[str]:
+  if not isinstance(value, list) or value == [] or not all(isinstance(v, str) for v in value):
+    _fail(path, "must be a non-empty list of strings")
+  return value
+
+def _number(value: Any, path: str) -> None:
+  if isinstance(value, bool) or not isinstance(value, (int, float)):
+    _fail(path, "must be a number")
+
+def _color(value: Any, path: str) -> None:
+  if not isinstance(value, str) or not RE_COLOR.match(value):
+    _fail(path, f"must be a color string such as \"FFFFFF\" or \"FF002060\" (quote it in YAML), not {value!r}")
+
+def sheet_title_error(title: Any) -> str | None:
+  """
+  シート名として使えない場合にその理由を返す(openpyxlと同じ規則。使える場合はNone)
+  """
+  if not isinstance(title, str) or title == "":
+    return "must be a non-empty string"
+  if m := RE_INVALID_TITLE.search(title):
+    return f"invalid character {m[0]} in sheet title"
+  return None
+
+def _style_property(name: str) -> tuple[str, str] | None:
+  """
+  Font*・Align*のプロパティ名を(font または align, openpyxlの引数名)に変換する
+  """
+  if name.startswith("Font") and len(name) > 4 and name[4].lower() + name[5:] in FONT_PROPERTIES:
+    return ("font", name[4].lower() + name[5:])
+  if name.startswith("Align") and len(name) > 5 and name[5].lower() + name[6:] in ALIGN_PROPERTIES:
+    return ("align", name[5].lower() + name[6:])
+  return None
+
+def _check_style(conf: Any, path: str, extra: list[str]) -> None:
+  for n, v in _mapping(conf, path).items():
+    if n in extra:
+      if n == "Replace" and not isinstance(v, str): _fail(f"{path}.{n}", "must be a string")
+      if n in ["Width", "Height"]: _number(v, f"{path}.{n}")
+      if n == "Name" and (error := sheet_title_error(v)) is not None: _fail(f"{path}.{n}", error)
+      if n == "Caption" and isinstance(v, (dict, list)): _fail(f"{path}.{n}", "must be a string or a number")
+    elif n == "FontColor":
+      _color(v, f"{path}.{n}")
+    elif _style_property(str(n)) is None:
+      _fail(f"{path}.{n}", "unknown property (expected Font*, Align*" + "".join(f", {e}" for e in extra) + ")")
+
+def validate_config(config: Any) -> None:
+  """
+  設定データの構造を検証する。誤りがあれば項目の位置を示すメッセージの例外を送出する
+
+  Parameters
+  ----
+  config: YAMLから読み込んだ設定データ
+  """
+  _mapping(config, "<root>")
+  headers = _mapping(config.get("Headers"), "Headers")
+  _strings(headers.get("TestItemsLabel"), "Headers.TestItemsLabel")
+  for n in ["BackColor", "TextColor"]:
+    _color(headers.get(n), f"Headers.{n}")
+  if "Sections" in headers:
+    sections = _strings(headers["Sections"], "Headers.Sections")
+    if len(set(sections)) != len(sections):
+      _fail("Headers.Sections", "must not contain duplicates")
+  if "TestResult" in headers:
+    result = _mapping(headers["TestResult"], "Headers.TestResult")
+    if isinstance(result.get("PrintCount"), bool) or not isinstance(result.get("PrintCount"), int) or result["PrintCount"] < 0:
+      _fail("Headers.TestResult.PrintCount", "must be a non-negative integer")
+    if not isinstance(result.get("Title"), str):
+      _fail("Headers.TestResult.Title", "must be a string")
+    _strings(result.get("Labels"), "Headers.TestResult.Labels")
+    if "Verdict" in result:
+      verdict = _mapping(result["Verdict"], "Headers.TestResult.Verdict")
+      for n, v in verdict.items():
+        match n:
+          case "Label":
+            if not v in result["Labels"]: _fail(f"Headers.TestResult.Verdict.{n}", "must be one of Headers.TestResult.Labels")
+          case "Pass" | "Fail": _strings(v, f"Headers.TestResult.Verdict.{n}")
+          case _: _fail(f"Headers.TestResult.Verdict.{n}", "unknown property (expected Label, Pass, Fail)")
+  _check_style(config.get("Sheet"), "Sheet", ["Name", "Caption", "Height"])
+  if "Rearrange" in config:
+    for i, n in enumerate(_strings(config["Rearrange"], "Rearrange")):
+      if not n in Table.KINDS:
+        _fail(f"Rearrange[{i}]", f"unknown item name {n!r} (expected one of {', '.join(Table.KINDS)})")
+  if "Consts" in config:
+    _mapping(config["Consts"], "Consts")
+  if "ColumnSet" in config:
+    columnset = _mapping(config["ColumnSet"], "ColumnSet")
+    for name, conf in columnset.items():
+      path = f"ColumnSet.{name}"
+      if name == "TestResultHeader":
+        for n, v in _mapping(conf, path).items():
+          if n == "Height": _number(v, f"{path}.{n}")
+          elif not n in ["AlignHorizontal", "AlignVertical"]: _fail(f"{path}.{n}", "unknown property (expected AlignHorizontal, AlignVertical, Height)")
+      elif name == "HeaderRow":
+        for n, v in _mapping(conf, path).items():
+          if n == "Height": _number(v, f"{path}.{n}")
+          else: _fail(f"{path}.{n}", "unknown property (expected Height)")
+      else:
+        for n, v in _mapping(conf, path).items():
+          match n:
+            case "Header": _check_style(v, f"{path}.{n}", ["Replace", "Width"])
+            case "Body":
+              _check_style(v, f"{path}.{n}", ["Replace"])
+              if isinstance(v.get("Replace"), str) and v["Replace"].startswith("@"):
+                try:
+                  Replacement(v["Replace"])
+                except Exception as e:
+                  _fail(f"{path}.{n}.Replace", str(e))
+            case _: _fail(f"{path}.{n}", "unknown section (expected Header, Body)")
+
+def split_properties(conf: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+  """
+  Font*・Align*のプロパティを、openpyxlのFont・Alignmentの引数の辞書に分ける
+
+  Parameters
+  ----
+  conf: Header・Body・Sheetなどの設定
+
+  Returns
+  ----
+  (フォントの引数, 配置の引数)。それ以外のプロパティは含まない
+  """
+  font = {}
+  align = {}
+  for n, v in conf.items():
+    prop = _style_property(str(n))
+    if prop is not None:
+      (font if prop[0] == "font" else align)[prop[1]] = v
+  return (font, align)
+
+class ColumnStyle:
+  """
+  Commonと合成した一列分のColumnSetの設定
+  """
+  def __init__(self, conf: dict[str, Any], titleheader: dict[str, Any]) -> None:
+    """
+    Parameters
+    ----
+    conf: Commonと合成したHeader・Bodyの設定
+    titleheader: ColumnSetのTestResultHeaderの設定
+    """
+    self.header = "Header" in conf
+    self.body = "Body" in conf
+    self.headfont, self.headalign = split_properties(conf.get("Header", {}))
+    self.headvalue: str | None = conf.get("Header", {}).get("Replace")
+    self.width: float | None = conf.get("Header", {}).get("Width")
+    # the result title above the header takes the header alignment with the TestResultHeader overrides
+    self.titlealign = dict(self.headalign)
+    for n, v in titleheader.items():
+      match n:
+        case "AlignHorizontal": self.titlealign["horizontal"] = v
+        case "AlignVertical": self.titlealign["vertical"] = v
+    self.bodyfont, self.bodyalign = split_properties(conf.get("Body", {}))
+    self.bodyvalue: str | None = conf.get("Body", {}).get("Replace")
+    # compiled once per column and applied to every body cell
+    self.bodyreplace = Replacement(self.bodyvalue) if self.bodyvalue else None
+
+class ColumnSet:
+  """
+  列名ごとに書式を解決済みのColumnSet
+  """
+  def __init__(self, replace_table: dict[str, Any]) -> None:
+    """
+    Parameters
+    ----
+    replace_table: 設定データのColumnSet
+    """
+    common = replace_table.get("Common", {})
+    titleheader = replace_table.get("TestResultHeader", {})
+    self.titleheight: float | None = titleheader.get("Height")
+    self.headerheight: float | None = replace_table.get("HeaderRow", {}).get("Height")
+    self.common = ColumnStyle(common, titleheader)
+    self.columns: dict[str, ColumnStyle] = {}
+    for name, conf in replace_table.items():
+      if name in COLUMNSET_SECTIONS:
+        continue
+      merged = {n: {**common.get(n, {}), **conf.get(n, {})} for n in ["Header", "Body"] if n in common or n in conf}
+      self.columns[name] = ColumnStyle(merged, titleheader)
+
+  def get(self, name: str | None) -> ColumnStyle:
+    """
+    列名に対応する書式を返す(個別の設定がなければCommon)
+    """
+    return self.columns.get(name, self.common) if isinstance(name, str) else self.common
+
+class Config(dict):
+  """
+  検証済みの設定データ。元の設定データと同じ辞書として扱えるほか、出力に使う値を解決済みの状態で持つ。
+  作成後に元の設定データを変更しても反映されない
+  """
+  # bumped whenever the compiled form changes, so that cached configs are rebuilt
+  VERSION = 3
+
+  def __init__(self, config: dict[Any]) -> None:
+    """
+    Parameters
+    ----
+    config: YAMLから読み込んだ設定データ
+    """
+    validate_config(config)
+    super().__init__(config)
+    sheet = config["Sheet"]
+    self.sheetname: str | None = sheet.get("Name")
+    self.caption: str | None = sheet.get("Caption")
+    self.captionheight: float | None = sheet.get("Height")
+    self.captionfont, _ = split_properties(sheet)
+    self.columnset = ColumnSet(config["ColumnSet"]) if "ColumnSet" in config else None
+
+def compile_config(config: dict[Any]) -> Config:
+  """
+  設定データを検証し、コンパイルする(コンパイル済みであればそのまま返す)
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+
+  Returns
+  ----
+  コンパイル済みの設定データ
+  """
+  return config if isinstance(config, Config) else Config(config)
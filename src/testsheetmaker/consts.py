@@ -0,0 +1,98 @@
+"""
+設定データの定数(Consts)の展開
+"""
+from __future__ import annotations
+from typing import Any
+import re
+
+from .table import Table
+
+RE_CONST = re.compile(r"\{\{(.+?)\}\}")
+
+class ConstExpander:
+  """
+  定数(`{{名前}}`)の展開を行う。
+
+  定数の値に含まれる他の定数は生成時に一度だけ解決され(循環参照は例外となる)、展開は
+  `{{`を含む文字列に対してのみ、一つの正規表現で行われる。定義されていない定数の参照は
+  そのまま残され、undefinedに記録される。
+  """
+  def __init__(self, consts: dict[str, Any]) -> None:
+    self.consts = consts
+    self.values: dict[str, str] = {}
+    self.undefined: set[str] = set()
+    for n in consts:
+      self.resolve(n)
+
+  def resolve(self, name: str, stack: tuple[str]=()) -> str:
+    """
+    定数の値を、含まれる他の定数を展開したうえで返す
+
+    Parameters
+    ----
+    name: 定数名
+    stack: 解決中の定数名(循環参照の検出用)
+
+    Returns
+    ----
+    展開後の値
+    """
+    if name in self.values:
+      return self.values[name]
+    if name in stack:
+      raise Exception(f"Circular constant reference: {' -> '.join(stack[stack.index(name):] + (name,))}")
+    value = str(self.consts[name])
+    if "{{" in value:
+      value = RE_CONST.sub(lambda m: self.resolve(m[1], stack + (name,)) if m[1] in self.consts else self._undefined(m), value)
+    self.values[name] = value
+    return value
+
+  def expand(self, text: str) -> str:
+    """
+    文字列内の定数を展開する
+
+    Parameters
+    ----
+    text: 対象の文字列
+
+    Returns
+    ----
+    展開後の文字列
+    """
+    if not "{{" in text:
+      return text
+    return RE_CONST.sub(self._replace, text)
+
+  def _replace(self, m: re.Match) -> str:
+    value = self.values.get(m[1])
+    return value if value is not None else self._undefined(m)
+
+  def _undefined(self, m: re.Match) -> str:
+    self.undefined.add(m[1])
+    return m[0]
+
+def expandvars(text: str | list[list[str]] | Table, consts: dict[str,str] | ConstExpander):
+  """
+  テーブルないし文字列内の変数データを展開する
+
+  Parameters
+  ----
+  text: テーブル(Tableを含む)ないし文字列
+  consts: 定数を示す辞書データ、もしくはそれから作成したConstExpander
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ。
+  """
+  if not isinstance(consts, ConstExpander):
+    consts = ConstExpander(consts)
+  if isinstance(text, Table):
+    expandvars(text.header, consts)
+    expandvars(text.results, consts)
+    expandvars(text.rows, consts)
+  elif type(text) is list:
+    for i, item in enumerate(text):
+      text[i] = expandvars(item, consts)
+  else:
+    text = consts.expand(text)
+  return text
@@ -0,0 +1,442 @@
+"""
+openpyxlを使ったExcelワークブックの出力
+"""
+from __future__ import annotations
+from typing import Any, Iterable, TYPE_CHECKING
+from copy import copy
+import itertools
+import logging
+
+from .table import Table
+from .config import ColumnSet, compile_config
+from .expression import compile_replacement
+
+# openpyxl is imported by the functions that write XLSX, so other output formats start without it
+if TYPE_CHECKING:
+  import openpyxl
+  import openpyxl.styles as styles
+  from openpyxl.styles.cell_style import StyleArray
+  import openpyxl.worksheet.worksheet as worksheet
+  import openpyxl.cell.cell as cell
+
+START_ROW = 3
+DEFAULT_COLUMN_WIDTH = 13
+
+logger = logging.getLogger("testsheetmaker")
+
+class StyleRegistry:
+  """
+  ワークブック内のセル書式を、組み合わせごとに一度だけ名前付きスタイルとして登録するレジストリ。
+  同じ組み合わせの書式は同じ名前付きスタイルを共有し、セルへの適用はスタイルの参照を設定するだけで済む。
+  """
+  def __init__(self, wb: openpyxl.Workbook) -> None:
+    self.wb = wb
+    self.names: dict[tuple, str] = {}
+    self.arrays: dict[str, StyleArray] = {}
+    for ns in wb._named_styles:
+      self.names.setdefault((ns.font, ns.fill, ns.border, ns.alignment), ns.name)
+      self.arrays[ns.name] = ns.as_tuple()
+
+  def get(self, name: str, font: styles.Font | None=None, fill: styles.PatternFill | None=None, border: styles.Border | None=None, alignment: styles.Alignment | None=None) -> str:
+    """
+    書式の組み合わせに対応する名前付きスタイルを返す。未登録の組み合わせであれば登録する
+
+    Parameters
+    ----
+    name: 新たに登録する場合のスタイル名(重複する場合は連番が付く)
+    font: フォント(省略時は既定のフォント)
+    fill: 塗りつぶし(省略時はなし)
+    border: 罫線(省略時はなし)
+    alignment: 配置(省略時は既定の配置)
+
+    Returns
+    ----
+    名前付きスタイルの名前
+    """
+    import openpyxl.styles as styles
+    from openpyxl.styles.fonts import DEFAULT_FONT
+    font = font or DEFAULT_FONT
+    fill = fill or styles.PatternFill()
+    border = border or styles.Border()
+    alignment = alignment or styles.Alignment()
+    key = (font, fill, border, alignment)
+    if not key in self.names:
+      title = name
+      i = 1
+      while title in self.arrays:
+        i += 1
+        title = f"{name} {i}"
+      ns = styles.NamedStyle(title, font=font, fill=fill, border=border, alignment=alignment)
+      self.wb.add_named_style(ns)
+      self.names[key] = title
+      self.arrays[title] = ns.as_tuple()
+    return self.names[key]
+
+  def apply(self, cellobj: cell.Cell, name: str) -> None:
+    """
+    セルに名前付きスタイルを適用する(cellobj.style = nameと同じ結果になる)
+
+    Parameters
+    ----
+    cellobj: 対象のセル
+    name: getの戻り値
+    """
+    cellobj._style = copy(self.arrays[name])
+
+def create_excel(config:dict[Any], cells: list[list[str]], wb: openpyxl.Workbook | None=None, title: str | None=None, ws: worksheet.Worksheet | None=None) -> None:
+  """
+  Excelデータを出力する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  wb: シートを追加するExcelワークブック(省略時は新規作成し、最初のシートに出力する)
+  title: シート名(省略時は設定データのSheet.Name)
+  ws: 出力先のwbの既存のシート(省略時はwbにシートを追加する)
+
+  Returns
+  ----
+  Excelワークブック
+  """
+  import openpyxl
+  import openpyxl.styles as styles
+  config = compile_config(config)
+  if wb is None:
+    wb = openpyxl.Workbook()
+    ws = wb.worksheets[-1]
+  elif ws is None:
+    ws = wb.create_sheet()
+  header = cells[0]
+  noindex  = header.index("No")
+  # define styles
+  registry = StyleRegistry(wb)
+  headdesign = styles.PatternFill(patternType='solid', fgColor=config["Headers"]["BackColor"], bgColor=config["Headers"]["BackColor"])
+  headfont = styles.Font(color=config["Headers"]["TextColor"])
+  side = styles.Side(style="thin", color="000000")
+  border = styles.Border(side, side, side, side)
+  align = styles.Alignment(vertical="top", horizontal="left", wrapText=True)
+  headstyle = registry.get("Header", headfont, headdesign, border, align)
+  bodystyle = registry.get("Body", border=border, alignment=align)
+  borderstyle = registry.get("Border", border=border)
+  titlestyle = registry.get("Result Title", headfont, headdesign, alignment=styles.Alignment(horizontal="center"))
+  # insert caption
+  if config.caption is not None:
+    ws.cell(1, 1).value = config.caption
+  if config.captionheight is not None:
+    ws.row_dimensions[1].height = config.captionheight
+  if config.sheetname is not None:
+    ws.title = config.sheetname
+  if config.captionfont != {}:
+    ws.cell(1, 1).font = styles.Font(**config.captionfont)
+  if title is not None:
+    ws.title = title
+  # fill header
+  if "TestResult" in config["Headers"]:
+    lc = len(config["Headers"]["TestResult"]["Labels"])
+    for c in range(config["Headers"]["TestResult"]["PrintCount"]):
+      sc = header.index(config["Headers"]["TestResult"]["Labels"][0]) + c * lc + 1
+      ec = sc + lc - 1
+      cellobj = ws.cell(START_ROW - 1, sc)
+      cellobj.value = config["Headers"]["TestResult"]["Title"].format(c+1)
+      ws.merge_cells(f"{cellobj.column_letter}{START_ROW - 1}:{ws.cell(START_ROW - 1, ec).column_letter}{START_ROW - 1}")
+      registry.apply(cellobj, titlestyle)
+  # output cells
+  debug = logger.isEnabledFor(logging.DEBUG)
+  for r, line in enumerate(cells):
+    if debug: logger.debug("%s", line[noindex])
+    for c, cell in enumerate(line):
+      cellobj = ws.cell(r + START_ROW, c + 1)
+      # extension width
+      # values carried over by --update may be numbers or dates
+      text = cell if type(cell) is str or type(cell) is list else str(cell)
+      calcsize = (len(text if type(text) is str else max(text, key=len)) + 2) * 1.4
+      dimensions = ws.column_dimensions[cellobj.column_letter]
+      if not "\n" in text and dimensions.width < calcsize:
+          dimensions.width = calcsize
+      # set style (before the value, which sets the number format of dates)
+      registry.apply(cellobj, headstyle if r == 0 else bodystyle)
+      # set text
+      if type(cell) is list:
+        cell = "\n".join(cell)
+      cellobj.value = cell
+    if len(header) - len(line) > 0:
+      for c in range(len(header) - len(line)):
+        registry.apply(ws.cell(r + START_ROW, c + 1 + len(line)), borderstyle)
+  return wb
+
+def adjusttable(sheet: worksheet.Worksheet, replace_table: ColumnSet | dict[Any]) -> None:
+  """
+  テーブルの書式を調整する
+
+  Parameters
+  ----
+  sheet: 調整対象のワークシート
+  replace_table: 置換用テーブル(設定データのColumnSet、またはコンパイル済みのColumnSet)
+  """
+  import openpyxl.styles as styles
+  from openpyxl.cell.cell import TIME_FORMATS
+  columnset = replace_table if isinstance(replace_table, ColumnSet) else ColumnSet(replace_table)
+  logger.debug("Adjustment")
+  debug = logger.isEnabledFor(logging.DEBUG)
+  registry = StyleRegistry(sheet.parent)
+  for c, col in enumerate(sheet.columns):
+    headcell = col[START_ROW - 1]
+    if debug: logger.debug("%s", headcell.value)
+    conf = columnset.get(headcell.value)
+    if conf.header:
+      if conf.headvalue is not None:
+        headcell.value = conf.headvalue
+      if conf.width is not None:
+        sheet.column_dimensions[headcell.column_letter].width = conf.width
+      headfont = styles.Font(**conf.headfont)
+      registry.apply(headcell, registry.get("Header", headfont, copy(headcell.fill), copy(headcell.border), styles.Alignment(**conf.headalign)))
+      titlecell = col[START_ROW - 2]
+      if titlecell.value:
+        if columnset.titleheight is not None:
+          sheet.row_dimensions[START_ROW - 1].height = columnset.titleheight
+        registry.apply(titlecell, registry.get("Result Title", headfont, copy(titlecell.fill), copy(titlecell.border), styles.Alignment(**conf.titlealign)))
+    if conf.body and sheet.max_row > START_ROW:
+      font = styles.Font(**conf.bodyfont)
+      align= styles.Alignment(**conf.bodyalign)
+      # column default for cells added later by the tester
+      dimensions = sheet.column_dimensions[headcell.column_letter]
+      dimensions.font = font
+      dimensions.alignment = align
+      # body cells of a column share fill and border, so the whole column takes one style
+      first = sheet.cell(START_ROW + 1, c + 1)
+      bodystyle = registry.get("Body", font, copy(first.fill), copy(first.border), align)
+      body = [sheet.cell(r + 1, c + 1) for r in range(START_ROW, sheet.max_row)]
+      for cellobj in body:
+        registry.apply(cellobj, bodystyle)
+        # dates carried over by --update keep their date format
+        if cellobj.data_type == "d": cellobj.number_format = TIME_FORMATS[type(cellobj.value)]
+      if conf.bodyreplace is not None:
+        # the whole column is replaced in one call
+        for cellobj, nv in zip(body, conf.bodyreplace.column([cellobj.value for cellobj in body], START_ROW + 1, c + 1)):
+          cellobj.value = nv
+
+  if columnset.headerheight is not None: sheet.row_dimensions[START_ROW].height = columnset.headerheight
+
+def cell_width(cell: Any) -> float:
+  """
+  セルの値から列幅を求める(複数行の文字列は0)
+  """
+  text = cell if type(cell) is str or type(cell) is list else str(cell)
+  if "\n" in text:
+    return 0.0
+  return (len(text if type(text) is str else max(text, key=len)) + 2) * 1.4
+
+def sheet_layout(config: dict[Any], cells: list[list[str]], widths: list[float] | None=None) -> dict[str, Any]:
+  """
+  create_excel + adjusttableが作成する表のレイアウトを、セルを書き込む前にまとめて求める。
+  書式はフォント・配置の属性名と値の辞書で表す
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ(widthsを指定した場合はヘッダ行のみでよい)
+  widths: 列ごとの値から求めた列幅(省略時はcellsのすべての値から求める)
+
+  Returns
+  ----
+  以下のキーを持つ辞書
+  colcount: 列数
+  title: シート名(設定がなければNone)
+  caption: 1行目のキャプション(設定がなければNone)
+  captionfont: キャプションのフォント
+  heights: 行番号をキーとする行の高さ
+  titles: 試験結果列の見出し(開始列, 終了列, 値)のリスト(列は0始まり)
+  columns: 列ごとのheader(ヘッダの値)、headfont、headalign、titlealign、bodyfont(設定がなければNone)、
+           bodyalign、value(ボディの置換文字列)、replace(コンパイル済みのvalue)、dimension(列の既定の書式を設定するか)、width(列幅)の辞書のリスト
+  """
+  config = compile_config(config)
+  header = cells[0]
+  colcount = cells.width if isinstance(cells, Table) else len(max(cells, key=len))
+  columnset = config.columnset
+  layout = {"colcount": colcount, "title": config.sheetname, "caption": config.caption, "captionfont": dict(config.captionfont), "heights": {}, "titles": [], "columns": []}
+  if config.captionheight is not None:
+    layout["heights"][1] = config.captionheight
+  # column widths
+  if widths is None:
+    widths = [0.0] * colcount
+    for line in cells:
+      for c, cell in enumerate(line):
+        calcsize = cell_width(cell)
+        if widths[c] < calcsize:
+          widths[c] = calcsize
+  # column styles
+  for c in range(colcount):
+    name = header[c] if c < len(header) else None
+    column = {
+      "header": name, "headfont": {"color": config["Headers"]["TextColor"]}, "headalign": {"vertical": "top", "horizontal": "left", "wrapText": True},
+      "titlealign": {"horizontal": "center"}, "bodyfont": None, "bodyalign": {"vertical": "top", "horizontal": "left", "wrapText": True},
+      "value": None, "replace": None, "dimension": False, "width": max(widths[c], DEFAULT_COLUMN_WIDTH),
+    }
+    if columnset is not None:
+      conf = columnset.get(name)
+      if conf.header:
+        column["headfont"] = conf.headfont
+        column["headalign"] = conf.headalign
+        if conf.headvalue is not None: column["header"] = conf.headvalue
+        if conf.width is not None: column["width"] = conf.width
+        if columnset.titleheight is not None: layout["heights"][START_ROW - 1] = columnset.titleheight
+        column["titlealign"] = conf.titlealign
+      if conf.body:
+        column["bodyfont"] = conf.bodyfont
+        column["bodyalign"] = conf.bodyalign
+        column["value"] = conf.bodyvalue
+        column["replace"] = conf.bodyreplace
+        # column default for cells added later by the tester
+        column["dimension"] = True
+    layout["columns"].append(column)
+  if columnset is not None and columnset.headerheight is not None: layout["heights"][START_ROW] = columnset.headerheight
+  # test result titles
+  if "TestResult" in config["Headers"]:
+    lc = len(config["Headers"]["TestResult"]["Labels"])
+    for c in range(config["Headers"]["TestResult"]["PrintCount"]):
+      sc = header.index(config["Headers"]["TestResult"]["Labels"][0]) + c * lc
+      layout["titles"].append((sc, sc + lc - 1, config["Headers"]["TestResult"]["Title"].format(c+1)))
+  return layout
+
+def body_value(value: str | None, cell: str | None, row: int=0, col: int=0) -> Any:
+  """
+  ColumnSetのBody.Replaceをボディのセルの値に適用する
+
+  Parameters
+  ----
+  value: 置換文字列(%%は元の値に置き換えられ、@ではじまる場合は置換式として評価される)
+  cell: 元の値
+  row: セルの行番号
+  col: セルの列番号
+
+  Returns
+  ----
+  セルに書き込む値
+  """
+  if cell is None or not value:
+    return cell
+  return compile_replacement(value).apply(cell, row, col)
+
+def create_excel_streaming(config: dict[Any], cells: Iterable[list[str]], wb: openpyxl.Workbook | None=None, title: str | None=None, widths: list[float] | None=None) -> openpyxl.Workbook:
+  """
+  書き込み専用ワークシートを使ってExcelデータを出力する。
+  create_excel + adjusttableと同じ表を作成するが、書式・結合・列幅はすべて行の出力前に確定させ、
+  各行は一度だけ書き込まれる。
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ(widthsを指定した場合は、ヘッダ行から順に行を返すイテレータでもよい)
+  wb: シートを追加する書き込み専用のExcelワークブック(省略時は新規作成)
+  title: シート名(省略時は設定データのSheet.Name)
+  widths: 列ごとの値から求めた列幅(省略時はcellsのすべての値から求める。sheet_layoutを参照)
+
+  Returns
+  ----
+  Excelワークブック(書き込み専用のため保存できるのは一度のみ)
+  """
+  import openpyxl
+  import openpyxl.styles as styles
+  from openpyxl.cell import WriteOnlyCell
+  from openpyxl.utils import get_column_letter
+  config = compile_config(config)
+  if wb is None:
+    wb = openpyxl.Workbook(write_only=True)
+  ws = wb.create_sheet()
+  rows = iter(cells)
+  header = next(rows)
+  layout = sheet_layout(config, cells if widths is None else [header], widths)
+  colcount = layout["colcount"]
+  noindex  = header.index("No")
+  if layout["title"] is not None:
+    ws.title = layout["title"]
+  if title is not None:
+    ws.title = title
+  for r, height in layout["heights"].items():
+    ws.row_dimensions[r].height = height
+  # define styles
+  registry = StyleRegistry(wb)
+  headdesign = styles.PatternFill(patternType='solid', fgColor=config["Headers"]["BackColor"], bgColor=config["Headers"]["BackColor"])
+  side = styles.Side(style="thin", color="000000")
+  border = styles.Border(side, side, side, side)
+  headstyles = []
+  bodystyles = []
+  titlestyles = []
+  for c, column in enumerate(layout["columns"]):
+    headfont = styles.Font(**column["headfont"])
+    bodyfont = styles.Font(**column["bodyfont"]) if column["bodyfont"] is not None else None
+    bodyalign = styles.Alignment(**column["bodyalign"])
+    titlestyles.append(registry.get("Result Title", headfont, headdesign, alignment=styles.Alignment(**column["titlealign"])))
+    headstyles.append(registry.get("Header", headfont, headdesign, border, styles.Alignment(**column["headalign"])))
+    bodystyles.append(registry.get("Body", bodyfont, border=border, alignment=bodyalign))
+    dimensions = ws.column_dimensions[get_column_letter(c + 1)]
+    dimensions.width = column["width"]
+    if column["dimension"]:
+      dimensions.font = bodyfont
+      dimensions.alignment = bodyalign
+
+  # row 1: caption
+  if layout["caption"] is not None:
+    cellobj = WriteOnlyCell(ws, layout["caption"])
+    if layout["captionfont"] != {}:
+      cellobj.font = styles.Font(**layout["captionfont"])
+    ws.append([cellobj])
+  else:
+    ws.append([])
+  # row 2: test result titles
+  titlerow = [None] * colcount if layout["titles"] else []
+  for sc, ec, value in layout["titles"]:
+    cellobj = WriteOnlyCell(ws, value)
+    registry.apply(cellobj, titlestyles[sc])
+    titlerow[sc] = cellobj
+    ws.merged_cells.add(f"{get_column_letter(sc + 1)}{START_ROW - 1}:{get_column_letter(ec + 1)}{START_ROW - 1}")
+  ws.append(titlerow)
+  # row 3 and after: table
+  debug = logger.isEnabledFor(logging.DEBUG)
+  for r, line in enumerate(itertools.chain([header], rows)):
+    if debug: logger.debug("%s", line[noindex])
+    row = []
+    for c in range(colcount):
+      cell = line[c] if c < len(line) else None
+      if type(cell) is list:
+        cell = "\n".join(cell)
+      if r == 0:
+        cellobj = WriteOnlyCell(ws, layout["columns"][c]["header"])
+        registry.apply(cellobj, headstyles[c])
+      else:
+        replace = layout["columns"][c]["replace"]
+        cellobj = WriteOnlyCell(ws)
+        registry.apply(cellobj, bodystyles[c])
+        cellobj.value = replace.apply(cell, r + START_ROW, c + 1) if replace is not None else cell
+      row.append(cellobj)
+    ws.append(row)
+  return wb
+
+def create_summary(config: dict[Any], wb: openpyxl.Workbook, entries: list[tuple[str, str, int]]) -> None:
+  """
+  試験票ごとの試験項目数を示すサマリシートを追加する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  wb: シートを追加するExcelワークブック(書き込み専用でもよい)
+  entries: (試験票のパス, シート名, 試験項目数)のリスト
+  """
+  import openpyxl.styles as styles
+  from openpyxl.cell import WriteOnlyCell
+  ws = wb.create_sheet("Summary")
+  headdesign = styles.PatternFill(patternType='solid', fgColor=config["Headers"]["BackColor"], bgColor=config["Headers"]["BackColor"])
+  headfont = styles.Font(color=config["Headers"]["TextColor"])
+  ws.column_dimensions["A"].width = max([len(e[0]) for e in entries] + [10]) * 1.2
+  ws.column_dimensions["B"].width = max([len(e[1]) for e in entries] + [10]) * 1.4
+  header = []
+  for v in ["File", "Sheet", "Items"]:
+    cellobj = WriteOnlyCell(ws, v)
+    cellobj.fill = headdesign
+    cellobj.font = headfont
+    header.append(cellobj)
+  ws.append(header)
+  for tests, title, count in entries:
+    ws.append([tests, title, count])
+  ws.append(["Total", None, sum(e[2] for e in entries)])
@@ -0,0 +1,346 @@
+"""
+ColumnSetのBody.Replaceで使う置換式
+
+「@」ではじまる置換文字列を、Pythonのeval()を使わずに評価する小さな式言語。
+式は列ごとに一度だけ構文解析し、関数の組み合わせにコンパイルしてから行ごとに評価する。
+
+  @%%.upper()                      セルの値を大文字にする
+  @"No." + str(row - 3)            行番号から値を作る
+  @%% * 2                          数値のセルの値で計算する
+
+使用できるもの
+  値: 数値・文字列の定数、%%(セルの値。数値の形の値はint・floatになる)、value(セルの値の文字列)、
+      row(行番号)、col(列番号)
+  演算: + - * / // % ** 、比較(== != < <= > >= in not in)、and or not、x if 条件 else y、添字とスライス
+  関数: len str int float round abs min max
+  文字列のメソッド: STRING_METHODSを参照
+"""
+from __future__ import annotations
+from typing import Any, Callable, Iterable
+import ast
+import functools
+import math
+import operator
+import re
+
+# methods of str that an expression may call
+STRING_METHODS = ["upper", "lower", "strip", "lstrip", "rstrip", "title", "capitalize", "replace", "zfill", "ljust", "rjust", "center",
+  "startswith", "endswith", "count", "find", "isdigit", "isnumeric"]
+# the longest text an Excel cell can hold; also bounds the size of intermediate strings
+MAX_STRING = 32767
+VARIABLES = ["value", "row", "col"]
+# name that %% outside string literals is compiled to
+CELL = "__cell__"
+RE_INT = re.compile(r"[+-]?\d+")
+RE_FLOAT = re.compile(r"[+-]?(\d+\.\d*|\.\d+|\d+(?=[eE]))([eE][+-]?\d+)?")
+
+# compiled node: (cell value, row, column) -> result
+Node = Callable[[Any, int, int], Any]
+
+def _check_size(n: Any) -> Any:
+  if isinstance(n, int) and not isinstance(n, bool) and abs(n) > MAX_STRING:
+    raise Exception(f"argument {n} is too large (limit {MAX_STRING})")
+  return n
+
+def _mul(a: Any, b: Any) -> Any:
+  if isinstance(a, str) or isinstance(b, str):
+    count, text = (b, a) if isinstance(a, str) else (a, b)
+    if isinstance(count, int) and len(text) * max(count, 0) > MAX_STRING:
+      raise Exception(f"string is too long (limit {MAX_STRING})")
+  return a * b
+
+def _pow(a: Any, b: Any) -> Any:
+  if isinstance(a, (int, float)) and isinstance(b, (int, float)) and abs(a) > 1 and b * math.log10(abs(a)) > 1000:
+    raise Exception("result is too large")
+  return a ** b
+
+def _add(a: Any, b: Any) -> Any:
+  n = a + b
+  if isinstance(n, str) and len(n) > MAX_STRING:
+    raise Exception(f"string is too long (limit {MAX_STRING})")
+  return n
+
+def _method(obj: Any, name: str, args: list[Any]) -> Any:
+  if not isinstance(obj, str):
+    raise Exception(f"{name}() can only be called on a string, not {type(obj).__name__}")
+  if name in ["zfill", "ljust", "rjust", "center"]:
+    for n in args: _check_size(n)
+  if name == "replace" and len(args) >= 2 and isinstance(args[0], str) and isinstance(args[1], str):
+    if len(obj) + obj.count(args[0]) * (len(args[1]) - len(args[0])) > MAX_STRING:
+      raise Exception(f"string is too long (limit {MAX_STRING})")
+  return getattr(obj, name)(*args)
+
+BINARY_OPERATORS = {
+  ast.Add: _add, ast.Sub: operator.sub, ast.Mult: _mul, ast.Div: operator.truediv,
+  ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: _pow,
+}
+COMPARE_OPERATORS = {
+  ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+  ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+}
+FUNCTIONS = {"len": len, "str": str, "int": int, "float": float, "round": round, "abs": abs, "min": min, "max": max}
+
+def _literal(value: Any) -> Any:
+  """
+  %%の値。数値の形の文字列は、以前の(%%を式に埋め込んでいた)置換と同じく数値として扱う
+  """
+  if isinstance(value, str):
+    text = value.strip()
+    if RE_INT.fullmatch(text):
+      return int(text)
+    if RE_FLOAT.fullmatch(text):
+      return float(text)
+  return value
+
+def _source(text: str) -> str:
+  """
+  文字列リテラルの外にある%%をCELLに置き換える
+  """
+  result = []
+  quote = None
+  i = 0
+  while i < len(text):
+    ch = text[i]
+    if quote is not None:
+      result.append(ch)
+      if ch == "\\" and i + 1 < len(text):
+        result.append(text[i + 1])
+        i += 1
+      elif ch == quote:
+        quote = None
+    elif ch in "\"'":
+      quote = ch
+      result.append(ch)
+    elif text.startswith("%%", i):
+      result.append(f" {CELL} ")
+      i += 1
+    else:
+      result.append(ch)
+    i += 1
+  return "".join(result)
+
+class Expression:
+  """
+  コンパイル済みの置換式
+  """
+  def __init__(self, source: str) -> None:
+    """
+    Parameters
+    ----
+    source: 式(先頭の@は除く)。構文に誤りがあるか、使用できない要素を含む場合は例外を送出する
+    """
+    self.source = source
+    self.uses: set[str] = set()
+    try:
+      tree = ast.parse(_source(source).strip(), mode="eval")
+    except SyntaxError as e:
+      raise Exception(f"invalid expression {source!r}: {e.msg}") from None
+    self.node = self._compile(tree.body)
+
+  def __getstate__(self) -> dict[str, Any]:
+    # compiled nodes are closures, so only the source is pickled
+    return {"source": self.source}
+
+  def __setstate__(self, state: dict[str, Any]) -> None:
+    self.__init__(state["source"])
+
+  def _fail(self, message: str) -> None:
+    raise Exception(f"invalid expression {self.source!r}: {message}")
+
+  def _compile(self, node: ast.AST) -> Node:
+    match node:
+      case ast.Constant(value=v) if isinstance(v, str) and "%%" in v:
+        # %% inside a string literal is replaced by the cell value, as in a plain Replace
+        self.uses.add("value")
+        return lambda value, row, col: v.replace("%%", "" if value is None else str(value))
+      case ast.Constant(value=v) if v is None or isinstance(v, (str, int, float, bool)):
+        return lambda value, row, col: v
+      case ast.Name(id="value"):
+        self.uses.add("value")
+        return lambda value, row, col: value
+      case ast.Name(id=name) if name == CELL:
+        self.uses.add("value")
+        return lambda value, row, col: _literal(value)
+      case ast.Name(id="row"):
+        self.uses.add("row")
+        return lambda value, row, col: row
+      case ast.Name(id="col"):
+        self.uses.add("col")
+        return lambda value, row, col: col
+      case ast.Name(id=name):
+        self._fail(f"unknown name {name!r} (expected {', '.join(VARIABLES)} or %%)")
+      case ast.BinOp(left=left, op=op, right=right) if type(op) in BINARY_OPERATORS:
+        f, a, b = BINARY_OPERATORS[type(op)], self._compile(left), self._compile(right)
+        return lambda value, row, col: f(a(value, row, col), b(value, row, col))
+      case ast.UnaryOp(op=ast.USub(), operand=operand):
+        a = self._compile(operand)
+        return lambda value, row, col: -a(value, row, col)
+      case ast.UnaryOp(op=ast.UAdd(), operand=operand):
+        a = self._compile(operand)
+        return lambda value, row, col: +a(value, row, col)
+      case ast.UnaryOp(op=ast.Not(), operand=operand):
+        a = self._compile(operand)
+        return lambda value, row, col: not a(value, row, col)
+      case ast.BoolOp(op=ast.And(), values=values):
+        nodes = [self._compile(n) for n in values]
+        def both(value, row, col):
+          for n in nodes:
+            result = n(value, row, col)
+            if not result: return result
+          return result
+        return both
+      case ast.BoolOp(op=ast.Or(), values=values):
+        nodes = [self._compile(n) for n in values]
+        def either(value, row, col):
+          for n in nodes:
+            result = n(value, row, col)
+            if result: return result
+          return result
+        return either
+      case ast.Compare(left=left, ops=ops, comparators=comparators) if all(type(op) in COMPARE_OPERATORS for op in ops):
+        first = self._compile(left)
+        rest = [(COMPARE_OPERATORS[type(op)], self._compile(n)) for op, n in zip(ops, comparators)]
+        def compare(value, row, col):
+          a = first(value, row, col)
+          for f, n in rest:
+            b = n(value, row, col)
+            if not f(a, b): return False
+            a = b
+          return True
+        return compare
+      case ast.IfExp(test=test, body=body, orelse=orelse):
+        t, a, b = self._compile(test), self._compile(body), self._compile(orelse)
+        return lambda value, row, col: a(value, row, col) if t(value, row, col) else b(value, row, col)
+      case ast.Subscript(value=target, slice=ast.Slice(lower=lower, upper=upper, step=None)):
+        t = self._compile(target)
+        lo = self._compile(lower) if lower is not None else (lambda value, row, col: None)
+        hi = self._compile(upper) if upper is not None else (lambda value, row, col: None)
+        return lambda value, row, col: t(value, row, col)[lo(value, row, col):hi(value, row, col)]
+      case ast.Subscript(value=target, slice=index) if not isinstance(index, ast.Slice):
+        t, i = self._compile(target), self._compile(index)
+        return lambda value, row, col: t(value, row, col)[i(value, row, col)]
+      case ast.Call(func=ast.Name(id=name), args=args, keywords=[]) if name in FUNCTIONS and not any(isinstance(n, ast.Starred) for n in args):
+        f, nodes = FUNCTIONS[name], [self._compile(n) for n in args]
+        return lambda value, row, col: f(*[n(value, row, col) for n in nodes])
+      case ast.Call(func=ast.Attribute(value=target, attr=name), args=args, keywords=[]) if name in STRING_METHODS and not any(isinstance(n, ast.Starred) for n in args):
+        t, nodes = self._compile(target), [self._compile(n) for n in args]
+        return lambda value, row, col: _method(t(value, row, col), name, [n(value, row, col) for n in nodes])
+      case ast.Call(func=ast.Name(id=name)) | ast.Call(func=ast.Attribute(attr=name)):
+        self._fail(f"{name}() is not available")
+      case _:
+        self._fail(f"{type(node).__name__} is not supported")
+
+  def evaluate(self, value: Any, row: int=0, col: int=0) -> Any:
+    """
+    一つのセルについて式を評価する
+
+    Parameters
+    ----
+    value: セルの値
+    row: 行番号
+    col: 列番号
+
+    Returns
+    ----
+    評価結果
+    """
+    try:
+      return self.node(value, row, col)
+    except Exception as e:
+      raise Exception(f"expression {self.source!r} failed at row {row}: {e}") from None
+
+  def column(self, values: Iterable[Any], firstrow: int=0, col: int=0) -> list[Any]:
+    """
+    列全体について式を評価する。セルの値も行番号も列番号も使わない式は一度だけ評価する
+
+    Parameters
+    ----
+    values: 列のセルの値
+    firstrow: 最初のセルの行番号
+    col: 列番号
+
+    Returns
+    ----
+    評価結果のリスト
+    """
+    values = list(values)
+    if not self.uses:
+      return [self.evaluate(None, firstrow, col)] * len(values)
+    node = self.node
+    try:
+      return [node(v, firstrow + i, col) for i, v in enumerate(values)]
+    except Exception:
+      # evaluate row by row again to report the failing row
+      return [self.evaluate(v, firstrow + i, col) for i, v in enumerate(values)]
+
+class Replacement:
+  """
+  コンパイル済みのBody.Replace。@ではじまる場合は式、それ以外は%%をセルの値に置き換える文字列
+  """
+  def __init__(self, rule: str) -> None:
+    """
+    Parameters
+    ----
+    rule: 置換文字列
+    """
+    self.rule = rule
+    self.expression = Expression(rule[1:]) if rule.startswith("@") else None
+
+  def apply(self, value: Any, row: int=0, col: int=0) -> Any:
+    """
+    一つのセルの値を置き換える(値のないセルはそのまま)
+
+    Parameters
+    ----
+    value: セルの値
+    row: 行番号
+    col: 列番号
+
+    Returns
+    ----
+    セルに書き込む値
+    """
+    if value is None:
+      return None
+    if self.expression is not None:
+      return self.expression.evaluate(value, row, col)
+    return self.rule.replace("%%", value)
+
+  def column(self, values: Iterable[Any], firstrow: int=0, col: int=0) -> list[Any]:
+    """
+    列全体のセルの値をまとめて置き換える(値のないセルはそのまま)
+
+    Parameters
+    ----
+    values: 列のセルの値
+    firstrow: 最初のセルの行番号
+    col: 列番号
+
+    Returns
+    ----
+    セルに書き込む値のリスト
+    """
+    values = list(values)
+    if self.expression is not None and None in values:
+      return [self.apply(v, firstrow + i, col) for i, v in enumerate(values)]
+    if self.expression is None:
+      rule = self.rule
+      if not "%%" in rule:
+        return [None if v is None else rule for v in values]
+      return [None if v is None else rule.replace("%%", v) for v in values]
+    return self.expression.column(values, firstrow, col)
+
+@functools.lru_cache(maxsize=256)
+def compile_replacement(rule: str) -> Replacement:
+  """
+  置換文字列をコンパイルする(同じ置換文字列は一度だけコンパイルする)
+
+  Parameters
+  ----
+  rule: 置換文字列
+
+  Returns
+  ----
+  コンパイル済みの置換
+  """
+  return Replacement(rule)
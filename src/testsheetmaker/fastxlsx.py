@@ -0,0 +1,302 @@
+"""
+openpyxlを使わないExcelファイルの出力(--engine fast)
+"""
+from __future__ import annotations
+from typing import Any, IO
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+import logging
+import re
+import zipfile
+
+from .excel import START_ROW, sheet_layout
+from .config import MAX_TITLE, sheet_title_error
+
+logger = logging.getLogger("testsheetmaker")
+
+RE_ILLEGAL_XML = re.compile(r"[\000-\010\013\014\016-\037]")
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKGREL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+def column_letter(index: int) -> str:
+  """
+  列番号(1始まり)をExcelの列名(A, B, ..., Z, AA, ...)にする
+  """
+  letters = ""
+  while index > 0:
+    index, rest = divmod(index - 1, 26)
+    letters = chr(65 + rest) + letters
+  return letters
+
+class FastStyles:
+  """
+  create_excel_fastが使うスタイルシート。フォント・塗りつぶし・罫線・配置の組み合わせごとに
+  一度だけセル書式(xf)を登録し、その番号をセルから参照する
+  """
+  FONT_TAGS = {
+    "name": "name", "size": "sz", "sz": "sz", "bold": "b", "b": "b", "italic": "i", "i": "i",
+    "strike": "strike", "strikethrough": "strike", "underline": "u", "u": "u", "color": "color",
+    "vertAlign": "vertAlign", "family": "family", "charset": "charset", "scheme": "scheme",
+    "outline": "outline", "shadow": "shadow", "condense": "condense", "extend": "extend",
+  }
+  ALIGN_ATTRS = {
+    "horizontal": "horizontal", "vertical": "vertical", "wrapText": "wrapText", "wrap_text": "wrapText",
+    "shrinkToFit": "shrinkToFit", "shrink_to_fit": "shrinkToFit", "indent": "indent",
+    "textRotation": "textRotation", "text_rotation": "textRotation", "relativeIndent": "relativeIndent",
+    "justifyLastLine": "justifyLastLine", "readingOrder": "readingOrder",
+  }
+  # same as openpyxl's DEFAULT_FONT, so unstyled cells look the same with both engines
+  DEFAULT_FONT = '<font><name val="Calibri"/><family val="2"/><color theme="1"/><sz val="11"/><scheme val="minor"/></font>'
+
+  def __init__(self) -> None:
+    self.fonts = {self.DEFAULT_FONT: 0}
+    self.fills = {'<fill><patternFill/></fill>': 0, '<fill><patternFill patternType="gray125"/></fill>': 1}
+    self.borders = {'<border/>': 0}
+    self.xfs = {'<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>': 0}
+
+  @staticmethod
+  def color(value: str) -> str:
+    """
+    色の指定(RRGGBBまたはAARRGGBB)をARGB形式にする
+    """
+    return f"00{value}" if len(value) == 6 else value
+
+  @staticmethod
+  def attr(value: Any) -> str:
+    """
+    属性値を文字列にする
+    """
+    if type(value) is bool:
+      return "1" if value else "0"
+    return quoteattr(str(value))[1:-1]
+
+  def font(self, font: dict[str, Any] | None) -> int:
+    """
+    フォントを登録して番号を返す(Noneなら既定のフォント)
+
+    Parameters
+    ----
+    font: フォントの属性名と値の辞書(openpyxl.styles.Fontの引数と同じ)
+    """
+    if font is None:
+      return 0
+    xml = []
+    for n, v in font.items():
+      if not n in self.FONT_TAGS:
+        raise Exception(f"Unknown font property: {n}")
+      if v is None: continue
+      tag = self.FONT_TAGS[n]
+      if tag == "color":
+        xml.append(f'<color rgb="{self.attr(self.color(v))}"/>')
+      else:
+        xml.append(f'<{tag} val="{self.attr(v)}"/>')
+    return self.fonts.setdefault(f"<font>{''.join(xml)}</font>", len(self.fonts))
+
+  def fill(self, color: str | None) -> int:
+    """
+    単色の塗りつぶしを登録して番号を返す(Noneなら塗りつぶしなし)
+    """
+    if color is None:
+      return 0
+    rgb = self.attr(self.color(color))
+    return self.fills.setdefault(f'<fill><patternFill patternType="solid"><fgColor rgb="{rgb}"/><bgColor rgb="{rgb}"/></patternFill></fill>', len(self.fills))
+
+  def border(self, thin: bool) -> int:
+    """
+    黒の細線で囲む罫線を登録して番号を返す(Falseなら罫線なし)
+    """
+    if not thin:
+      return 0
+    side = '<color rgb="00000000"/>'
+    return self.borders.setdefault("<border>" + "".join(f'<{n} style="thin">{side}</{n}>' for n in ["left", "right", "top", "bottom"]) + "</border>", len(self.borders))
+
+  def xf(self, font: dict[str, Any] | None=None, fill: str | None=None, border: bool=False, alignment: dict[str, Any] | None=None) -> int:
+    """
+    セル書式を登録して番号を返す
+
+    Parameters
+    ----
+    font: フォントの属性名と値の辞書(省略時は既定のフォント)
+    fill: 塗りつぶしの色(省略時は塗りつぶしなし)
+    border: 細線の罫線で囲むかどうか
+    alignment: 配置の属性名と値の辞書(省略時は既定の配置)
+
+    Returns
+    ----
+    セル書式の番号(セルのs属性に指定する)
+    """
+    attrs = f'numFmtId="0" fontId="{self.font(font)}" fillId="{self.fill(fill)}" borderId="{self.border(border)}" xfId="0"'
+    align = []
+    for n, v in (alignment or {}).items():
+      if not n in self.ALIGN_ATTRS:
+        raise Exception(f"Unknown alignment property: {n}")
+      if v is None: continue
+      align.append(f'{self.ALIGN_ATTRS[n]}="{self.attr(v)}"')
+    xml = f'<xf {attrs} applyAlignment="1"><alignment {" ".join(align)}/></xf>' if align else f"<xf {attrs}/>"
+    return self.xfs.setdefault(xml, len(self.xfs))
+
+  def xml(self) -> str:
+    """
+    スタイルシート(xl/styles.xml)の内容を返す
+    """
+    return (
+      f'{XML_HEADER}<styleSheet xmlns="{NS_MAIN}">'
+      f'<fonts count="{len(self.fonts)}">{"".join(self.fonts)}</fonts>'
+      f'<fills count="{len(self.fills)}">{"".join(self.fills)}</fills>'
+      f'<borders count="{len(self.borders)}">{"".join(self.borders)}</borders>'
+      '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+      f'<cellXfs count="{len(self.xfs)}">{"".join(self.xfs)}</cellXfs>'
+      '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+      '</styleSheet>'
+    )
+
+def create_excel_fast(config: dict[Any], cells: list[list[str]], out: str | Path | IO[bytes], title: str | None=None) -> None:
+  """
+  openpyxlを使わずにExcelファイルを直接出力する。
+  create_excel + adjusttableと同じ表を、共有文字列テーブルと設定データから作った最小限のスタイルシートで書き出す。
+  シートのXMLは行ごとに圧縮しながらファイルに書き込む
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  out: 出力するExcelファイルのパス、またはバイナリモードのファイルオブジェクト
+  title: シート名(省略時は設定データのSheet.Name)
+  """
+  layout = sheet_layout(config, cells)
+  colcount = layout["colcount"]
+  noindex  = cells[0].index("No")
+  letters = [column_letter(c + 1) for c in range(colcount)]
+  replaces = [column["replace"] for column in layout["columns"]]
+  title = title or layout["title"] or "Sheet"
+  # the same checks as openpyxl, which raises on invalid titles and warns on long ones
+  if (error := sheet_title_error(title)) is not None:
+    raise ValueError(f"{title!r}: {error}")
+  if len(title) > MAX_TITLE:
+    logger.warning("sheet title %r is more than %d characters; some applications may not be able to read the file", title, MAX_TITLE)
+  # define styles
+  registry = FastStyles()
+  backcolor = config["Headers"]["BackColor"]
+  captionstyle = registry.xf(layout["captionfont"] or None)
+  titlestyles = []
+  headstyles = []
+  bodystyles = []
+  colstyles = []
+  for column in layout["columns"]:
+    titlestyles.append(registry.xf(column["headfont"], backcolor, alignment=column["titlealign"]))
+    headstyles.append(registry.xf(column["headfont"], backcolor, True, column["headalign"]))
+    bodystyles.append(registry.xf(column["bodyfont"], border=True, alignment=column["bodyalign"]))
+    colstyles.append(registry.xf(column["bodyfont"], alignment=column["bodyalign"]) if column["dimension"] else None)
+  strings: dict[str, int] = {}
+  refs = 0
+
+  def text(value: str, ref: str) -> str:
+    if RE_ILLEGAL_XML.search(value):
+      raise Exception(f"{ref}: illegal character in cell value")
+    return escape(value)
+
+  def cellxml(ref: str, style: int, value: Any) -> str:
+    nonlocal refs
+    # openpyxl leaves empty strings blank, so they are written as cells without a value
+    if value is None or value == "":
+      return f'<c r="{ref}" s="{style}"/>'
+    if type(value) is bool:
+      return f'<c r="{ref}" s="{style}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+      return f'<c r="{ref}" s="{style}"><v>{value!r}</v></c>'
+    value = str(value)
+    if value.startswith("=") and len(value) > 1:
+      return f'<c r="{ref}" s="{style}"><f>{text(value[1:], ref)}</f><v></v></c>'
+    refs += 1
+    index = strings.get(value)
+    if index is None:
+      index = strings[value] = len(strings)
+    return f'<c r="{ref}" s="{style}" t="s"><v>{index}</v></c>'
+
+  def rowxml(r: int, content: list[str]) -> str:
+    height = layout["heights"].get(r)
+    attrs = f' ht="{height}" customHeight="1"' if height is not None else ""
+    return f'<row r="{r}"{attrs}>{"".join(content)}</row>'
+
+  if isinstance(out, (str, Path)):
+    out = Path(out)
+    if not out.parent.exists(): out.parent.mkdir(parents=True)
+  with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+    with zf.open("xl/worksheets/sheet1.xml", "w") as f:
+      head = [f'{XML_HEADER}<worksheet xmlns="{NS_MAIN}" xmlns:r="{NS_REL}">']
+      head.append(f'<dimension ref="A1:{letters[-1]}{len(cells) + START_ROW - 1}"/>')
+      head.append('<sheetViews><sheetView workbookViewId="0"/></sheetViews><sheetFormatPr baseColWidth="8" defaultRowHeight="15"/><cols>')
+      for c, column in enumerate(layout["columns"]):
+        style = f' style="{colstyles[c]}"' if colstyles[c] is not None else ""
+        head.append(f'<col min="{c + 1}" max="{c + 1}" width="{column["width"]}" customWidth="1"{style}/>')
+      head.append("</cols><sheetData>")
+      # row 1: caption
+      if layout["caption"] is not None:
+        head.append(rowxml(1, [cellxml("A1", captionstyle, layout["caption"])]))
+      elif 1 in layout["heights"]:
+        head.append(rowxml(1, []))
+      # row 2: test result titles
+      if layout["titles"] or START_ROW - 1 in layout["heights"]:
+        head.append(rowxml(START_ROW - 1, [cellxml(f"{letters[sc]}{START_ROW - 1}", titlestyles[sc], value) for sc, _, value in layout["titles"]]))
+      f.write("".join(head).encode("utf-8"))
+      # row 3 and after: table
+      debug = logger.isEnabledFor(logging.DEBUG)
+      chunk = []
+      for r, line in enumerate(cells):
+        if debug: logger.debug("%s", line[noindex])
+        row = r + START_ROW
+        content = []
+        for c in range(colcount):
+          cell = line[c] if c < len(line) else None
+          if type(cell) is list:
+            cell = "\n".join(cell)
+          if r == 0:
+            content.append(cellxml(f"{letters[c]}{row}", headstyles[c], layout["columns"][c]["header"]))
+          else:
+            replace = replaces[c]
+            content.append(cellxml(f"{letters[c]}{row}", bodystyles[c], replace.apply(cell, row, c + 1) if replace is not None else cell))
+        chunk.append(rowxml(row, content))
+        if len(chunk) >= 1000:
+          f.write("".join(chunk).encode("utf-8"))
+          chunk = []
+      chunk.append("</sheetData>")
+      if layout["titles"]:
+        chunk.append(f'<mergeCells count="{len(layout["titles"])}">')
+        for sc, ec, _ in layout["titles"]:
+          chunk.append(f'<mergeCell ref="{letters[sc]}{START_ROW - 1}:{letters[ec]}{START_ROW - 1}"/>')
+        chunk.append("</mergeCells>")
+      chunk.append('<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/></worksheet>')
+      f.write("".join(chunk).encode("utf-8"))
+    with zf.open("xl/sharedStrings.xml", "w") as f:
+      f.write(f'{XML_HEADER}<sst xmlns="{NS_MAIN}" count="{refs}" uniqueCount="{len(strings)}">'.encode("utf-8"))
+      chunk = []
+      for value in strings:
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        chunk.append(f"<si><t{space}>{text(value, 'sharedStrings')}</t></si>")
+        if len(chunk) >= 1000:
+          f.write("".join(chunk).encode("utf-8"))
+          chunk = []
+      chunk.append("</sst>")
+      f.write("".join(chunk).encode("utf-8"))
+    zf.writestr("xl/styles.xml", registry.xml())
+    zf.writestr("xl/workbook.xml", f'{XML_HEADER}<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL}"><bookViews><workbookView/></bookViews><sheets><sheet name={quoteattr(title)} sheetId="1" r:id="rId1"/></sheets><calcPr calcId="124519" fullCalcOnLoad="1"/></workbook>')
+    zf.writestr("xl/_rels/workbook.xml.rels", (
+      f'{XML_HEADER}<Relationships xmlns="{NS_PKGREL}">'
+      f'<Relationship Id="rId1" Type="{NS_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+      f'<Relationship Id="rId2" Type="{NS_REL}/styles" Target="styles.xml"/>'
+      f'<Relationship Id="rId3" Type="{NS_REL}/sharedStrings" Target="sharedStrings.xml"/>'
+      '</Relationships>'
+    ))
+    zf.writestr("_rels/.rels", f'{XML_HEADER}<Relationships xmlns="{NS_PKGREL}"><Relationship Id="rId1" Type="{NS_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+    zf.writestr("[Content_Types].xml", (
+      f'{XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+      '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+      '<Default Extension="xml" ContentType="application/xml"/>'
+      '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+      '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+      '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+      '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+      '</Types>'
+    ))
@@ -0,0 +1,157 @@
+"""
+Excel以外の出力形式(CSV/TSV、JSON Lines、HTML)
+"""
+from __future__ import annotations
+from typing import Any, Iterable
+from pathlib import Path
+import csv
+import html
+import json
+
+from .table import Table
+
+FORMATS = {"xlsx": ".xlsx", "csv": ".csv", "tsv": ".tsv", "jsonl": ".jsonl", "html": ".html"}
+
+def output_format(out: str, format: str | None=None) -> str:
+  """
+  出力形式を決める
+
+  Parameters
+  ----
+  out: 出力先のパス
+  format: 出力形式の指定(省略時は出力先の拡張子から決め、該当しなければxlsx)
+
+  Returns
+  ----
+  FORMATSのキーのいずれか
+  """
+  if format is not None:
+    if not format in FORMATS:
+      raise Exception(f"Unknown format: {format}")
+    return format
+  ext = Path(out).suffix.lower()
+  if ext == ".htm":
+    return "html"
+  for n, e in FORMATS.items():
+    if e == ext:
+      return n
+  return "xlsx"
+
+def column_kinds(config: dict[Any], cells: list[list[str]] | Table) -> list[str]:
+  """
+  各列の種類(no, itemname, content, results)を返す
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ(リストのリストの場合はヘッダ行の列名と設定データから判断する)
+  """
+  if isinstance(cells, Table):
+    return cells.columns()
+  labels = config["Headers"]["TestItemsLabel"]
+  results = config["Headers"]["TestResult"]["Labels"] if "TestResult" in config["Headers"] else []
+  kinds = []
+  for n in cells[0]:
+    match n:
+      case "No": kinds.append("no")
+      case n if n in labels: kinds.append("itemname")
+      case n if n in results: kinds.append("results")
+      case _: kinds.append("content")
+  return kinds
+
+def cell_text(cell: str | list[str] | None) -> str:
+  """
+  セルの値を文字列にする(複数行の値は改行でつなげる)
+  """
+  if cell is None:
+    return ""
+  return "\n".join(cell) if type(cell) is list else cell
+
+def write_delimited(cells: Iterable[list[str]], out: str, delimiter: str=",") -> None:
+  """
+  テーブルデータをCSV(またはTSV)で出力する
+
+  Parameters
+  ----
+  cells: 試験項目を示すテーブルデータ
+  out: 出力先のパス
+  delimiter: 区切り文字
+  """
+  with open(out, mode="w", encoding="utf-8", newline="") as f:
+    writer = csv.writer(f, delimiter=delimiter)
+    for line in cells:
+      writer.writerow([cell_text(c) for c in line])
+
+def write_jsonl(config: dict[Any], cells: list[list[str]] | Table, out: str) -> None:
+  """
+  テーブルデータをJSON Linesで出力する。一行が一つの試験項目で、No(no)・見出しの階層(path)・試験内容(sections)を持つ
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  out: 出力先のパス
+  """
+  kinds = column_kinds(config, cells)
+  header = None
+  with open(out, mode="w", encoding="utf-8", newline="\n") as f:
+    for line in cells:
+      if header is None:
+        header = line
+        continue
+      record = {"no": None, "path": [], "sections": {}}
+      for kind, name, cell in zip(kinds, header, line):
+        match kind:
+          case "no": record["no"] = cell
+          case "itemname":
+            if cell: record["path"].append(cell)
+          case "content": record["sections"][name] = cell_text(cell)
+      f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def write_html(config: dict[Any], cells: Iterable[list[str]], out: str, title: str | None=None) -> None:
+  """
+  テーブルデータを静的なHTMLの表で出力する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  out: 出力先のパス
+  title: ページのタイトル(省略時は設定データのSheet.Name)
+  """
+  title = title or config["Sheet"].get("Name", "")
+  caption = config["Sheet"].get("Caption")
+  with open(out, mode="w", encoding="utf-8") as f:
+    f.write(f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{html.escape(title)}</title>\n')
+    f.write(f'<style>table {{ border-collapse: collapse; }} th, td {{ border: 1px solid #000; padding: 2px 4px; vertical-align: top; text-align: left; white-space: pre-wrap; }} '
+      # aRGB colors ("FF002060") would be read as RRGGBBAA by CSS, so only the RGB part is used
+      f'th {{ background: #{config["Headers"]["BackColor"][-6:]}; color: #{config["Headers"]["TextColor"][-6:]}; }}</style>\n</head>\n<body>\n')
+    if caption is not None:
+      f.write(f"<h1>{html.escape(str(caption))}</h1>\n")
+    f.write("<table>\n")
+    for r, line in enumerate(cells):
+      tag = "th" if r == 0 else "td"
+      if r == 0: f.write("<thead>\n")
+      f.write("<tr>" + "".join(f"<{tag}>{html.escape(cell_text(c))}</{tag}>" for c in line) + "</tr>\n")
+      if r == 0: f.write("</thead>\n<tbody>\n")
+    f.write("</tbody>\n</table>\n</body>\n</html>\n")
+
+def write_table(config: dict[Any], cells: list[list[str]] | Table, out: str, format: str) -> None:
+  """
+  テーブルデータをXLSX以外の形式で出力する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  out: 出力先のパス
+  format: 出力形式(csv, tsv, jsonl, html)
+  """
+  path = Path(out)
+  if not path.parent.exists(): path.parent.mkdir(parents=True)
+  match format:
+    case "csv": write_delimited(cells, out)
+    case "tsv": write_delimited(cells, out, "\t")
+    case "jsonl": write_jsonl(config, cells, out)
+    case "html": write_html(config, cells, out)
+    case _: raise Exception(f"Unknown format: {format}")
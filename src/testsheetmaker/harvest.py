@@ -0,0 +1,334 @@
+"""
+試験結果の集計
+
+試験実施者が結果を入力したワークブックから試験結果列を読み取り、見出しの階層ごと・試行回数ごとに
+合格・不合格・その他・未記入の件数を集計する。
+"""
+from __future__ import annotations
+from typing import Any, Iterable
+from pathlib import Path
+import csv
+import json
+import logging
+
+from .config import compile_config
+from .excel import START_ROW
+from .formats import column_kinds
+
+logger = logging.getLogger("testsheetmaker")
+
+VERDICTS = ["pass", "fail", "other", "blank"]
+# values counted as pass / fail unless Headers.TestResult.Verdict gives its own (compared case-insensitively)
+DEFAULT_PASS = ["OK", "PASS", "○", "〇", "合格"]
+DEFAULT_FAIL = ["NG", "FAIL", "×", "✕", "不合格"]
+# attempt number used for the verdict of the last filled attempt
+LATEST = 0
+
+def verdict_rules(config: dict[Any]) -> tuple[str, set[str], set[str]]:
+  """
+  試験結果の判定に使う列のラベルと、合格・不合格とみなす値を返す
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+
+  Returns
+  ----
+  (判定の列のラベル, 合格の値, 不合格の値)。ラベルはHeaders.TestResult.Verdict.Labelで、省略時はLabelsの最後
+  """
+  result = config["Headers"].get("TestResult")
+  if result is None:
+    raise Exception("Headers.TestResult is required to harvest results")
+  verdict = result.get("Verdict", {})
+  return (verdict.get("Label", result["Labels"][-1]),
+    {v.strip().upper() for v in verdict.get("Pass", DEFAULT_PASS)},
+    {v.strip().upper() for v in verdict.get("Fail", DEFAULT_FAIL)})
+
+def classify(value: Any, passed: set[str], failed: set[str]) -> int:
+  """
+  試験結果の値をVERDICTSの添字(合格・不合格・その他・未記入)に分類する
+  """
+  if value is None:
+    return 3
+  text = str(value).strip().upper()
+  if text == "":
+    return 3
+  return 0 if text in passed else 1 if text in failed else 2
+
+def sheet_columns(config: dict[Any], header: Iterable[Any]) -> tuple[list[int], list[int]] | None:
+  """
+  ヘッダ行の値から、試験項目名の列と試行ごとの判定の列を探す
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  header: ヘッダ行の値(ColumnSetのHeader.Replaceを適用したものでもよい)
+
+  Returns
+  ----
+  (試験項目名の列番号, 試行回数順の判定の列番号)。試験票のシートでなければNone
+  """
+  config = compile_config(config)
+  label = verdict_rules(config)[0]
+  # displayed header -> column name in the config
+  original = {}
+  if config.columnset is not None:
+    for n, conf in config.columnset.columns.items():
+      if conf.header and conf.headvalue is not None:
+        original.setdefault(conf.headvalue, n)
+  names = [original.get(v, v) if isinstance(v, str) else "" for v in header]
+  kinds = column_kinds(config, [names])
+  items = [c for c, k in enumerate(kinds) if k == "itemname"]
+  verdicts = [c for c, k in enumerate(kinds) if k == "results" and names[c] == label]
+  if len(items) != len(config["Headers"]["TestItemsLabel"]) or verdicts == []:
+    return None
+  return (items, verdicts)
+
+class Harvest:
+  """
+  試験結果の集計。見出しの階層(の先頭からの一部)と試行回数ごとに、VERDICTSの順の件数を持つ。
+  件数は見出しの種類の数だけ保持するため、読み込むファイルの数が増えてもメモリ使用量は増えない
+  """
+  def __init__(self, levels: int | None=None) -> None:
+    """
+    Parameters
+    ----
+    levels: 集計する見出しの階層の深さ(省略時はすべての階層)
+    """
+    self.levels = levels
+    self.attempts = 0
+    # (heading path prefix, attempt) -> counts; the empty path is the total, attempt LATEST the last filled attempt
+    self.counts: dict[tuple[tuple[str, ...], int], list[int]] = {}
+    # (workbook path, harvested sheet names, items, error message or None)
+    self.files: list[tuple[str, list[str], int, str | None]] = []
+
+  def add(self, path: tuple[str, ...], verdicts: list[int]) -> None:
+    """
+    一つの試験項目の判定を加える
+
+    Parameters
+    ----
+    path: 見出しの階層(空の階層は含まない)
+    verdicts: 試行回数順の判定(VERDICTSの添字)
+    """
+    self.attempts = max(self.attempts, len(verdicts))
+    latest = next((v for v in reversed(verdicts) if v != 3), 3)
+    depth = len(path) if self.levels is None else min(len(path), self.levels)
+    counts = self.counts
+    for level in range(depth + 1):
+      prefix = path[:level]
+      for attempt, v in enumerate(verdicts, 1):
+        key = (prefix, attempt)
+        c = counts.get(key)
+        if c is None:
+          c = counts[key] = [0, 0, 0, 0]
+        c[v] += 1
+      key = (prefix, LATEST)
+      c = counts.get(key)
+      if c is None:
+        c = counts[key] = [0, 0, 0, 0]
+      c[latest] += 1
+
+  def merge(self, other: Harvest) -> None:
+    """
+    他の集計の件数とファイルの一覧を加える
+    """
+    self.attempts = max(self.attempts, other.attempts)
+    for key, c in other.counts.items():
+      mine = self.counts.get(key)
+      if mine is None:
+        self.counts[key] = list(c)
+      else:
+        for i, n in enumerate(c):
+          mine[i] += n
+    self.files += other.files
+
+  def items(self) -> int:
+    """
+    集計した試験項目の数
+    """
+    return sum(self.counts.get(((), LATEST), [0]))
+
+  def rows(self) -> list[tuple[tuple[str, ...], dict[int, list[int]]]]:
+    """
+    (見出しの階層, 試行回数ごとの件数)のリスト。階層の順に並び、件数は試行回数順(最後にLATEST)
+    """
+    rows = []
+    for path, attempt in sorted(self.counts, key=lambda k: (k[0], k[1] == LATEST, k[1])):
+      if rows == [] or rows[-1][0] != path:
+        rows.append((path, {}))
+      rows[-1][1][attempt] = self.counts[(path, attempt)]
+    return rows
+
+  def asdict(self) -> dict[str, Any]:
+    """
+    JSONに出力する形式の辞書
+    """
+    levels = [{"level": len(path), "path": list(path), "attempts": {"latest" if a == LATEST else str(a): dict(zip(VERDICTS, c)) for a, c in counts.items()}} for path, counts in self.rows()]
+    return {
+      "items": self.items(),
+      "attempts": self.attempts,
+      "files": [{"path": p, "sheets": s, "items": n, "error": e} for p, s, n, e in sorted(self.files)],
+      "levels": levels,
+    }
+
+def harvest_workbook(config: dict[Any], path: str, levels: int | None=None) -> Harvest:
+  """
+  一つのワークブックを読み取り専用で開き、試験票のシートの試験結果を集計する。
+  行は一行ずつ読み込まれ、シート全体を保持しない。読み込みに失敗した場合はエラーをfilesに記録する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  path: ワークブックのパス
+  levels: 集計する見出しの階層の深さ(省略時はすべての階層)
+
+  Returns
+  ----
+  このワークブックの集計
+  """
+  import openpyxl
+  config = compile_config(config)
+  _, passed, failed = verdict_rules(config)
+  harvest = Harvest(levels)
+  sheets = []
+  items = 0
+  try:
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+      for ws in wb.worksheets:
+        rows = ws.iter_rows(min_row=START_ROW, values_only=True)
+        columns = sheet_columns(config, next(rows, ()))
+        if columns is None:
+          continue
+        itemcols, verdictcols = columns
+        sheets.append(ws.title)
+        for row in rows:
+          heading = tuple(str(row[c]) for c in itemcols if c < len(row) and row[c] not in (None, ""))
+          if heading == ():
+            continue
+          harvest.add(heading, [classify(row[c] if c < len(row) else None, passed, failed) for c in verdictcols])
+          items += 1
+    finally:
+      wb.close()
+    if sheets == []:
+      raise Exception("no test sheet found")
+    harvest.files.append((path, sheets, items, None))
+  except Exception as e:
+    harvest = Harvest(levels)
+    harvest.files.append((path, [], 0, f"{type(e).__name__}: {e}"))
+  return harvest
+
+def harvest_files(config: dict[Any], paths: list[str], workers: int | None=None, levels: int | None=None) -> Harvest:
+  """
+  複数のワークブックの試験結果をプロセスプールで並列に集計する。
+  同時に処理中のファイルはワーカー数の2倍までで、各ファイルの集計は完了した順にまとめられる
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  paths: ワークブックのパスのリスト
+  workers: ワーカープロセス数(省略時はCPU数)
+  levels: 集計する見出しの階層の深さ(省略時はすべての階層)
+
+  Returns
+  ----
+  すべてのワークブックの集計
+  """
+  import os
+  from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+  config = compile_config(config)
+  total = Harvest(levels)
+  def merge(harvest: Harvest) -> None:
+    total.merge(harvest)
+    for p, _, n, error in harvest.files:
+      if error is None:
+        logger.info("ok %s (%d items)", p, n)
+      else:
+        logger.error("NG %s (%s)", p, error)
+  if len(paths) <= 1 or workers == 1:
+    for p in paths:
+      merge(harvest_workbook(config, p, levels))
+    return total
+  window = 2 * (workers or os.cpu_count() or 1)
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    pending = set()
+    for p in paths:
+      pending.add(executor.submit(harvest_workbook, config, p, levels))
+      if len(pending) >= window:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          merge(future.result())
+    for future in pending:
+      merge(future.result())
+  return total
+
+def write_harvest(config: dict[Any], harvest: Harvest, out: str | Path, format: str | None=None) -> None:
+  """
+  集計をJSONまたはCSVで出力する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  harvest: 集計
+  out: 出力先のパス
+  format: json または csv(省略時は出力先の拡張子から決め、.csv以外はjson)
+  """
+  format = format or ("csv" if Path(out).suffix.lower() == ".csv" else "json")
+  if format == "json":
+    with open(out, mode="w", encoding="utf-8") as f: json.dump(harvest.asdict(), f, indent=1, ensure_ascii=False)
+  elif format == "csv":
+    labels = config["Headers"]["TestItemsLabel"]
+    with open(out, mode="w", encoding="utf-8-sig", newline="") as f:
+      writer = csv.writer(f)
+      writer.writerow(["level", *labels, "attempt", *VERDICTS])
+      for path, counts in harvest.rows():
+        for attempt, c in counts.items():
+          writer.writerow([len(path), *path, *[""] * (len(labels) - len(path)), "latest" if attempt == LATEST else attempt, *c])
+  else:
+    raise Exception(f"Unknown harvest format: {format}")
+
+def create_harvest_workbook(config: dict[Any], harvest: Harvest, out: str | Path) -> None:
+  """
+  集計をワークブックに出力する。Harvestシートに見出しの階層ごとの件数(試行回数ごとに合格・不合格・その他・未記入)を、
+  Filesシートに読み込んだファイルの一覧を書き込む
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  harvest: 集計
+  out: 出力先のパス
+  """
+  import openpyxl
+  import openpyxl.styles as styles
+  from openpyxl.cell import WriteOnlyCell
+  labels = config["Headers"]["TestItemsLabel"]
+  title = config["Headers"].get("TestResult", {}).get("Title", "{}")
+  headdesign = styles.PatternFill(patternType='solid', fgColor=config["Headers"]["BackColor"], bgColor=config["Headers"]["BackColor"])
+  headfont = styles.Font(color=config["Headers"]["TextColor"])
+  def headrow(ws, values):
+    row = []
+    for v in values:
+      cellobj = WriteOnlyCell(ws, v)
+      cellobj.fill = headdesign
+      cellobj.font = headfont
+      row.append(cellobj)
+    ws.append(row)
+  wb = openpyxl.Workbook(write_only=True)
+  ws = wb.create_sheet("Harvest")
+  attempts = [*range(1, harvest.attempts + 1), LATEST]
+  for c in range(len(labels)):
+    ws.column_dimensions[openpyxl.utils.get_column_letter(c + 1)].width = 16
+  headrow(ws, [None] * len(labels) + [title.format(a) if a != LATEST else "latest" for a in attempts for _ in VERDICTS])
+  headrow(ws, labels + VERDICTS * len(attempts))
+  for path, counts in harvest.rows():
+    row = [*path] + [None] * (len(labels) - len(path)) if path else ["Total"] + [None] * (len(labels) - 1)
+    for a in attempts:
+      row += counts.get(a, [None] * len(VERDICTS))
+    ws.append(row)
+  files = wb.create_sheet("Files")
+  files.column_dimensions["A"].width = max([len(f[0]) for f in harvest.files] + [10]) * 1.2
+  headrow(files, ["File", "Sheets", "Items", "Error"])
+  for p, s, n, e in sorted(harvest.files):
+    files.append([p, ", ".join(s), n, e])
+  wb.save(out)
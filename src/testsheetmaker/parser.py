@@ -0,0 +1,581 @@
+"""
+試験票(Markdownファイル)の読み込みと、&includeなどのプリプロセッサの展開
+"""
+from __future__ import annotations
+from typing import Any, Iterable, Iterator
+from pathlib import Path
+from collections import OrderedDict
+import json
+import os
+import re
+
+from .table import ItemNumbering
+
+RE_PREPROCESSOR = re.compile(r"\s*&(\w+)\((.*?)\)$")
+RE_HEADING = re.compile(r"^\s*(#+)\s*(.*)$")
+RE_SECTION = re.compile(r"^\s*::\s*(.*?)\s*(&&)?$")
+# "[tag]" annotations at the end of a heading, separated from the name by a space
+RE_TAGS = re.compile(r"(?:\s+\[[\w.-]+\])+\s*$")
+RE_TAG = re.compile(r"\[([\w.-]+)\]")
+
+RE_PLACEHOLDER = re.compile(r"//\*\*(.*?)\*\*//")
+
+# default minimum number of lines (after include expansion) for parse_parallel to use worker processes
+PARALLEL_THRESHOLD = 100000
+
+class IncludeEngine:
+  """
+  &include プリプロセッサの展開を行う。
+
+  読み込んだファイルはパスと更新時刻をキーにキャッシュされ、`//**名前**//` の位置で分割済みの
+  セグメントとして保持される。インクルード先のファイル内の &include も再帰的に展開され、
+  循環参照は例外となる。展開時のインクルード関係は依存グラフとして記録される。
+  maxsizeを指定すると、キャッシュするファイル数を最近使用した順にその数までに制限する。
+  rootを指定すると、そのディレクトリの外のファイルのインクルードはPermissionErrorとなる。
+  """
+  def __init__(self, maxsize: int | None=None, root: str | Path | None=None) -> None:
+    """
+    Parameters
+    ----
+    maxsize: キャッシュするファイル数の上限(省略時は制限しない)
+    root: インクルードできるファイルを置いたディレクトリ(省略時は制限しない)
+    """
+    self.fragments: OrderedDict[str, tuple[int, list[str]]] = OrderedDict()
+    self.graph: dict[str, set[str]] = {}
+    self.maxsize = maxsize
+    self.root = Path(root).resolve() if root is not None else None
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def fragment(self, path: Path) -> list[str]:
+    """
+    ファイルを読み込み、リテラルとプレースホルダに分割したセグメントを返す。
+
+    Parameters
+    ----
+    path: 読み込むファイルのパス
+
+    Returns
+    ----
+    セグメントのリスト。偶数番目がリテラル、奇数番目がプレースホルダ名
+    """
+    key = str(path)
+    mtime = os.stat(path).st_mtime_ns
+    if key in self.fragments and self.fragments[key][0] == mtime:
+      self.hits += 1
+      if self.maxsize is not None: self.fragments.move_to_end(key)
+      return self.fragments[key][1]
+    self.misses += 1
+    with open(path, mode="r", encoding="utf-8") as f:
+      segments = RE_PLACEHOLDER.split(f.read())
+    self.fragments[key] = (mtime, segments)
+    if self.maxsize is not None:
+      self.fragments.move_to_end(key)
+      while len(self.fragments) > self.maxsize:
+        self.fragments.popitem(last=False)
+        self.evictions += 1
+    return segments
+
+  def render(self, path: Path, arguments: dict[str, Any]) -> str:
+    """
+    ファイルを読み込み、プレースホルダを引数の値で置き換えた文字列を返す。
+
+    Parameters
+    ----
+    path: 読み込むファイルのパス
+    arguments: &include の引数
+
+    Returns
+    ----
+    置換後の文字列
+    """
+    segments = self.fragment(path)
+    if len(segments) == 1:
+      return segments[0]
+    return "".join(seg if i % 2 == 0 else (str(arguments[seg]) if seg in arguments else f"//**{seg}**//") for i, seg in enumerate(segments))
+
+  def expand(self, lines: Iterable[str], base: str=".", source: str | None=None) -> Iterator[str]:
+    """
+    行のイテレータに含まれるプリプロセッサを展開しながら行を返す。
+
+    Parameters
+    ----
+    lines: 行のイテレータ
+    base: プリプロセッサ実行時の基準ディレクトリパス
+    source: 行の読み込み元のファイルパス。依存グラフのキーに使用される(省略時は"<string>")
+
+    Returns
+    ----
+    プリプロセッサ展開後の行のイテレータ
+    """
+    key = str(Path(source).resolve()) if source is not None else "<string>"
+    self.graph[key] = set()
+    carry = yield from self._expandlines((line.rstrip("\r\n") for line in lines), Path(base), (key,), "")
+    if carry != "":
+      yield carry
+
+  def dependencies(self, source: str) -> set[str]:
+    """
+    ファイルが直接・間接にインクルードしているファイルの一覧を返す。
+
+    Parameters
+    ----
+    source: 対象のファイルパス(expandに渡したsourceと同じもの)
+
+    Returns
+    ----
+    インクルードされているファイルの絶対パスの集合
+    """
+    result = set()
+    stack = [str(Path(source).resolve()) if source != "<string>" else source]
+    while stack:
+      for dep in self.graph.get(stack.pop(), ()):
+        if not dep in result:
+          result.add(dep)
+          stack.append(dep)
+    return result
+
+  def dependency_graph(self) -> dict[str, list[str]]:
+    """
+    依存グラフをJSONに変換可能な形式で返す。
+
+    Returns
+    ----
+    インクルード元のパスをキー、インクルード先のパスのリストを値とする辞書
+    """
+    return {n: sorted(v) for n, v in self.graph.items()}
+
+  def _expandlines(self, lines: Iterable[str], basedir: Path, stack: tuple[str], carry: str):
+    # the included text is spliced in as is, so its last line continues with the next line
+    for line in lines:
+      if m := RE_PREPROCESSOR.match(line):
+        carry = yield from self._directive(m, basedir, stack, carry)
+      else:
+        yield carry + line
+        carry = ""
+    return carry
+
+  def _directive(self, m: re.Match, basedir: Path, stack: tuple[str], carry: str):
+    argument = json.loads(m[2])
+    match m[1]:
+      case "include":
+        path = (basedir / argument["name"]).resolve()
+        if self.root is not None and not path.is_relative_to(self.root):
+          raise PermissionError(f"include outside of {self.root}: {argument['name']}")
+        key = str(path)
+        if key in stack:
+          raise Exception(f"Circular include: {' -> '.join(stack[1:] + (key,))}")
+        self.graph[stack[-1]].add(key)
+        self.graph.setdefault(key, set())
+        pieces = self.render(path, argument).split("\n")
+        carry = yield from self._expandlines(pieces[:-1], path.parent, stack + (key,), carry)
+        if m := RE_PREPROCESSOR.match(pieces[-1]):
+          carry = yield from self._directive(m, path.parent, stack + (key,), carry)
+        else:
+          carry += pieces[-1]
+    return carry
+
+INCLUDES = IncludeEngine()
+
+def preprocess_lines(lines: str | Iterable[str], base: str=".", source: str | None=None, includes: IncludeEngine=INCLUDES) -> Iterator[str]:
+  """
+  Markdownデータを一行ずつ読み込み、プリプロセッサを展開しながら行を返す。
+
+  Parameters
+  ----
+  lines: 試験項目データを含むMarkdownデータ、もしくは行のイテレータ(ファイルオブジェクトなど)
+  base: プリプロセッサ実行時の基準ディレクトリパス
+  source: Markdownデータの読み込み元のファイルパス(依存グラフに記録される)
+  includes: インクルードの展開に使用するIncludeEngine
+
+  Returns
+  ----
+  プリプロセッサ展開後の行のイテレータ
+  """
+  if type(lines) is str:
+    lines = lines.split("\n")
+  return includes.expand(lines, base, source)
+
+class HeadingNode:
+  """
+  見出しの階層を表すトライ木のノード。同じ親の下の同じ名前の見出しは一つのノードを共有するため、
+  試験項目はノードを参照するだけで見出しの階層を持てる
+  """
+  __slots__ = ("name", "parent", "depth", "children", "_path")
+
+  def __init__(self, name: str | None=None, parent: HeadingNode | None=None) -> None:
+    """
+    Parameters
+    ----
+    name: 見出しの名前(根はNone)
+    parent: 親のノード(根はNone)
+    """
+    self.name = name
+    self.parent = parent
+    self.depth = parent.depth + 1 if parent is not None else 0
+    self.children: dict[str, HeadingNode] = {}
+    self._path: list[str] | None = None
+
+  def child(self, name: str) -> HeadingNode:
+    """
+    子の見出しのノードを返す(なければ作成する)
+    """
+    node = self.children.get(name)
+    if node is None:
+      node = self.children[name] = HeadingNode(name, self)
+    return node
+
+  def ancestor(self, depth: int) -> HeadingNode:
+    """
+    指定した深さの祖先のノード(自身を含む)を返す
+    """
+    node = self
+    while node.depth > depth:
+      node = node.parent
+    return node
+
+  @property
+  def path(self) -> list[str]:
+    """
+    根からこのノードまでの見出しの名前のリスト(ノード間で共有されるため変更しないこと)
+    """
+    if self._path is None:
+      self._path = (self.parent.path if self.parent is not None else []) + ([self.name] if self.name is not None else [])
+    return self._path
+
+def split_tags(name: str) -> tuple[str, frozenset[str]]:
+  """
+  見出しの名前から末尾の[タグ]を取り除く
+
+  Parameters
+  ----
+  name: 見出しの#以降の文字列
+
+  Returns
+  ----
+  (タグを除いた名前, タグの集合)
+  """
+  if not "[" in name or not (m := RE_TAGS.search(name)):
+    return (name, frozenset())
+  return (name[:m.start()], frozenset(RE_TAG.findall(m[0])))
+
+class ExamRecord:
+  """
+  試験項目一件分のデータ。見出しの階層はHeadingNodeを参照し、&&で引き継いだ試験内容は引き継ぎ元と
+  同じリストを共有する。
+
+  従来の辞書の形式({"items": 見出しのリスト, "exams": {試験内容名: 行のリスト}})と同じように
+  record["items"]・record["exams"]で値を取り出せ、辞書と比較できる。asdict()で辞書に変換できる
+  """
+  __slots__ = ("node", "exams", "number")
+
+  def __init__(self, node: HeadingNode, exams: dict[str, list[str]], number: list[int] | None=None) -> None:
+    """
+    Parameters
+    ----
+    node: 試験項目の見出しのノード
+    exams: 試験内容名をキー、行のリストを値とする辞書
+    number: 試験票全体でのNo(階層ごとの番号。一部の試験項目を選んだ場合のみ。省略時は出力する試験項目の順に数える)
+    """
+    self.node = node
+    self.exams = exams
+    self.number = number
+
+  @property
+  def items(self) -> list[str]:
+    """
+    見出しの階層(ほかの試験項目と共有されるため変更しないこと)
+    """
+    return self.node.path
+
+  def __getitem__(self, key: str) -> Any:
+    match key:
+      case "items": return self.node.path
+      case "exams": return self.exams
+    raise KeyError(key)
+
+  def keys(self) -> list[str]:
+    return ["items", "exams"]
+
+  def asdict(self) -> dict[list[str] | dict[str]]:
+    """
+    従来の形式の辞書に変換する(見出しのリストは複製する)
+    """
+    return {"items": list(self.node.path), "exams": self.exams}
+
+  def __eq__(self, other: Any) -> bool:
+    if isinstance(other, ExamRecord):
+      return self.node.path == other.node.path and self.exams == other.exams
+    if isinstance(other, dict):
+      return self.asdict() == other
+    return NotImplemented
+
+  __hash__ = None
+
+  def __repr__(self) -> str:
+    return f"ExamRecord({self.asdict()!r})"
+
+def iter_testlist(lines: str | Iterable[str], base: str=".", source: str | None=None, includes: IncludeEngine=INCLUDES) -> Iterator[dict[list[str] | dict[str]]]:
+  """
+  Markdownデータより、試験項目を一件ずつ返す。
+  各行は一度だけ分類され、試験項目は見出しが切り替わった時点で返される。
+  iter_recordsの結果を従来の辞書の形式に変換して返す(試験項目が多い場合はiter_recordsを使う)
+
+  Parameters
+  ----
+  lines: 試験項目データを含むMarkdownデータ、もしくは行のイテレータ(ファイルオブジェクトなど)
+  base: プリプロセッサ実行時の基準ディレクトリパス
+  source: Markdownデータの読み込み元のファイルパス(依存グラフに記録される)
+  includes: インクルードの展開に使用するIncludeEngine
+
+  Returns
+  ----
+  試験項目のイテレータ(要素はgenerate_testlistの出力と同じ構造)
+  """
+  return (record.asdict() for record in iter_records(lines, base, source, includes))
+
+def iter_records(lines: str | Iterable[str], base: str=".", source: str | None=None, includes: IncludeEngine=INCLUDES, retain: bool=True, select: Any=None, numbers: Iterable[list[int]] | None=None) -> Iterator[ExamRecord]:
+  """
+  Markdownデータより、試験項目をExamRecordとして一件ずつ返す。
+  見出しの名前・試験内容名・試験内容の行は同じ文字列を共有するため、試験項目が多くてもメモリ使用量は
+  異なる文字列の数に比例する
+
+  Parameters
+  ----
+  lines: 試験項目データを含むMarkdownデータ、もしくは行のイテレータ(ファイルオブジェクトなど)
+  base: プリプロセッサ実行時の基準ディレクトリパス
+  source: Markdownデータの読み込み元のファイルパス(依存グラフに記録される)
+  includes: インクルードの展開に使用するIncludeEngine
+  retain: 見出しの木と文字列の共有テーブルを保持するかどうか。Falseの場合は現在の見出しの階層のみを保持し、
+    メモリ使用量が試験項目数に比例しない(同じ見出しの試験項目も別のノードを参照する)
+  select: 返す試験項目を選ぶSelector(省略時はすべての試験項目を返す)。選ばれない試験項目も&&の引き継ぎ元にはなり、
+    Noの番号として数えられる(返す試験項目のnumberに試験票全体でのNoが入る)。見出しの末尾の[タグ]はselectの照合にのみ使われる
+  numbers: 選ばれる試験項目の試験票全体でのNoを順に返すイテレータ。linesが試験票の一部(select_lines)の場合に指定する
+
+  Returns
+  ----
+  試験項目のイテレータ
+  """
+  return _iter_exams(preprocess_lines(lines, base, source, includes), retain=retain, select=select, numbers=numbers)
+
+def _iter_exams(lines: Iterable[str], previoustest: dict[str, list[str]] | None=None, trace: dict[str, Any] | None=None, retain: bool=True, select: Any=None, numbers: Iterable[list[int]] | None=None) -> Iterator[ExamRecord]:
+  # previoustest is the test before the first line, used by "&&" at the start of a chunk;
+  # trace receives whether "&&" referred to it ("external") and the previous test for the next chunk ("last");
+  # with select every test is numbered, so that the selected ones keep their number in the whole sheet
+  numbering = ItemNumbering() if select is not None and numbers is None else None
+  numbers = iter(numbers) if numbers is not None else None
+  root = HeadingNode()
+  node = root
+  # one string object per distinct heading, section name and line
+  intern = {}.setdefault if retain else (lambda key, value: value)
+  previoustest = previoustest if previoustest is not None else {}
+  external = True
+  currenttest = {}
+  section = ""
+  textbuf = []
+  # textbuf is shared with the previous test while it holds a section inherited by "&&"
+  inherited = False
+  for line in lines:
+    stripped = line.strip()
+    if stripped == "":
+      # ignore blank line.
+      continue
+    if stripped[0] == "#" and (m := RE_HEADING.match(line)):
+      # change item
+      if textbuf != [] and section != "":
+        currenttest[section] = textbuf
+      if node is not root and currenttest != {}:
+        number = numbering.next(node.path) if numbering is not None else None
+        if select is None or select.match(node):
+          yield ExamRecord(node, currenttest, next(numbers, None) if numbers is not None else number)
+      # new item (the path is looked up in the heading trie, so yielded items stay intact)
+      ml = len(m[1])
+      name = intern(m[2], m[2])
+      if ml <= node.depth:
+        parent = node.ancestor(ml - 1)
+      elif node.depth + 1 == ml:
+        parent = node
+      else:
+        raise Exception("Incorrect test vote data.")
+      if not retain:
+        # yielded items keep their own path through the parent links
+        parent.children.clear()
+      node = parent.child(name)
+      section = ""
+      if currenttest != {}:
+        previoustest = currenttest
+        external = False
+      currenttest = {}
+      textbuf = []
+      inherited = False
+    elif stripped.startswith("::") and (m := RE_SECTION.match(line)):
+      # change section
+      if textbuf != [] and section != "":
+        currenttest[section] = textbuf
+      # new section
+      section = intern(m[1], m[1])
+      if m[2] == "&&" and external and trace is not None:
+        trace["external"] = True
+      if m[2] == "&&" and section in previoustest:
+        textbuf = previoustest[section]
+        inherited = True
+      else:
+        textbuf = []
+        inherited = False
+    else:
+      if inherited:
+        textbuf = textbuf.copy()
+        inherited = False
+      textbuf.append(intern(stripped, stripped))
+  if textbuf != [] and section != "":
+    currenttest[section] = textbuf
+  if node is not root and currenttest != {}:
+    number = numbering.next(node.path) if numbering is not None else None
+    if select is None or select.match(node):
+      yield ExamRecord(node, currenttest, next(numbers, None) if numbers is not None else number)
+  if trace is not None:
+    trace.setdefault("external", False)
+    trace["last"] = currenttest if currenttest != {} else (None if external else previoustest)
+
+def _parse_chunk(lines: list[str], previoustest: dict[str, list[str]]) -> tuple[list[ExamRecord], bool, dict[str, list[str]] | None]:
+  # runs in a worker process; returns (tests, whether "&&" referred to the test before the chunk, previous test for the next chunk)
+  trace = {}
+  exams = list(_iter_exams(lines, previoustest, trace))
+  return (exams, trace["external"], trace["last"])
+
+def split_chunks(lines: list[str], count: int) -> list[list[str]]:
+  """
+  プリプロセッサ展開後の行を、最上位の見出し(#)の位置でおおよそ同じ行数のチャンクに分割する。
+  最上位の見出しでは見出しの階層がすべて切り替わるため、各チャンクは独立して解析できる
+
+  Parameters
+  ----
+  lines: プリプロセッサ展開後の行のリスト
+  count: チャンク数の目安
+
+  Returns
+  ----
+  チャンクのリスト(最上位の見出しが少なければcountより少なくなる)
+  """
+  size = max(1, -(-len(lines) // max(count, 1)))
+  chunks = []
+  start = 0
+  for i, line in enumerate(lines):
+    # the same classification as _iter_exams: a heading with a single "#"
+    if i - start >= size and line.lstrip().startswith("#") and (m := RE_HEADING.match(line)) and len(m[1]) == 1:
+      chunks.append(lines[start:i])
+      start = i
+  chunks.append(lines[start:])
+  return chunks
+
+def parse_parallel(lines: str | Iterable[str], base: str=".", source: str | None=None, includes: IncludeEngine=INCLUDES, workers: int | None=None, threshold: int=PARALLEL_THRESHOLD) -> list[ExamRecord]:
+  """
+  Markdownデータより、試験項目用リストをプロセスプールで並列に作成する。
+  プリプロセッサを展開した後、最上位の見出しの位置で分割したチャンクを並列に解析し、元の順に連結する。
+  チャンクの先頭の&&が前のチャンクの試験項目を参照する場合は、そのチャンクのみ前のチャンクの結果を使って
+  解析し直すため、結果はiter_recordsと同じになる
+
+  Parameters
+  ----
+  lines: 試験項目データを含むMarkdownデータ、もしくは行のイテレータ(ファイルオブジェクトなど)
+  base: プリプロセッサ実行時の基準ディレクトリパス
+  source: Markdownデータの読み込み元のファイルパス(依存グラフに記録される)
+  includes: インクルードの展開に使用するIncludeEngine
+  workers: ワーカープロセス数(省略時はCPU数)
+  threshold: 並列に解析する最小の行数(プリプロセッサ展開後)。これより短い場合は並列化しない
+
+  Returns
+  ----
+  試験項目のリスト(iter_recordsの出力と同じ)
+  """
+  expanded = list(preprocess_lines(lines, base, source, includes))
+  workers = workers or os.cpu_count() or 1
+  chunks = split_chunks(expanded, workers * 2) if len(expanded) >= threshold and workers > 1 else [expanded]
+  if len(chunks) == 1:
+    return list(_iter_exams(expanded))
+  from concurrent.futures import ProcessPoolExecutor
+  with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+    results = list(executor.map(_parse_chunk, chunks, [{}] * len(chunks), chunksize=1))
+  exams = []
+  previous = {}
+  for chunk, (items, external, last) in zip(chunks, results):
+    if external and previous != {}:
+      # "&&" at the start of the chunk inherits from the previous chunk
+      items, _, last = _parse_chunk(chunk, previous)
+    exams += items
+    if last is not None:
+      previous = last
+  return exams
+
+class SectionParser:
+  """
+  最上位の見出し(#)ごとの解析結果を保持し、内容が変わったセクションだけを解析し直すパーサ。
+  常駐して同じ試験票を繰り返し解析する場合(--watch)に使う。結果はiter_recordsと同じになる
+  """
+  def __init__(self, includes: IncludeEngine | None=None) -> None:
+    """
+    Parameters
+    ----
+    includes: インクルードの展開に使用するIncludeEngine(省略時は専用のもの。読み込んだファイルは更新されるまで再利用される)
+    """
+    self.includes = includes if includes is not None else IncludeEngine()
+    # section lines -> (tests, whether "&&" referred to the test before the section, previous test for the next section)
+    self.sections: dict[tuple[str, ...], tuple[list[ExamRecord], bool, dict[str, list[str]] | None]] = {}
+    # sections parsed by the last call of parse
+    self.parsed = 0
+
+  def parse(self, lines: str | Iterable[str], base: str=".", source: str | None=None) -> list[ExamRecord]:
+    """
+    Markdownデータより試験項目用リストを作成する。前回と同じ内容のセクションは前回の結果を使う
+
+    Parameters
+    ----
+    lines: 試験項目データを含むMarkdownデータ、もしくは行のイテレータ
+    base: プリプロセッサ実行時の基準ディレクトリパス
+    source: Markdownデータの読み込み元のファイルパス(依存グラフに記録される)
+
+    Returns
+    ----
+    試験項目のリスト
+    """
+    expanded = list(preprocess_lines(lines, base, source, self.includes))
+    sections = {}
+    exams = []
+    previous = {}
+    self.parsed = 0
+    # a chunk size of one line splits at every top-level heading
+    for chunk in split_chunks(expanded, len(expanded)):
+      key = tuple(chunk)
+      result = self.sections.get(key) or sections.get(key)
+      if result is None:
+        result = _parse_chunk(chunk, {})
+        self.parsed += 1
+      sections[key] = result
+      items, external, last = result
+      if external and previous != {}:
+        # "&&" at the start of the section inherits from the previous section
+        items, _, last = _parse_chunk(chunk, previous)
+      exams += items
+      if last is not None:
+        previous = last
+    # sections that are gone are dropped
+    self.sections = sections
+    return exams
+
+def generate_testlist(lines: str | Iterable[str], base: str=".", source: str | None=None, includes: IncludeEngine=INCLUDES) -> list[dict[list[str] | dict[str]]]:
+  """
+  Markdownデータより、試験項目用リストを作成する。
+  
+  Parameters
+  ----
+  lines: 試験項目データを含むMarkdownデータ
+  basedir: プリプロセッサ実行時の基準ディレクトリパス
+  source: Markdownデータの読み込み元のファイルパス(依存グラフに記録される)
+  includes: インクルードの展開に使用するIncludeEngine
+
+  Returns
+  ----
+  試験項目を含む構造体
+  """
+  return list(iter_testlist(lines, base, source, includes))
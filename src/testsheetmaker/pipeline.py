@@ -0,0 +1,439 @@
+"""
+試験票からテーブルデータ・出力ファイルを作成する処理の組み立て
+"""
+from __future__ import annotations
+from typing import Any, Iterable, TYPE_CHECKING
+from pathlib import Path
+import glob
+import logging
+import re
+
+from .parser import INCLUDES, ExamRecord, iter_records, parse_parallel
+from .table import Table, normalize_table, add_examcells, rearrange_cells
+from .excel import create_excel, adjusttable, create_excel_streaming, create_summary
+from .fastxlsx import create_excel_fast
+from .formats import FORMATS, output_format, write_table
+from .config import compile_config
+from .consts import ConstExpander, expandvars
+from .profiler import Profiler, profile_stage
+from .cache import BuildCache
+from .template import create_excel_template, template_key
+from .query import Selector, select_lines
+
+if TYPE_CHECKING:
+  import openpyxl
+
+logger = logging.getLogger("testsheetmaker")
+
+def build_table(config: dict[Any], tests: str, profiler: Profiler | None=None, parallel: int | None=None, select: Selector | None=None) -> Table:
+  """
+  試験票(Markdownファイル)から、Excelに出力するテーブルデータを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  parallel: 試験票を並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+  select: 試験項目を選ぶ条件(省略時はすべての試験項目)。試験票の索引を使い、選んだ試験項目の範囲だけを読み込む
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ
+  """
+  if select is not None:
+    with profile_stage(profiler, "select_lines"): selected = select_lines(tests, select)
+    if selected is not None:
+      lines, numbers = selected
+      return table_from_lines(config, lines, Path(tests).parent, tests, profiler, parallel, select, numbers)
+    logger.info("index not usable for %s (an include adds headings), parsing the whole file", tests)
+  with open(tests, mode="r", encoding="utf-8") as f:
+    return table_from_lines(config, f, Path(tests).parent, tests, profiler, parallel, select)
+
+def table_from_lines(config: dict[Any], lines: str | Iterable[str], base: str=".", source: str | None=None, profiler: Profiler | None=None, parallel: int | None=None, select: Selector | None=None, numbers: Iterable[list[int]] | None=None) -> Table:
+  """
+  試験票の内容から、Excelに出力するテーブルデータを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  lines: 試験票の内容(文字列、または行のイテレータ)
+  base: &includeの基準ディレクトリパス
+  source: 試験票のファイルパス(警告の表示とインクルードの依存関係の記録に使用する)
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  parallel: 試験票を並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+  select: 試験項目を選ぶ条件(省略時はすべての試験項目)。parallelとは併用できない
+  numbers: linesが試験票の一部(select_lines)の場合に、選ばれる試験項目の試験票全体でのNo
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ
+  """
+  config = compile_config(config)
+  if parallel is not None and select is not None:
+    raise Exception("Selecting test items cannot be used with parallel parsing.")
+  if parallel is not None:
+    with profile_stage(profiler, "generate_testlist"): exams = parse_parallel(lines, base=base, source=source, threshold=parallel)
+  else:
+    exams = iter_records(lines, base=base, source=source, select=select, numbers=numbers)
+    if profiler is not None:
+      # parse up front so that parsing and normalization are timed separately
+      with profiler.stage("generate_testlist"): exams = list(exams)
+  return table_from_records(config, exams, source, profiler)
+
+def table_from_records(config: dict[Any], exams: Iterable[ExamRecord], source: str | None=None, profiler: Profiler | None=None) -> Table:
+  """
+  解析済みの試験項目から、Excelに出力するテーブルデータを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  exams: 試験項目(iter_recordsなどの出力)
+  source: 試験票のファイルパス(警告の表示に使用する)
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ
+  """
+  config = compile_config(config)
+  with profile_stage(profiler, "cells_normalization"): cells = normalize_table(config["Headers"]["TestItemsLabel"], exams)
+  if "TestResult" in config["Headers"]:
+    with profile_stage(profiler, "add_examcells"): cells = add_examcells(config["Headers"]["TestResult"], cells)
+  if "Rearrange" in config:
+    with profile_stage(profiler, "rearrange_cells"): cells = rearrange_cells(config["Headers"], cells, config["Rearrange"])
+  if "Consts" in config:
+    expander = ConstExpander(config["Consts"])
+    with profile_stage(profiler, "expandvars"): cells = expandvars(cells, expander)
+    if expander.undefined:
+      logger.warning("undefined constants in %s: %s", source or "<string>", ", ".join(sorted(expander.undefined)))
+  return cells
+
+def build_table_with_includes(config: dict[Any], tests: str, profiler: Profiler | None=None, parallel: int | None=None, select: Selector | None=None) -> tuple[list[list[str]], list[str]]:
+  """
+  試験票(Markdownファイル)からテーブルデータを作成し、インクルードしたファイルの一覧とともに返す
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  parallel: 試験票を並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+  select: 試験項目を選ぶ条件(省略時はすべての試験項目)
+
+  Returns
+  ----
+  (テーブルデータ, 直接・間接にインクルードしたファイルのパスのリスト)
+  """
+  cells = build_table(config, tests, profiler, parallel, select)
+  return (cells, sorted(INCLUDES.dependencies(tests)))
+
+def build_workbook(config: dict[Any], tests: str | None, streaming: bool=False, cells: list[list[str]] | None=None, profiler: Profiler | None=None, template: str | None=None) -> openpyxl.Workbook:
+  """
+  試験票(Markdownファイル)からExcelワークブックを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  cells: 作成済みのテーブルデータ(省略時は試験票から作成する)
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  template: 表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する。streamingは使用できない)
+
+  Returns
+  ----
+  Excelワークブック
+  """
+  config = compile_config(config)
+  if cells is None:
+    cells = build_table(config, tests, profiler)
+  if template is not None:
+    if streaming:
+      raise Exception("A template cannot be used with streaming.")
+    with profile_stage(profiler, "create_excel"): wb = create_excel_template(config, cells, template)
+  elif streaming:
+    with profile_stage(profiler, "create_excel"): wb = create_excel_streaming(config, cells)
+  else:
+    with profile_stage(profiler, "create_excel"): wb = create_excel(config, cells)
+    if config.columnset is not None:
+      with profile_stage(profiler, "adjusttable"): adjusttable(wb.worksheets[-1], config.columnset)
+  if profiler is not None:
+    profiler.count(rows=len(cells) - 1, columns=len(cells[0]), cells=sum(len(line) for line in cells))
+  return wb
+
+def build_file(config: dict[Any], tests: str, out: str, streaming: bool=False, cells: list[list[str]] | None=None, profiler: Profiler | None=None, engine: str="openpyxl", format: str | None=None, parallel: int | None=None, template: str | None=None, select: Selector | None=None) -> tuple[list[list[str]], list[str]] | None:
+  """
+  試験票(Markdownファイル)からExcelファイルを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  out: 出力するExcelファイルのパス
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  cells: 作成済みのテーブルデータ(省略時は試験票から作成する)
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  engine: 出力に使うエンジン(openpyxl、またはopenpyxlを使わずに直接書き出すfast。fastではstreamingは無視される)
+  format: 出力形式(省略時は出力先の拡張子から決める)。xlsx以外ではstreamingとengineは無視される
+  parallel: 試験票を並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+  template: 表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する)
+  select: 試験項目を選ぶ条件(省略時はすべての試験項目。cellsを指定した場合は無視される)
+
+  Returns
+  ----
+  テーブルデータを作成した場合は(テーブルデータ, インクルードしたファイルのパスのリスト)、それ以外はNone
+  """
+  built = None
+  if cells is None:
+    built = build_table_with_includes(config, tests, profiler, parallel, select)
+    cells = built[0]
+  write_file(config, cells, out, streaming, profiler, engine, format, template)
+  return built
+
+def write_file(config: dict[Any], cells: list[list[str]] | Table, out: str, streaming: bool=False, profiler: Profiler | None=None, engine: str="openpyxl", format: str | None=None, template: str | None=None) -> None:
+  """
+  テーブルデータをファイルに出力する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  out: 出力先のパス
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  engine: 出力に使うエンジン(openpyxl、またはopenpyxlを使わずに直接書き出すfast。fastではstreamingは無視される)
+  format: 出力形式(省略時は出力先の拡張子から決める)。xlsx以外ではstreamingとengineは無視される
+  template: 表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する。openpyxlでxlsxを出力する場合のみ)
+  """
+  format = output_format(out, format)
+  if template is not None and (format != "xlsx" or engine != "openpyxl"):
+    raise Exception("A template can only be used for xlsx output with the openpyxl engine.")
+  if format != "xlsx":
+    with profile_stage(profiler, "write"): write_table(config, cells, out, format)
+    if profiler is not None:
+      profiler.count(rows=len(cells) - 1, columns=len(cells[0]), cells=sum(len(line) for line in cells))
+    return
+  if engine == "fast":
+    with profile_stage(profiler, "create_excel"): create_excel_fast(config, cells, out)
+    if profiler is not None:
+      profiler.count(rows=len(cells) - 1, columns=len(cells[0]), cells=sum(len(line) for line in cells))
+    return
+  if engine != "openpyxl":
+    raise Exception(f"Unknown engine: {engine}")
+  path = Path(out)
+  wb = build_workbook(config, None, streaming, cells, profiler, template)
+  if not path.parent.exists(): path.parent.mkdir(parents=True)
+  with profile_stage(profiler, "save"): wb.save(path)
+
+def build_file_cached(config: dict[Any], tests: str, out: str, streaming: bool=False, cache: BuildCache | None=None, profiler: Profiler | None=None, engine: str="openpyxl", format: str | None=None, parallel: int | None=None, template: str | None=None, select: Selector | None=None) -> bool:
+  """
+  キャッシュを使用して試験票(Markdownファイル)からExcelファイルを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  out: 出力するExcelファイルのパス
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  cache: 使用するキャッシュ(省略時はキャッシュを使用しない)
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  engine: 出力に使うエンジン(openpyxlまたはfast)
+  format: 出力形式(省略時は出力先の拡張子から決める)
+  parallel: 試験票を並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+  template: 表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する)
+  select: 試験項目を選ぶ条件(省略時はすべての試験項目)。キャッシュとは併用できない
+
+  Returns
+  ----
+  Excelファイルを書き込んだ場合はTrue、最新のため書き込みを省略した場合はFalse
+  """
+  if cache is None:
+    build_file(config, tests, out, streaming, profiler=profiler, engine=engine, format=format, parallel=parallel, template=template, select=select)
+    return True
+  if select is not None:
+    raise Exception("Selecting test items cannot be used with the build cache.")
+  options = {"mode": "file", "streaming": streaming, "engine": engine, "format": output_format(out, format)}
+  if template is not None:
+    options["template"] = template_key(template)
+  if cache.output_fresh(out, cache.output_key(config, [tests], options)):
+    return False
+  with profile_stage(profiler, "load_cache"): cells = cache.load_table(config, tests)
+  built = build_file(config, tests, out, streaming, cells, profiler, engine, format, parallel, template)
+  if built is not None:
+    cache.store_table(config, tests, *built)
+  cache.store_output(out, cache.output_key(config, [tests], options))
+  return True
+
+def expand_inputs(patterns: list[str], suffix: str=".md") -> list[str]:
+  """
+  ファイルパスないしglobパターンのリストを、ファイルパスのリストに展開する。
+  ディレクトリが指定された場合は、その直下のMarkdownファイル(*.md)に展開する。
+
+  Parameters
+  ----
+  patterns: ファイルパス、ディレクトリパスないしglobパターンのリスト
+  suffix: ディレクトリを展開する際のファイルの拡張子
+
+  Returns
+  ----
+  ファイルパスのリスト(重複は除かれる)
+  """
+  files = []
+  for pattern in patterns:
+    if glob.has_magic(pattern):
+      matches = sorted(glob.glob(pattern, recursive=True))
+    elif Path(pattern).is_dir():
+      matches = sorted(str(f) for f in Path(pattern).glob(f"*{suffix}"))
+    else:
+      matches = [pattern]
+    for m in matches:
+      if not m in files:
+        files.append(m)
+  return files
+
+def run_batch(config: dict[Any], tests: list[str], outdir: str, workers: int | None=None, streaming: bool=False, cache: BuildCache | None=None, engine: str="openpyxl", format: str="xlsx", template: str | None=None, select: Selector | None=None) -> list[tuple[str, str, str | None]]:
+  """
+  複数の試験票からExcelファイルをまとめて作成する。各ファイルはプロセスプールで並列に処理され、
+  一部のファイルが失敗しても残りのファイルの処理は継続される。
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパスのリスト
+  outdir: 出力先ディレクトリ。ファイル名は試験票のファイル名の拡張子を出力形式のもの(.xlsxなど)にしたもの
+  workers: ワーカープロセス数(省略時はCPU数)
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  cache: 使用するキャッシュ(省略時はキャッシュを使用しない)。最新のExcelファイルは書き込みを省略する
+  engine: 出力に使うエンジン(openpyxlまたはfast)
+  format: 出力形式(FORMATSのキー)
+  template: 表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する)。
+    テンプレートはワーカープロセスごとに一度だけ読み込まれる
+  select: 試験項目を選ぶ条件(省略時はすべての試験項目)。キャッシュとは併用できない
+
+  Returns
+  ----
+  (試験票のパス, 出力先のパス, エラーメッセージ)のリスト。成功したファイルのエラーメッセージはNone
+  """
+  from concurrent.futures import ProcessPoolExecutor
+  outputs = [str(Path(outdir) / f"{Path(t).stem}{FORMATS[format]}") for t in tests]
+  if len(set(outputs)) != len(outputs):
+    raise Exception("Duplicate output file names in batch.")
+  if select is not None and cache is not None:
+    raise Exception("Selecting test items cannot be used with the build cache.")
+  options = {"mode": "file", "streaming": streaming, "engine": engine, "format": format}
+  if template is not None:
+    options["template"] = template_key(template)
+  results = []
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = []
+    for t, o in zip(tests, outputs):
+      if cache is None:
+        futures.append(executor.submit(build_file, config, t, o, streaming, engine=engine, format=format, template=template, select=select))
+      elif cache.output_fresh(o, cache.output_key(config, [t], options)):
+        futures.append(None)
+      else:
+        futures.append(executor.submit(build_file, config, t, o, streaming, cache.load_table(config, t), engine=engine, format=format, template=template))
+    for t, o, future in zip(tests, outputs, futures):
+      try:
+        built = future.result() if future is not None else None
+        if cache is not None:
+          if built is not None:
+            cache.store_table(config, t, *built)
+          cache.store_output(o, cache.output_key(config, [t], options))
+        results.append((t, o, None))
+      except Exception as e:
+        results.append((t, o, f"{type(e).__name__}: {e}"))
+  return results
+
+def sheet_title(name: str, used: list[str]) -> str:
+  """
+  ファイル名からExcelのシート名として使える名前を作る
+
+  Parameters
+  ----
+  name: 元となる名前
+  used: 使用済みのシート名のリスト
+
+  Returns
+  ----
+  31文字以内で、Excelで使用できない文字を含まず、使用済みの名前と重複しないシート名
+  """
+  title = re.sub(r"[\\/*?:\[\]]", "_", name)[:31] or "Sheet"
+  i = 1
+  candidate = title
+  while candidate.lower() in [u.lower() for u in used]:
+    i += 1
+    candidate = f"{title[:31 - len(str(i)) - 1]}_{i}"
+  return candidate
+
+def build_tables(config: dict[Any], tests: list[str], workers: int | None=None, cache: BuildCache | None=None) -> list[list[list[str]]]:
+  """
+  複数の試験票からテーブルデータをプロセスプールで並列に作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパスのリスト
+  workers: ワーカープロセス数(省略時はCPU数)
+  cache: 使用するキャッシュ(省略時はキャッシュを使用しない)
+
+  Returns
+  ----
+  試験票ごとのテーブルデータのリスト(testsと同じ順序)
+  """
+  from concurrent.futures import ProcessPoolExecutor
+  tables = [cache.load_table(config, t) if cache is not None else None for t in tests]
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = [executor.submit(build_table_with_includes, config, t) if cells is None else None for t, cells in zip(tests, tables)]
+    for i, (t, future) in enumerate(zip(tests, futures)):
+      if future is None: continue
+      try:
+        cells, includes = future.result()
+      except Exception as e:
+        raise Exception(f"{t}: {e}") from e
+      tables[i] = cells
+      if cache is not None:
+        cache.store_table(config, t, cells, includes)
+  return tables
+
+def build_multisheet(config: dict[Any], tests: list[str], workers: int | None=None, streaming: bool=False, summary: bool=False, cache: BuildCache | None=None, profiler: Profiler | None=None) -> openpyxl.Workbook:
+  """
+  複数の試験票から、試験票ごとにシートを分けた一つのExcelワークブックを作成する。
+  テーブルデータの作成はプロセスプールで並列に行い、ワークブックの組み立てのみ順に行う。
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパスのリスト
+  workers: ワーカープロセス数(省略時はCPU数)
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  summary: 試験票ごとの試験項目数を示すサマリシートを先頭に追加するかどうか
+  cache: 使用するキャッシュ(省略時はキャッシュを使用しない)
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない。テーブルデータの作成はbuild_tablesとしてまとめて計測する)
+
+  Returns
+  ----
+  Excelワークブック
+  """
+  import openpyxl
+  config = compile_config(config)
+  with profile_stage(profiler, "build_tables"): tables = build_tables(config, tests, workers, cache)
+  titles = []
+  for t in tests:
+    titles.append(sheet_title(Path(t).stem, titles + (["Summary"] if summary else [])))
+  wb = openpyxl.Workbook(write_only=streaming)
+  if not streaming:
+    wb.remove(wb.worksheets[0])
+  if summary:
+    create_summary(config, wb, [(t, title, len(cells) - 1) for t, title, cells in zip(tests, titles, tables)])
+  for title, cells in zip(titles, tables):
+    if streaming:
+      with profile_stage(profiler, "create_excel"): create_excel_streaming(config, cells, wb, title)
+    else:
+      with profile_stage(profiler, "create_excel"): create_excel(config, cells, wb, title)
+      if config.columnset is not None:
+        with profile_stage(profiler, "adjusttable"): adjusttable(wb.worksheets[-1], config.columnset)
+    if profiler is not None:
+      profiler.count(rows=len(cells) - 1, columns=len(cells[0]), cells=sum(len(line) for line in cells))
+  return wb
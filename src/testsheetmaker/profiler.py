@@ -0,0 +1,105 @@
+"""
+パイプラインの段階ごとの計測
+"""
+from __future__ import annotations
+from typing import Any, Iterator
+import contextlib
+import cProfile
+import sys
+import time
+try:
+  import resource
+except ImportError:
+  resource = None
+
+class Profiler:
+  """
+  パイプラインの段階ごとに実行時間(経過時間・CPU時間)を計測し、処理量とピークメモリとあわせて報告する
+  """
+  def __init__(self, cprofile: bool=False) -> None:
+    """
+    Parameters
+    ----
+    cprofile: 段階ごとにcProfileでプロファイルを取るかどうか
+    """
+    self.cprofile = cprofile
+    self.stages: dict[str, dict[str, float]] = {}
+    self.counters = {"rows": 0, "columns": 0, "cells": 0}
+    self.profiles: dict[str, cProfile.Profile] = {}
+
+  @contextlib.contextmanager
+  def stage(self, name: str) -> Iterator[None]:
+    """
+    withブロックの処理を一つの段階として計測する。同じ名前の段階は合算する
+
+    Parameters
+    ----
+    name: 段階名
+    """
+    entry = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+    profile = self.profiles.setdefault(name, cProfile.Profile()) if self.cprofile else None
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    if profile is not None: profile.enable()
+    try:
+      yield
+    finally:
+      if profile is not None: profile.disable()
+      entry["wall"] += time.perf_counter() - wall
+      entry["cpu"] += time.process_time() - cpu
+      entry["calls"] += 1
+
+  def count(self, rows: int=0, columns: int=0, cells: int=0) -> None:
+    """
+    処理した行数・列数・セル数を加算する
+    """
+    self.counters["rows"] += rows
+    self.counters["columns"] += columns
+    self.counters["cells"] += cells
+
+  def slowest(self) -> str | None:
+    """
+    経過時間が最も長い段階名を返す(段階がなければNone)
+    """
+    return max(self.stages, key=lambda n: self.stages[n]["wall"]) if self.stages else None
+
+  def report(self) -> dict[str, Any]:
+    """
+    計測結果を返す
+
+    Returns
+    ----
+    stages(段階ごとのwall・cpu・calls)、total、counters、peak_rss(バイト、取得できない環境ではNone)、slowestを持つ辞書
+    """
+    peak = None
+    if resource is not None:
+      # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+      peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+      "stages": {n: dict(v) for n, v in self.stages.items()},
+      "total": {m: sum(v[m] for v in self.stages.values()) for m in ["wall", "cpu"]},
+      "counters": dict(self.counters),
+      "peak_rss": peak,
+      "slowest": self.slowest(),
+    }
+
+  def dump(self, path: str) -> None:
+    """
+    最も遅い段階のcProfileの統計をpstats形式で書き出す
+
+    Parameters
+    ----
+    path: 出力先のパス
+    """
+    if not self.cprofile:
+      raise Exception("cProfile is not enabled")
+    name = self.slowest()
+    if name is None:
+      raise Exception("no stage has been profiled")
+    self.profiles[name].dump_stats(path)
+
+def profile_stage(profiler: Profiler | None, name: str) -> contextlib.AbstractContextManager:
+  """
+  profilerがあればその段階として計測し、なければ何もしないコンテキストマネージャを返す
+  """
+  return profiler.stage(name) if profiler is not None else contextlib.nullcontext()
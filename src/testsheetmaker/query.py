@@ -0,0 +1,285 @@
+"""
+試験項目の選択(--select)と見出しの索引
+
+見出しの階層のglob(`STEP 1/*/正常*`)とタグ(`[smoke]`)で試験項目を選ぶ。試験票ごとに見出しの位置(バイト位置)・
+タグ・&&の有無を記録した索引を試験票の隣(<試験票>.index)に保存し、選択した試験項目の範囲だけを読み込む。
+索引は試験票・インクルードしたファイルが更新されると作り直される。
+"""
+from __future__ import annotations
+from typing import Any, Iterable, Iterator
+from fnmatch import fnmatchcase
+from pathlib import Path
+import json
+import logging
+import os
+import re
+
+from .parser import INCLUDES, RE_HEADING, RE_PREPROCESSOR, RE_SECTION, HeadingNode, IncludeEngine, _iter_exams, split_tags
+
+logger = logging.getLogger("testsheetmaker")
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".index"
+RE_QUERY_TAG = re.compile(r"\[([\w.-]+)\]")
+# a line that an include must leave intact, otherwise the included text continues into the next line
+_SENTINEL = "\0"
+
+class _AllSelector:
+  # numbers every test while building the index
+  def match(self, node: HeadingNode) -> bool:
+    return True
+
+_ALL = _AllSelector()
+
+class Selector:
+  """
+  試験項目を選ぶ条件。条件のいずれかに一致する試験項目が選ばれる。
+
+  各条件は`/`で区切った見出しのglob(上位の見出しから順。指定した階層より下はすべて含む)と、`[タグ]`の並び。
+  タグは見出しの末尾に`[タグ]`の形で付け、下位の見出しにも引き継がれる。条件のタグをすべて持つ試験項目が一致する。
+  globはタグを除いた見出しの名前と照合する(出力される見出しからタグは除かれない)。
+  """
+  def __init__(self, queries: Iterable[str]) -> None:
+    """
+    Parameters
+    ----
+    queries: 条件の文字列のリスト(例: "STEP 1/おおまかな内容", "[smoke]", "STEP */* [smoke] [web]")
+    """
+    self.terms: list[tuple[list[str], frozenset[str]]] = []
+    for query in queries:
+      tags = frozenset(RE_QUERY_TAG.findall(query))
+      glob = RE_QUERY_TAG.sub("", query).strip().strip("/")
+      if glob == "" and not tags:
+        raise ValueError(f"empty select query: {query!r}")
+      self.terms.append(([g.strip() for g in glob.split("/")] if glob != "" else [], tags))
+
+  def match_path(self, path: list[str], tags: frozenset[str]) -> bool:
+    """
+    見出しの階層(タグを除いた名前)とタグ(祖先のものを含む)が条件のいずれかに一致するかどうか
+    """
+    for glob, want in self.terms:
+      if len(glob) <= len(path) and want <= tags and all(fnmatchcase(n.strip(), g) for n, g in zip(path, glob)):
+        return True
+    return False
+
+  def match(self, node: HeadingNode) -> bool:
+    """
+    試験項目の見出しのノードが条件のいずれかに一致するかどうか(iter_recordsのselectとして使われる)
+    """
+    path = []
+    tags = frozenset()
+    for n in node.path:
+      name, own = split_tags(n)
+      path.append(name)
+      tags |= own
+    return self.match_path(path, tags)
+
+def index_path(tests: str | Path) -> Path:
+  """
+  試験票の索引のパス
+  """
+  tests = Path(tests)
+  return tests.with_name(tests.name + INDEX_SUFFIX)
+
+def _mtime(path: str) -> int | None:
+  try:
+    return os.stat(path).st_mtime_ns
+  except OSError:
+    return None
+
+class HeadingIndex:
+  """
+  試験票の見出しの索引。見出しごとに
+  [見出し行の位置, 見出し行の終わりの位置, 本文の終わりの位置, 階層, 名前, タグ, &&を含むか, 試験内容の行を含むか, No]
+  を持つ(位置はバイト単位。名前はタグを除いたもの。Noは試験票全体での階層ごとの番号で、試験項目とならない見出しはNone)。
+  先頭の見出しより前の部分は階層0の見出しとして扱う。
+  """
+  def __init__(self, data: dict[str, Any]) -> None:
+    self.data = data
+    self.entries: list[list[Any]] = data["entries"]
+
+  @classmethod
+  def build(cls, tests: str | Path, includes: IncludeEngine=INCLUDES) -> HeadingIndex:
+    """
+    試験票を読み込んで索引を作成する
+
+    Parameters
+    ----
+    tests: 試験票のファイルパス
+    includes: インクルードの展開に使用するIncludeEngine
+
+    Returns
+    ----
+    索引
+    """
+    tests = str(tests)
+    stat = os.stat(tests)
+    base = Path(tests).parent
+    # the preamble before the first heading can hold a test that "&&" refers to
+    entries = [[0, 0, 0, 0, None, [], False, False, None]]
+    depends = {}
+    state = {"usable": True, "done": False}
+
+    def feed() -> Iterator[str]:
+      offset = 0
+      section = False
+      with open(tests, mode="rb") as f:
+        for raw in f:
+          line = raw.decode("utf-8").rstrip("\r\n")
+          if RE_PREPROCESSOR.match(line):
+            # included lines belong to the enclosing heading, unless they add headings of their own
+            expanded = list(includes.expand([line, _SENTINEL], base))
+            depends.update((d, _mtime(d)) for d in includes.dependencies("<string>"))
+            if expanded[-1:] != [_SENTINEL]:
+              state["usable"] = False
+            lines = expanded[:-1]
+          else:
+            lines = [line]
+          for text in lines:
+            stripped = text.strip()
+            if stripped == "":
+              continue
+            if stripped[0] == "#" and (m := RE_HEADING.match(text)):
+              if text is not line:
+                state["usable"] = False
+                continue
+              entries[-1][2] = offset
+              name, tags = split_tags(m[2])
+              entries.append([offset, offset + len(raw), offset + len(raw), len(m[1]), name, sorted(tags), False, False, None])
+              section = False
+            elif stripped.startswith("::") and (m := RE_SECTION.match(text)):
+              section = True
+              if m[2] == "&&":
+                entries[-1][6] = True
+            elif section:
+              entries[-1][7] = True
+            yield text
+          offset += len(raw)
+      entries[-1][2] = offset
+      state["done"] = True
+
+    # a test is yielded when the parser reads the next heading (its entry is the one before the last) or the end of the file
+    for record in _iter_exams(feed(), retain=False, select=_ALL):
+      entries[-1 if state["done"] else -2][8] = record.number
+    return cls({"version": INDEX_VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns, "includes": depends, "usable": state["usable"], "entries": entries})
+
+  @classmethod
+  def load(cls, tests: str | Path, includes: IncludeEngine=INCLUDES) -> HeadingIndex:
+    """
+    保存された索引を読み込む。索引がないか古い場合は作成して保存する(保存できない場合は保存しない)
+
+    Parameters
+    ----
+    tests: 試験票のファイルパス
+    includes: インクルードの展開に使用するIncludeEngine
+
+    Returns
+    ----
+    索引
+    """
+    path = index_path(tests)
+    try:
+      with open(path, mode="r", encoding="utf-8") as f:
+        index = cls(json.load(f))
+      if index.fresh(tests):
+        return index
+    except (OSError, ValueError, KeyError, TypeError):
+      pass
+    index = cls.build(tests, includes)
+    try:
+      tmp = path.with_name(path.name + ".tmp")
+      with open(tmp, mode="w", encoding="utf-8") as f:
+        json.dump(index.data, f, ensure_ascii=False, separators=(",", ":"))
+      os.replace(tmp, path)
+    except OSError as e:
+      logger.debug("index not saved: %s (%s)", path, e)
+    return index
+
+  def fresh(self, tests: str | Path) -> bool:
+    """
+    試験票・インクルードしたファイルが索引の作成後に更新されていないかどうか
+    """
+    stat = os.stat(tests)
+    return (self.data.get("version") == INDEX_VERSION and self.data["size"] == stat.st_size and self.data["mtime"] == stat.st_mtime_ns
+      and all(_mtime(p) == m for p, m in self.data["includes"].items()))
+
+  def ranges(self, selector: Selector) -> tuple[list[tuple[int, int]], list[list[int]]]:
+    """
+    選択した試験項目を解析するのに必要な範囲を返す。選択した試験項目の本文と、その祖先の見出し行、
+    &&の引き継ぎ元となる直前の試験項目の本文を含む
+
+    Parameters
+    ----
+    selector: 試験項目を選ぶ条件
+
+    Returns
+    ----
+    ((開始位置, 終了位置)のリスト(位置の順で、隣り合う範囲はまとめられる), 選択した試験項目の試験票全体でのNoのリスト)
+    """
+    parents = [None] * len(self.entries)
+    paths: list[list[str]] = [[]] * len(self.entries)
+    tags: list[frozenset[str]] = [frozenset()] * len(self.entries)
+    stack = []
+    bodies = set()
+    numbers = []
+    for i, (_, _, _, level, name, own, amp, _, number) in enumerate(self.entries):
+      if level == 0:
+        continue
+      while stack and self.entries[stack[-1]][3] >= level:
+        stack.pop()
+      parents[i] = stack[-1] if stack else None
+      paths[i] = (paths[parents[i]] if parents[i] is not None else []) + [name]
+      tags[i] = (tags[parents[i]] if parents[i] is not None else frozenset()) | frozenset(own)
+      stack.append(i)
+      if selector.match_path(paths[i], tags[i]):
+        bodies.add(i)
+        if number is not None:
+          numbers.append(number)
+        # "&&" refers to the last test before it, which may have inherited sections by "&&" itself
+        j = i
+        need = amp
+        while need and j > 0:
+          j -= 1
+          bodies.add(j)
+          need = self.entries[j][6] or not self.entries[j][7]
+    headings = set()
+    for i in bodies:
+      j = parents[i]
+      while j is not None and not j in headings:
+        headings.add(j)
+        j = parents[j]
+    result = []
+    for i in sorted(bodies | headings):
+      start, eol, end = self.entries[i][:3]
+      end = end if i in bodies else eol
+      if result and result[-1][1] == start:
+        result[-1] = (result[-1][0], end)
+      elif start < end:
+        result.append((start, end))
+    return (result, numbers)
+
+def select_lines(tests: str | Path, selector: Selector, includes: IncludeEngine=INCLUDES) -> tuple[list[str], list[list[int]]] | None:
+  """
+  索引を使い、選択した試験項目を解析するのに必要な行だけを試験票から読み込む
+
+  Parameters
+  ----
+  tests: 試験票のファイルパス
+  selector: 試験項目を選ぶ条件
+  includes: インクルードの展開に使用するIncludeEngine
+
+  Returns
+  ----
+  (行のリスト(プリプロセッサは展開しない), 選択した試験項目の試験票全体でのNoのリスト(iter_recordsのnumbersに渡す))。
+  インクルードしたファイルが見出しを含むなど索引を使えない場合はNone
+  """
+  index = HeadingIndex.load(tests, includes)
+  if not index.data["usable"]:
+    return None
+  ranges, numbers = index.ranges(selector)
+  chunks = []
+  with open(tests, mode="rb") as f:
+    for start, end in ranges:
+      f.seek(start)
+      chunks.append(f.read(end - start))
+  return (b"".join(chunks).decode("utf-8").split("\n"), numbers)
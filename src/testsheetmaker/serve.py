@@ -0,0 +1,282 @@
+"""
+試験票作成サービス(serveコマンド)
+
+標準ライブラリのみで動くローカルのHTTPサーバ。Markdownと設定名を受け取り、作成した試験票のファイルの内容を
+返す。作成はワーカープロセスのプールで行い、各ワーカーはコンパイル済みの設定データ・インクルードしたファイル・
+読み込んだテンプレートをLRUキャッシュに保持して使い回す。
+"""
+from __future__ import annotations
+from typing import Any
+from pathlib import Path
+from collections import deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import json
+import logging
+import os
+import re
+import socketserver
+import tempfile
+import threading
+import time
+
+from .formats import FORMATS
+
+logger = logging.getLogger("testsheetmaker")
+
+CONTENT_TYPES = {
+  "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+  "csv": "text/csv; charset=utf-8",
+  "tsv": "text/tab-separated-values; charset=utf-8",
+  "jsonl": "application/jsonl; charset=utf-8",
+  "html": "text/html; charset=utf-8",
+}
+# config names map to <configs>/<name>.yml, so they must not contain path separators
+RE_CONFIG_NAME = re.compile(r"^[\w.-]+$")
+# number of recent requests the latency percentiles are computed from
+LATENCY_WINDOW = 1000
+
+# per worker process state, set by _init_worker
+_load = None
+_base = "."
+
+def _init_worker(cachesize: int, base: str) -> None:
+  from .api import load_config
+  from .parser import INCLUDES
+  global _load, _base
+  # keyed by the modification time, so that an edited config is compiled again
+  _load = lru_cache(maxsize=cachesize)(lambda path, mtime: load_config(path))
+  INCLUDES.maxsize = cachesize
+  # request bodies can only include files below the base directory
+  INCLUDES.root = Path(base).resolve()
+  _base = base
+
+def _render(path: str, markdown: str, format: str, engine: str, template: str | None) -> tuple[bytes, dict[str, int]]:
+  # runs in a worker process; returns the output and the cache counters of the worker
+  from .parser import INCLUDES
+  from .pipeline import table_from_lines, write_file
+  from .template import _load_template
+  config = _load(path, os.stat(path).st_mtime_ns)
+  cells = table_from_lines(config, markdown, _base)
+  with tempfile.TemporaryDirectory() as tmp:
+    out = Path(tmp) / f"out{FORMATS[format]}"
+    write_file(config, cells, str(out), engine=engine, format=format, template=template)
+    data = out.read_bytes()
+  info = _load.cache_info()
+  templates = _load_template.cache_info()
+  return (data, {
+    "pid": os.getpid(),
+    "configs": {"size": info.currsize, "hits": info.hits, "misses": info.misses},
+    "fragments": {"size": len(INCLUDES.fragments), "hits": INCLUDES.hits, "misses": INCLUDES.misses, "evictions": INCLUDES.evictions},
+    "templates": {"size": templates.currsize, "hits": templates.hits, "misses": templates.misses},
+  })
+
+class ServiceBusy(Exception):
+  """
+  処理待ちの要求が上限に達している
+  """
+
+class RenderService:
+  """
+  ワーカープロセスのプールで試験票を作成し、要求数・待ち数・処理時間を集計する
+  """
+  def __init__(self, configs: str | Path, base: str | Path=".", workers: int | None=None, queue: int=16, cachesize: int=32, template: str | Path | None=None) -> None:
+    """
+    Parameters
+    ----
+    configs: 設定ファイル(<設定名>.yml)を置いたディレクトリ
+    base: &includeの基準ディレクトリパス
+    workers: ワーカープロセス数(省略時はCPU数)
+    queue: ワーカーの処理を待つことのできる要求数。これを超えた要求はServiceBusyとなる
+    cachesize: ワーカーごとにキャッシュする設定データ・インクルードしたファイルの数
+    template: openpyxlで作成するxlsxの表を書き込むテンプレートのXLSXファイルのパス(省略時は新しいワークブックに出力する)
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    self.configs = Path(configs)
+    self.workers = workers or os.cpu_count() or 1
+    self.queue = queue
+    self.template = str(Path(template).resolve()) if template is not None else None
+    self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(cachesize, str(base)))
+    self.slots = threading.BoundedSemaphore(self.workers + queue)
+    self.lock = threading.Lock()
+    self.started = time.time()
+    self.requests = 0
+    self.errors = 0
+    self.rejected = 0
+    self.inflight = 0
+    self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+    self.caches: dict[int, dict[str, Any]] = {}
+
+  def config_path(self, name: str) -> Path:
+    """
+    設定名に対応する設定ファイルのパスを返す(見つからなければ例外)
+    """
+    if not RE_CONFIG_NAME.match(name):
+      raise FileNotFoundError(f"invalid config name: {name!r}")
+    for ext in [".yml", ".yaml"]:
+      path = self.configs / f"{name}{ext}"
+      if path.is_file():
+        return path
+    raise FileNotFoundError(f"unknown config: {name}")
+
+  def render(self, name: str, markdown: str, format: str="xlsx", engine: str="openpyxl") -> bytes:
+    """
+    Markdownから試験票を作成する
+
+    Parameters
+    ----
+    name: 設定名
+    markdown: 試験票(Markdown)の内容
+    format: 出力形式(FORMATSのキー)
+    engine: xlsxの出力に使うエンジン(openpyxlまたはfast)
+
+    Returns
+    ----
+    出力したファイルの内容
+    """
+    if not format in FORMATS:
+      raise ValueError(f"unknown format: {format}")
+    if not engine in ["openpyxl", "fast"]:
+      raise ValueError(f"unknown engine: {engine}")
+    path = self.config_path(name)
+    if not self.slots.acquire(blocking=False):
+      with self.lock: self.rejected += 1
+      raise ServiceBusy(f"{self.workers + self.queue} requests are already in progress")
+    start = time.perf_counter()
+    with self.lock: self.inflight += 1
+    try:
+      template = self.template if format == "xlsx" and engine == "openpyxl" else None
+      data, caches = self.executor.submit(_render, str(path), markdown, format, engine, template).result()
+    except Exception:
+      with self.lock: self.errors += 1
+      raise
+    finally:
+      with self.lock:
+        self.inflight -= 1
+        self.requests += 1
+        self.latencies.append(time.perf_counter() - start)
+      self.slots.release()
+    with self.lock: self.caches[caches.pop("pid")] = caches
+    return data
+
+  def stats(self) -> dict[str, Any]:
+    """
+    要求数・待ち数・処理時間(直近LATENCY_WINDOW件)・ワーカーのキャッシュの状態を返す
+    """
+    with self.lock:
+      latencies = sorted(self.latencies)
+      caches = list(self.caches.values())
+      def percentile(p: float) -> float | None:
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+      return {
+        "uptime": round(time.time() - self.started, 1),
+        "workers": self.workers,
+        "requests": self.requests,
+        "errors": self.errors,
+        "rejected": self.rejected,
+        "inflight": self.inflight,
+        "queued": max(0, self.inflight - self.workers),
+        "queue_limit": self.queue,
+        "latency_ms": {
+          "count": len(latencies),
+          "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+          "p50": percentile(0.5),
+          "p95": percentile(0.95),
+          "p99": percentile(0.99),
+          "max": percentile(1.0),
+        },
+        "caches": {n: {k: sum(c[n][k] for c in caches) for k in (caches[0][n] if caches else [])} for n in ["configs", "fragments", "templates"]},
+      }
+
+  def close(self) -> None:
+    """
+    ワーカープロセスを終了する
+    """
+    self.executor.shutdown()
+
+class RenderHandler(BaseHTTPRequestHandler):
+  """
+  POST /render?config=<設定名>&format=<形式>&engine=<エンジン> (本文はUTF-8のMarkdown)と GET /stats を処理する
+  """
+  service: RenderService
+  protocol_version = "HTTP/1.1"
+
+  def send(self, status: int, body: bytes, content_type: str) -> None:
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def send_json(self, status: int, value: Any) -> None:
+    self.send(status, json.dumps(value, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+  def do_GET(self) -> None:
+    if urlsplit(self.path).path == "/stats":
+      self.send_json(200, self.service.stats())
+    else:
+      self.send_json(404, {"error": "not found"})
+
+  def do_POST(self) -> None:
+    url = urlsplit(self.path)
+    length = int(self.headers.get("Content-Length") or 0)
+    body = self.rfile.read(length)
+    if url.path != "/render":
+      self.send_json(404, {"error": "not found"})
+      return
+    query = {n: v[-1] for n, v in parse_qs(url.query).items()}
+    format = query.get("format", "xlsx")
+    try:
+      if not "config" in query:
+        raise ValueError("config is required")
+      data = self.service.render(query["config"], body.decode("utf-8"), format, query.get("engine", "openpyxl"))
+    except ServiceBusy as e:
+      self.send_json(503, {"error": str(e)})
+    except PermissionError as e:
+      self.send_json(403, {"error": str(e)})
+    except (ValueError, FileNotFoundError) as e:
+      self.send_json(400 if isinstance(e, ValueError) else 404, {"error": str(e)})
+    except Exception as e:
+      self.send_json(422, {"error": f"{type(e).__name__}: {e}"})
+    else:
+      self.send(200, data, CONTENT_TYPES[format])
+
+  def address_string(self) -> str:
+    # Unix socket clients have no address
+    return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+  def log_message(self, format: str, *args: Any) -> None:
+    logger.info("%s %s", self.address_string(), format % args)
+
+if hasattr(socketserver, "UnixStreamServer"):
+  class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unixドメインソケットで待ち受けるHTTPサーバ
+    """
+    daemon_threads = True
+
+def create_server(service: RenderService, host: str="127.0.0.1", port: int=8765, socket: str | None=None) -> socketserver.BaseServer:
+  """
+  サービスの要求を処理するサーバを作成する(serve_foreverで開始する)
+
+  Parameters
+  ----
+  service: 要求を処理するRenderService
+  host: 待ち受けるアドレス
+  port: 待ち受けるポート(0の場合は空いているポート)
+  socket: 待ち受けるUnixドメインソケットのパス(指定した場合はhost・portは使わない)
+
+  Returns
+  ----
+  サーバ
+  """
+  handler = type("Handler", (RenderHandler,), {"service": service})
+  if socket is not None:
+    if not hasattr(socketserver, "UnixStreamServer"):
+      raise Exception("Unix domain sockets are not available on this platform")
+    # a socket left by a previous server is replaced
+    if Path(socket).is_socket():
+      Path(socket).unlink()
+    return UnixHTTPServer(socket, handler)
+  return ThreadingHTTPServer((host, port), handler)
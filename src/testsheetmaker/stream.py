@@ -0,0 +1,176 @@
+"""
+行単位のパイプライン(--low-memory)
+
+試験票を一行ずつ解析し、試験項目ごとに正規化・試験結果列の追加・並び替え・定数の展開を行った行を
+書き込み専用ワークシートへそのまま書き込む。テーブルデータを作らないため、メモリ使用量は試験項目数に
+比例しない。
+
+試験内容の列と列幅は最初の行を書き込む前に確定している必要があるため、試験票を二度読む(一度目は
+試験内容の名前と列幅を求めるだけ)。設定データのHeaders.Sectionsで試験内容の列を宣言した場合は一度だけ読み、
+列幅はヘッダの値とColumnSetのWidthから決める。
+"""
+from __future__ import annotations
+from typing import Any, Iterable, Iterator
+from pathlib import Path
+import logging
+
+from .parser import ExamRecord, iter_records
+from .table import Table, normalize_rows
+from .excel import cell_width, create_excel_streaming
+from .config import compile_config
+from .consts import ConstExpander
+from .profiler import Profiler, profile_stage
+
+logger = logging.getLogger("testsheetmaker")
+
+def row_shape(config: dict[Any], sections: Iterable[str]) -> Table:
+  """
+  試験結果列の追加と並び替えだけを適用した、行を持たないTableを作成する(Table.arrangeで行を変換する)
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  sections: 試験内容の名前(列の順)
+
+  Returns
+  ----
+  行を持たないTable
+  """
+  config = compile_config(config)
+  labels = config["Headers"]["TestItemsLabel"]
+  shape = Table(["No"] + labels + list(sections), [], len(labels))
+  if "TestResult" in config["Headers"]:
+    shape.add_results(config["Headers"]["TestResult"])
+  if "Rearrange" in config:
+    shape.rearrange(config["Rearrange"])
+  return shape
+
+def expand_row(line: list[str | list[str]], expander: ConstExpander | None) -> list[str | list[str]]:
+  """
+  行の各セルの定数を展開した新しい行を返す(複数行のセルは前の試験項目と共有されていることがあるため書き換えない)
+  """
+  if expander is None:
+    return line
+  return [expander.expand(cell) if type(cell) is str else [expander.expand(t) for t in cell] for cell in line]
+
+def scan_sections(config: dict[Any], exams: Iterable[ExamRecord], expander: ConstExpander | None=None) -> tuple[list[str], list[float]]:
+  """
+  試験項目を一度読み、試験内容の名前と列幅を求める(行は保持しない)
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  exams: 試験項目(iter_recordsなどの出力)
+  expander: 定数の展開に使うConstExpander(設定データにConstsがなければNone)
+
+  Returns
+  ----
+  (試験内容の名前のリスト(normalize_tableのヘッダと同じ順), 並び替え後の列ごとの列幅)
+  """
+  config = compile_config(config)
+  header = {}
+  widths = []
+  for line in normalize_rows(config["Headers"]["TestItemsLabel"], exams, header):
+    line = expand_row(line, expander)
+    if len(widths) < len(line):
+      widths += [0.0] * (len(line) - len(widths))
+    for c, cell in enumerate(line):
+      calcsize = cell_width(cell)
+      if widths[c] < calcsize:
+        widths[c] = calcsize
+  sections = list(header)
+  return (sections, header_widths(config, sections, expander, widths))
+
+def header_widths(config: dict[Any], sections: list[str], expander: ConstExpander | None=None, widths: list[float] | None=None) -> list[float]:
+  """
+  ヘッダ行の値と並び替え前の列ごとの列幅から、並び替え後の列幅を求める
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  sections: 試験内容の名前
+  expander: 定数の展開に使うConstExpander(設定データにConstsがなければNone)
+  widths: 並び替え前の列ごとの列幅(省略時はヘッダ行の値のみから求める)
+
+  Returns
+  ----
+  並び替え後の列ごとの列幅
+  """
+  shape = row_shape(config, sections)
+  widths = list(widths or [])
+  widths += [0.0] * (len(shape.header) + len(shape.results) - len(widths))
+  return [max(w, cell_width(h)) for w, h in zip(shape.arrange(widths), expand_row(shape.row(0), expander))]
+
+def stream_rows(config: dict[Any], exams: Iterable[ExamRecord], sections: list[str], expander: ConstExpander | None=None) -> Iterator[list[str | list[str]]]:
+  """
+  試験項目を一件ずつ正規化・試験結果列の追加・並び替え・定数の展開の順に変換し、ヘッダ行から順に行を返す。
+  table_from_recordsで作成したテーブルデータと同じ行になる
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  exams: 試験項目(iter_recordsなどの出力)
+  sections: 試験内容の名前(列の順)。含まれない試験内容があれば例外とする
+  expander: 定数の展開に使うConstExpander(設定データにConstsがなければNone)
+
+  Returns
+  ----
+  行のイテレータ
+  """
+  config = compile_config(config)
+  shape = row_shape(config, sections)
+  yield expand_row(shape.row(0), expander)
+  header = {n: i for i, n in enumerate(sections)}
+  for line in normalize_rows(config["Headers"]["TestItemsLabel"], exams, header, fixed=True):
+    yield expand_row(shape.arrange(line), expander)
+
+def build_file_stream(config: dict[Any], tests: str, out: str, profiler: Profiler | None=None) -> int:
+  """
+  試験票(Markdownファイル)から、テーブルデータを作らずに行単位でExcelファイルを作成する。
+  出力はbuild_fileでstreamingを指定した場合と同じになる(Headers.Sectionsを宣言した場合は、
+  試験内容の列とその列幅が宣言に従う点が異なる)
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  out: 出力するExcelファイルのパス
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+
+  Returns
+  ----
+  書き込んだ試験項目の数
+  """
+  config = compile_config(config)
+  expander = ConstExpander(config["Consts"]) if "Consts" in config else None
+  def records() -> Iterator[ExamRecord]:
+    with open(tests, mode="r", encoding="utf-8") as f:
+      yield from iter_records(f, Path(tests).parent, tests, retain=False)
+  sections = config["Headers"].get("Sections")
+  if sections is None:
+    with profile_stage(profiler, "scan_sections"): sections, widths = scan_sections(config, records(), expander)
+  else:
+    widths = header_widths(config, sections, expander)
+  count = -1
+  def counted(rows: Iterator[list[str | list[str]]]) -> Iterator[list[str | list[str]]]:
+    nonlocal count
+    for count, line in enumerate(rows):
+      yield line
+  import openpyxl
+  wb = openpyxl.Workbook(write_only=True)
+  try:
+    # parsing and conversion run while the rows are written
+    with profile_stage(profiler, "create_excel"): create_excel_streaming(config, counted(stream_rows(config, records(), sections, expander)), wb, widths=widths)
+  except Exception:
+    # finish the sheets written so far, so that their temporary files are closed
+    for ws in wb.worksheets:
+      ws.close()
+    raise
+  path = Path(out)
+  if not path.parent.exists(): path.parent.mkdir(parents=True)
+  with profile_stage(profiler, "save"): wb.save(path)
+  if expander is not None and expander.undefined:
+    logger.warning("undefined constants in %s: %s", tests, ", ".join(sorted(expander.undefined)))
+  if profiler is not None:
+    profiler.count(rows=count, columns=len(widths), cells=(count + 1) * len(widths))
+  return count
@@ -0,0 +1,298 @@
+"""
+試験項目を示すテーブルデータの作成と加工
+"""
+from __future__ import annotations
+from typing import Any, Iterable, Iterator
+
+class Table:
+  """
+  試験項目を示すテーブルデータ。
+
+  行はcells_normalizationで作られる形(No・試験項目名・試験内容)のまま保持する。試験結果列の追加・
+  列の並び替え・列数の揃えは情報として記録するのみで、行を取り出すときにまとめて適用される。
+  リストのリストと同様に、添字・len・イテレーションで行を取り出せる。
+  """
+  KINDS = ["no", "itemname", "content", "results"]
+
+  def __init__(self, header: list[str], rows: list[list[str]], itemcount: int) -> None:
+    """
+    Parameters
+    ----
+    header: ヘッダ行(No・試験項目名・試験内容)
+    rows: ヘッダ以外の行(末尾の空欄は省略してよい)
+    itemcount: 試験項目名の列数
+    """
+    self.header = header
+    self.rows = rows
+    self.itemcount = itemcount
+    self.results: list[str] = []
+    self.order: list[int] | None = None
+    # config the table was built with (set by testsheetmaker.build)
+    self.config: dict[Any] | None = None
+
+  @property
+  def width(self) -> int:
+    """
+    列数
+    """
+    return len(self.order) if self.order is not None else len(self.header) + len(self.results)
+
+  def kinds(self) -> list[str]:
+    """
+    並び替え前の各列の種類(no, itemname, content, results)を返す
+    """
+    return (["no"] + ["itemname"] * self.itemcount + ["content"] * (len(self.header) - self.itemcount - 1)
+      + ["results"] * len(self.results))
+
+  def columns(self) -> list[str]:
+    """
+    並び替え後の各列の種類(no, itemname, content, results)を返す
+    """
+    kinds = self.kinds()
+    return [kinds[j] for j in self.order] if self.order is not None else kinds
+
+  def add_results(self, examinfo: dict[str | int | list[str]]) -> None:
+    """
+    試験実施確認用の列を追加する。引数はadd_examcellsと同じ
+    """
+    if self.order is not None:
+      raise Exception("Result columns must be added before rearranging.")
+    self.results += examinfo["Labels"] * examinfo["PrintCount"]
+
+  def rearrange(self, arrangeitems: list[str]) -> None:
+    """
+    列を種類ごとに並び替える。何度でも呼び出せる。引数はrearrange_cellsと同じ
+    """
+    kinds = self.kinds()
+    current = self.order if self.order is not None else list(range(len(kinds)))
+    order = []
+    for n in arrangeitems:
+      if not n in self.KINDS:
+        raise Exception("Unknown Item Name!")
+      order += [j for j in current if kinds[j] == n]
+    self.order = order
+
+  def row(self, i: int) -> list[str]:
+    """
+    i行目(0がヘッダ行)を、試験結果列の追加・列数の揃え・並び替えを適用した形で返す
+    """
+    return self.arrange(self.header + self.results) if i == 0 else self.arrange(self.rows[i - 1])
+
+  def arrange(self, line: list[str]) -> list[str]:
+    """
+    ヘッダ以外の行(rowsと同じ形)に、試験結果列の追加・列数の揃え・並び替えを適用した新しい行を返す
+    """
+    pad = len(self.header) + len(self.results) - len(line)
+    line = line + [""] * pad if pad else line.copy()
+    if self.order is not None:
+      line = [line[j] for j in self.order]
+    return line
+
+  def tolist(self) -> list[list[str]]:
+    """
+    リストのリストに変換する
+    """
+    return list(self)
+
+  def __len__(self) -> int:
+    return len(self.rows) + 1
+
+  def __getitem__(self, i: int) -> list[str]:
+    if i < 0: i += len(self)
+    if not 0 <= i < len(self): raise IndexError("Table index out of range")
+    return self.row(i)
+
+  def __iter__(self) -> Iterator[list[str]]:
+    for i in range(len(self)):
+      yield self.row(i)
+
+class ItemNumbering:
+  """
+  試験項目のNo(見出しの階層ごとの連番)を試験項目の順に数える。
+  一部の試験項目だけを出力する場合も、選ばれなかった試験項目を数えることで試験票全体と同じNoを付けられる
+  """
+  def __init__(self) -> None:
+    # numbers of the levels down to the last changed one; the levels below it are self.fill
+    self.ids: list[int] = []
+    self.fill = 0
+    self.names: list[str] = []
+
+  def next(self, items: list[str]) -> list[int]:
+    """
+    次の試験項目のNoを数える
+
+    Parameters
+    ----
+    items: 試験項目の見出しの階層
+
+    Returns
+    ----
+    階層ごとの番号のリスト(リストより下の階層は1)
+    """
+    changed = False
+    for i, n in enumerate(items):
+      if i == len(self.names):
+        self.names.append("")
+      if self.names[i] != n and not changed:
+        if len(self.ids) <= i:
+          self.ids += [self.fill] * (i + 1 - len(self.ids))
+        self.ids[i] += 1
+        del self.ids[i + 1:]
+        self.fill = 1
+        changed = True
+      self.names[i] = n
+    return self.ids + [self.fill] * (len(items) - len(self.ids))
+
+def normalize_table(testitemslabel: list[str], examsmap: Iterable[dict[list[str] | dict[str]]]) -> Table:
+  """
+  試験データの正規化を行い、Tableを作成する
+
+  Parameters
+  ----
+  testitemslabel: 試験項目タイトルを示すラベル
+  examsmap: generate_testlistメソッドの出力値(iter_testlist・iter_recordsのイテレータでもよい)
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ。
+  """
+  header = {}
+  rows = list(normalize_rows(testitemslabel, examsmap, header))
+  return Table(["No"] + testitemslabel + list(header.keys()), rows, len(testitemslabel))
+
+def normalize_rows(testitemslabel: list[str], examsmap: Iterable[dict[list[str] | dict[str]]], header: dict[str, int], fixed: bool=False) -> Iterator[list[str]]:
+  """
+  試験データを一件ずつ正規化し、Tableのrowsと同じ形の行を返す
+
+  Parameters
+  ----
+  testitemslabel: 試験項目タイトルを示すラベル
+  examsmap: generate_testlistメソッドの出力値(iter_testlist・iter_recordsのイテレータでもよい)
+  header: 試験内容の名前と列の位置(試験内容の列の中での位置)の辞書。新しい試験内容は末尾に追加される
+  fixed: headerにない試験内容を例外とするかどうか
+
+  Returns
+  ----
+  行のイテレータ(末尾の空欄は省略される)
+  """
+  tilcount = len(testitemslabel)
+  numbering = ItemNumbering()
+  for exam in examsmap:
+    items = exam["items"]
+    # itemname
+    if tilcount < len(items):
+      raise Exception("Incorrect test data.") 
+    # name count (records of a selected subset carry the number they have in the whole sheet)
+    ids = getattr(exam, "number", None)
+    fill = 1
+    if ids is None:
+      ids = numbering.next(items)
+      fill = numbering.fill
+    line = ["-".join(map(str, ids + [fill] * (tilcount - len(ids))))] + items + [""] * (tilcount - len(items))
+    # preload exams
+    for n in exam["exams"]:
+      if not n in header:
+        if fixed:
+          raise Exception(f"Undeclared section: {n}")
+        header[n] = len(header)
+    examdata = [""] * len(header)
+    for n, v in exam["exams"].items():
+      # copied, because the rows are edited in place later (expandvars) and the parsed records may be cached
+      examdata[header[n]] = list(v) if type(v) is list else v
+    yield line + examdata
+
+def cells_normalization(testitemslabel: list[str], examsmap: list[dict[list[str] | dict[str]]]) -> list[list[str]]:
+  """
+  試験データの正規化を行う
+  
+  Parameters
+  ----
+  testitemslabel: 試験項目タイトルを示すラベル
+  examsmap: generate_testlistメソッドの出力値
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ。
+  """
+  return normalize_table(testitemslabel, examsmap).tolist()
+  
+def add_examcells(examinfo: dict[str | int | list[str]], cells: list[list[str]] | Table) -> list[list[str]] | Table:
+  """
+  試験実施確認用セルを作成する
+
+  Parameters
+  ----
+  examinfo: 試験実施確認用のデータを示す構造体
+    PrintCount: Excel表に出力する試験実施の試行回数。試行回数分の列が追加される
+    Labels: 試験実施のラベル(配列)
+  cells: cells_normalizationの出力値、もしくはTable
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ。
+  """
+  if isinstance(cells, Table):
+    cells.add_results(examinfo)
+    return cells
+  # every row is extended at the widest row's end, which for shorter rows is their own end
+  labels = examinfo["Labels"] * examinfo["PrintCount"]
+  blanks = [""] * len(labels)
+  for i, line in enumerate(cells):
+    line.extend(labels if i == 0 else blanks)
+  return cells
+  
+def rearrange_cells(headers: dict[Any], cells: list[list[str]] | Table, arrangeitems: list[str]) -> list[list[str]] | Table:
+  """
+  テーブルを並び替える。なお、リストのリストを渡した場合、このメソッドは二回以上呼び出しできない
+  (Tableを渡した場合は何度でも呼び出せる)。
+
+  Parameters
+  ----
+  headers: 設定構造体
+  cells: 試験項目を示すテーブルデータ。
+  arrangeitems: 並び順を示すリスト。以下の文字列が必ず含まれる必要がある
+    no: 試験番号列
+    itemname: 試験項目名列
+    content: 試験内容列
+    results: 試験結果列
+
+  Returns
+  ----
+  試験項目を示すテーブルデータ。
+  """
+  if isinstance(cells, Table):
+    cells.rearrange(arrangeitems)
+    return cells
+  no  = cells[0].index("No")
+  ins = cells[0].index(headers["TestItemsLabel"][0])
+  ine = ins + len(headers["TestItemsLabel"]) - 1
+  cont= ine + 1
+  ress= cells[0].index(headers["TestResult"]["Labels"][0])
+  rese= ress + len(headers["TestResult"]["Labels"]) * headers["TestResult"]["PrintCount"]
+  ano = []
+  ain = []
+  acon= []
+  ares= []
+  for c in cells:
+    ano.append(c[no:no + 1])
+    ain.append(c[ins:ine + 1])
+    acon.append(c[cont:ress])
+    ares.append(c[ress:rese])
+  result = [[] for i in range(len(cells))]
+  for n in arrangeitems:
+    match n:
+      case "no":
+        for i, item in enumerate(ano):
+          result[i] += item
+      case "itemname":
+        for i, item in enumerate(ain):
+          result[i] += item
+      case "content":
+        for i, item in enumerate(acon):
+          result[i] += item
+      case "results":
+        for i, item in enumerate(ares):
+          result[i] += item
+      case _:
+        raise Exception("Unknown Item Name!")
+  return result
@@ -0,0 +1,132 @@
+"""
+テンプレートのワークブックへの出力(--template)
+
+表紙・名前の定義・入力規則・条件付き書式・印刷設定などを持つXLSXファイルを読み込み、その中の試験票のシートに
+表を書き込む。入力規則・条件付き書式・印刷範囲のうち、テンプレートの最初のボディ行を含む範囲は
+書き込んだ最終行まで広げられる。
+
+読み込んだテンプレートはプロセスごとにキャッシュし(更新時刻が変わると読み込み直す)、出力ごとにその複製を使う。
+"""
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+from functools import lru_cache
+from pathlib import Path
+import os
+import pickle
+
+from .excel import START_ROW, create_excel, adjusttable
+from .config import compile_config
+
+if TYPE_CHECKING:
+  import openpyxl
+  import openpyxl.worksheet.worksheet as worksheet
+
+# templates kept per process, each as the pickled workbook
+TEMPLATE_CACHE_SIZE = 8
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _load_template(path: str, mtime: int) -> bytes:
+  import openpyxl
+  # unpickling a copy is several times faster than parsing the file again
+  return pickle.dumps(openpyxl.load_workbook(path), pickle.HIGHEST_PROTOCOL)
+
+def open_template(path: str | Path) -> openpyxl.Workbook:
+  """
+  テンプレートのワークブックの複製を返す。読み込みはファイルが更新されるまでキャッシュされる
+
+  Parameters
+  ----
+  path: テンプレートのXLSXファイルのパス
+
+  Returns
+  ----
+  Excelワークブック(呼び出しごとに別のオブジェクト)
+  """
+  path = os.path.abspath(path)
+  wb = pickle.loads(_load_template(path, os.stat(path).st_mtime_ns))
+  for ws in wb.worksheets:
+    # the dimension holders are defaultdicts whose factory is lost by pickling
+    if hasattr(ws, "row_dimensions"):
+      ws.row_dimensions.default_factory = ws._add_row
+      ws.column_dimensions.default_factory = ws._add_column
+  return wb
+
+def template_key(path: str | Path | None) -> list[Any] | None:
+  """
+  ビルドキャッシュのキーに含める、テンプレートのファイルを示す値(パス・更新時刻・サイズ)
+  """
+  if path is None:
+    return None
+  stat = os.stat(path)
+  return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+
+def stretch_ranges(ws: worksheet.Worksheet, lastrow: int) -> None:
+  """
+  最初のボディ行(START_ROW + 1行目)を含む入力規則・条件付き書式・印刷範囲を、lastrow行目まで広げる
+
+  Parameters
+  ----
+  ws: 対象のワークシート
+  lastrow: 表の最終行の行番号
+  """
+  from openpyxl.formatting.formatting import ConditionalFormattingList
+  from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+  def stretch(ranges: MultiCellRange) -> MultiCellRange:
+    result = MultiCellRange()
+    for cr in ranges:
+      if cr.min_row <= START_ROW + 1 <= cr.max_row < lastrow:
+        cr = CellRange(min_col=cr.min_col, min_row=cr.min_row, max_col=cr.max_col, max_row=lastrow)
+      result.add(cr)
+    return result
+  for dv in ws.data_validations.dataValidation:
+    dv.sqref = stretch(dv.sqref)
+  formats = ConditionalFormattingList()
+  for cf in ws.conditional_formatting:
+    sqref = str(stretch(cf.sqref))
+    for rule in cf.rules:
+      formats.add(sqref, rule)
+  ws.conditional_formatting = formats
+  if ws.print_area is not None:
+    # print_area is returned with the sheet name and absolute references
+    ws.print_area = [str(stretch(MultiCellRange(area.split("!")[-1].replace("$", "")))) for area in ws.print_area.split(",")]
+
+def template_sheet(wb: openpyxl.Workbook, name: str | None) -> worksheet.Worksheet | None:
+  """
+  表を書き込むテンプレートのシート(nameのシート、なければNone)を返す。
+  シートの結果見出し行(START_ROW - 1行目)以降のセルと結合は、表で置き換えるため削除される
+  """
+  if name is None or not name in wb.sheetnames:
+    return None
+  ws = wb[name]
+  # input rules, conditional formats and the print area stay and are stretched afterwards
+  for merged in [m for m in ws.merged_cells.ranges if m.max_row >= START_ROW - 1]:
+    ws.unmerge_cells(str(merged))
+  if ws.max_row >= START_ROW - 1:
+    ws.delete_rows(START_ROW - 1, ws.max_row - START_ROW + 2)
+  return ws
+
+def create_excel_template(config: dict[Any], cells: list[list[str]], template: str | Path, sheet: str | None=None) -> openpyxl.Workbook:
+  """
+  テンプレートのワークブックに表を書き込む。create_excel + adjusttableと同じ表を、
+  テンプレートの試験票のシートのSTART_ROW行目以降に書き込み、入力規則・条件付き書式・印刷範囲を広げる
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+  template: テンプレートのXLSXファイルのパス
+  sheet: 表を書き込むシート名(省略時は設定データのSheet.Name)。テンプレートにない場合はシートを追加する
+
+  Returns
+  ----
+  Excelワークブック
+  """
+  config = compile_config(config)
+  wb = open_template(template)
+  ws = template_sheet(wb, sheet if sheet is not None else config.sheetname)
+  create_excel(config, cells, wb, sheet, ws)
+  ws = ws or wb.worksheets[-1]
+  if config.columnset is not None:
+    adjusttable(ws, config.columnset)
+  stretch_ranges(ws, START_ROW + len(cells) - 1)
+  return wb
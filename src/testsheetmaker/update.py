@@ -0,0 +1,211 @@
+"""
+既存のワークブックの更新
+
+試験票を作り直す際に、前回のワークブックで試験実施者が入力した試験結果列の値を、見出しの階層が同じ
+試験項目に引き継ぐ。
+"""
+from __future__ import annotations
+from typing import Any, Iterable
+from pathlib import Path
+import logging
+
+from .config import compile_config
+from .excel import START_ROW
+from .formats import column_kinds
+from .pipeline import build_table, write_file
+from .profiler import Profiler, profile_stage
+from .table import Table
+
+logger = logging.getLogger("testsheetmaker")
+
+def _text(value: Any) -> str:
+  if value is None:
+    return ""
+  return "\n".join(value) if type(value) is list else str(value)
+
+def header_names(config: dict[Any], cells: list[list[str]] | Table) -> list[str]:
+  """
+  シートに書き込まれるヘッダ行の値(ColumnSetのHeader.Replaceを適用したもの)を返す
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ
+
+  Returns
+  ----
+  列ごとのヘッダの値
+  """
+  columnset = compile_config(config).columnset
+  names = []
+  for n in cells[0]:
+    conf = columnset.get(n) if columnset is not None else None
+    names.append(conf.headvalue if conf is not None and conf.header and conf.headvalue is not None else n)
+  return names
+
+def occurrence_keys(values: Iterable[Any]) -> list[tuple]:
+  """
+  値に出現順の番号を付けたキーのリストを返す(同じ値が複数あっても区別できる)
+  """
+  seen = {}
+  keys = []
+  for v in values:
+    n = seen.get(v, 0)
+    seen[v] = n + 1
+    keys.append((v, n))
+  return keys
+
+def row_keys(rows: Iterable[list[Any]], itemcolumns: list[int]) -> list[tuple]:
+  """
+  行ごとに、試験項目名(見出しの階層)と出現順の番号からなるキーを返す
+
+  Parameters
+  ----
+  rows: ヘッダ行を除くテーブルデータ
+  itemcolumns: 試験項目名の列番号(0始まり)
+
+  Returns
+  ----
+  行ごとのキー
+  """
+  return occurrence_keys(tuple(_text(row[c]) if c < len(row) else "" for c in itemcolumns) for row in rows)
+
+def body_texts(config: dict[Any], cells: list[list[Any]], columns: list[int]) -> list[list[str]]:
+  """
+  ヘッダ行以外の行ごとに、指定した列のシートに書き込まれる値(ColumnSetのBody.Replaceを適用したもの)を文字列で返す。
+  前回のワークブックから読んだ値と比較するために使う
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 試験項目を示すテーブルデータ(ヘッダ行を含む)
+  columns: 列番号(0始まり)のリスト
+
+  Returns
+  ----
+  行ごとの、columnsの順の値のリスト
+  """
+  columnset = compile_config(config).columnset
+  replaces = []
+  for c in columns:
+    conf = columnset.get(cells[0][c]) if columnset is not None else None
+    replaces.append(conf.bodyreplace if conf is not None and conf.body else None)
+  texts = []
+  for r, line in enumerate(cells[1:]):
+    values = []
+    for c, replace in zip(columns, replaces):
+      value = line[c] if c < len(line) else None
+      if type(value) is list:
+        value = "\n".join(value)
+      if replace is not None and value is not None:
+        value = replace.apply(value, START_ROW + 1 + r, c + 1)
+      values.append(_text(value))
+    texts.append(values)
+  return texts
+
+def read_sheet(path: str | Path, config: dict[Any]) -> tuple[list[str], list[tuple]]:
+  """
+  ワークブックを読み取り専用で開き、試験票のシートのヘッダ行と以降の行の値を返す
+
+  Parameters
+  ----
+  path: ワークブックのパス
+  config: 設定データを示す構造体(Sheet.Nameのシートがあればそれを、なければ最初のシートを読む)
+
+  Returns
+  ----
+  (ヘッダ行の値, 以降の行の値のリスト)
+  """
+  import openpyxl
+  config = compile_config(config)
+  wb = openpyxl.load_workbook(path, read_only=True)
+  try:
+    ws = wb[config.sheetname] if config.sheetname in wb.sheetnames else wb.worksheets[0]
+    rows = ws.iter_rows(min_row=START_ROW, values_only=True)
+    header = next(rows, None)
+    if header is None:
+      raise Exception(f"{path}: no test table in sheet {ws.title!r}")
+    body = [row for row in rows if any(v is not None for v in row)]
+  finally:
+    wb.close()
+  return ([_text(n) for n in header], body)
+
+def carry_results(config: dict[Any], cells: list[list[str]] | Table, previous: str | Path) -> tuple[list[list[Any]], dict[str, int]]:
+  """
+  前回のワークブックの試験結果列の値を、試験項目名が同じ行に引き継いだテーブルデータを作成する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  cells: 新しい試験項目を示すテーブルデータ
+  previous: 前回のワークブックのパス
+
+  Returns
+  ----
+  (試験結果を引き継いだテーブルデータ, 行数の集計)。集計はunchanged(変更なし)・changed(試験内容の変更あり)・
+  new(追加)・removed(削除)の行数と、行・列がすべて前回と同じ場合に1となるcurrentを持つ
+  """
+  config = compile_config(config)
+  lines = [list(line) for line in cells]
+  kinds = column_kinds(config, cells)
+  newcolumns = occurrence_keys(header_names(config, cells))
+  oldheader, oldrows = read_sheet(previous, config)
+  oldcolumns = {k: i for i, k in enumerate(occurrence_keys(oldheader))}
+  itemcolumns = [c for c, k in enumerate(kinds) if k == "itemname"]
+  olditems = [oldcolumns.get(newcolumns[c]) for c in itemcolumns]
+  if None in olditems:
+    raise Exception(f"{previous}: the test item columns do not match the config")
+  results = [(c, oldcolumns[newcolumns[c]]) for c, k in enumerate(kinds) if k == "results" and newcolumns[c] in oldcolumns]
+  contents = [(c, oldcolumns.get(newcolumns[c])) for c, k in enumerate(kinds) if k == "content"]
+  oldkeys = row_keys(oldrows, olditems)
+  old = dict(zip(oldkeys, oldrows))
+  # the old workbook holds the values after Body Replace, so the new rows are compared the same way
+  texts = body_texts(config, lines, itemcolumns + [c for c, _ in contents])
+  newkeys = occurrence_keys(tuple(text[:len(itemcolumns)]) for text in texts)
+  stats = {"unchanged": 0, "changed": 0, "new": 0, "removed": 0, "current": 0}
+  for key, line, text in zip(newkeys, lines[1:], texts):
+    row = old.pop(key, None)
+    if row is None:
+      stats["new"] += 1
+      continue
+    same = all(t == (_text(row[o]) if o is not None and o < len(row) else "") for t, (_, o) in zip(text[len(itemcolumns):], contents))
+    stats["unchanged" if same else "changed"] += 1
+    for c, o in results:
+      if o < len(row) and row[o] is not None and row[o] != "":
+        line[c] = row[o]
+  stats["removed"] = len(old)
+  lost = [key for key, row in old.items() if any(o < len(row) and row[o] not in (None, "") for _, o in results)]
+  if lost:
+    logger.warning("%d removed test items had results: %s", len(lost), ", ".join(" / ".join(n for n in key[0] if n) for key in lost[:10]) + (" ..." if len(lost) > 10 else ""))
+  if stats["unchanged"] == len(newkeys) and newkeys == oldkeys and [n for n, _ in newcolumns] == oldheader[:len(newcolumns)]:
+    stats["current"] = 1
+  return (lines, stats)
+
+def update_file(config: dict[Any], tests: str, previous: str | Path, out: str | Path | None=None, streaming: bool=False, profiler: Profiler | None=None, force: bool=False, parallel: int | None=None) -> tuple[bool, dict[str, int]]:
+  """
+  試験票(Markdownファイル)からワークブックを作り直し、前回のワークブックで入力された試験結果を引き継ぐ。
+  試験項目がすべて前回と同じで、前回のワークブックに上書きする場合は書き込みを省略する
+
+  Parameters
+  ----
+  config: 設定データを示す構造体
+  tests: 試験票のファイルパス
+  previous: 前回のワークブックのパス
+  out: 出力先のパス(省略時は前回のワークブックに上書きする)
+  streaming: 書き込み専用ワークシートで出力するかどうか
+  profiler: 段階ごとの計測に使うProfiler(省略時は計測しない)
+  force: 試験項目が前回と同じでも書き込むかどうか(書式の設定だけを変えた場合など)
+  parallel: 試験票を並列に解析する最小の行数(省略時は並列化しない。parse_parallelを参照)
+
+  Returns
+  ----
+  (書き込んだかどうか, carry_resultsの行数の集計)
+  """
+  config = compile_config(config)
+  out = Path(out if out is not None else previous)
+  cells = build_table(config, tests, profiler, parallel)
+  with profile_stage(profiler, "carry_results"): lines, stats = carry_results(config, cells, previous)
+  if stats["current"] and not force and out.resolve() == Path(previous).resolve():
+    return (False, stats)
+  write_file(config, lines, str(out), streaming, profiler, "openpyxl", "xlsx")
+  return (True, stats)
@@ -0,0 +1,137 @@
+"""
+監視モード(--watch)
+
+試験票・インクルードしたファイル・コンフィグファイルの更新を監視し、保存されるたびに出力を作り直す。
+常駐している間は読み込んだ設定データ、インクルードしたファイルの内容、最上位の見出しごとの解析結果を
+保持し、変更のあったセクションだけを解析し直す。
+"""
+from __future__ import annotations
+from typing import Callable
+from pathlib import Path
+import logging
+import os
+import time
+
+from .api import load_config
+from .config import Config
+from .parser import SectionParser
+from .pipeline import table_from_records, write_file
+
+logger = logging.getLogger("testsheetmaker")
+
+# seconds between checks of the watched files
+WATCH_INTERVAL = 0.2
+# seconds the watched files have to stay unchanged before a rebuild, so that a burst of saves rebuilds once
+WATCH_DEBOUNCE = 0.3
+
+def _mtime(path: str) -> int | None:
+  try:
+    return os.stat(path).st_mtime_ns
+  except OSError:
+    return None
+
+class Watcher:
+  """
+  一つの試験票を監視して出力を作り直す
+  """
+  def __init__(self, config: str, tests: str, out: str, streaming: bool=False, engine: str="fast", format: str | None=None, template: str | None=None) -> None:
+    """
+    Parameters
+    ----
+    config: コンフィグファイルのパス
+    tests: 試験票のファイルパス
+    out: 出力先のパス
+    streaming: 書き込み専用ワークシートで出力するかどうか
+    engine: 出力に使うエンジン(openpyxlまたはfast)
+    format: 出力形式(省略時は出力先の拡張子から決める)
+    template: 表を書き込むテンプレートのXLSXファイルのパス(engineはopenpyxlであること)
+    """
+    self.configpath = config
+    self.tests = tests
+    self.out = out
+    self.streaming = streaming
+    self.engine = engine
+    self.format = format
+    self.template = template
+    self.config: Config | None = None
+    self.configmtime: int | None = None
+    self.parser = SectionParser()
+    # watched file -> modification time when it was last read
+    self.mtimes: dict[str, int | None] = {}
+
+  def files(self) -> list[str]:
+    """
+    監視するファイル(コンフィグファイル、試験票、テンプレート、直接・間接にインクルードしたファイル)のパスのリスト
+    """
+    return [self.configpath, self.tests] + ([self.template] if self.template is not None else []) + sorted(self.parser.includes.dependencies(self.tests))
+
+  def snapshot(self) -> dict[str, int | None]:
+    """
+    監視するファイルの現在の更新時刻(存在しないファイルはNone)
+    """
+    return {f: _mtime(f) for f in self.files()}
+
+  def changed(self) -> list[str]:
+    """
+    前回の作成以降に更新されたファイルのパスのリスト
+    """
+    return [f for f, m in self.snapshot().items() if self.mtimes.get(f) != m]
+
+  def build(self) -> bool:
+    """
+    出力を作り直す。エラーはログに出力し、監視は継続する
+
+    Returns
+    ----
+    出力を書き込んだかどうか
+    """
+    start = time.perf_counter()
+    # taken before reading, so that a save during the build triggers another build
+    mtimes = self.snapshot()
+    try:
+      if self.config is None or mtimes[self.configpath] != self.configmtime:
+        self.config = load_config(self.configpath)
+        self.configmtime = mtimes[self.configpath]
+        # sections parsed with the previous config are not reused
+        self.parser.sections.clear()
+      with open(self.tests, mode="r", encoding="utf-8") as f:
+        exams = self.parser.parse(f, Path(self.tests).parent, self.tests)
+      cells = table_from_records(self.config, exams, self.tests)
+      write_file(self.config, cells, self.out, self.streaming, None, self.engine, self.format, self.template)
+    except Exception as e:
+      logger.error("NG %s -> %s (%s: %s)", self.tests, self.out, type(e).__name__, e)
+      return False
+    finally:
+      # includes found by this build are read with the modification time kept by the IncludeEngine
+      fragments = self.parser.includes.fragments
+      self.mtimes = {f: mtimes.get(f, fragments[f][0] if f in fragments else _mtime(f)) for f in self.files()}
+    logger.info("ok %s -> %s (%d items, %d of %d sections parsed, %.2fs)", self.tests, self.out, len(cells) - 1, self.parser.parsed, len(self.parser.sections), time.perf_counter() - start)
+    return True
+
+  def run(self, interval: float=WATCH_INTERVAL, debounce: float=WATCH_DEBOUNCE, stop: Callable[[], bool] | None=None) -> None:
+    """
+    出力を作成した後、監視するファイルが更新されるたびに作り直す(Ctrl+Cで終了する)
+
+    Parameters
+    ----
+    interval: 更新を確認する間隔(秒)
+    debounce: 更新を検知してから、ファイルが更新されない状態がこの秒数続くまで作成を待つ
+    stop: 監視を終了するかどうかを返す関数(省略時はCtrl+Cまで監視する)
+    """
+    self.build()
+    logger.info("watching %d files (Ctrl+C to stop)", len(self.mtimes))
+    try:
+      while stop is None or not stop():
+        time.sleep(interval)
+        if not self.changed():
+          continue
+        snapshot = self.snapshot()
+        while True:
+          time.sleep(debounce)
+          current = self.snapshot()
+          if current == snapshot:
+            break
+          snapshot = current
+        self.build()
+    except KeyboardInterrupt:
+      pass
@@ -0,0 +1,57 @@
+import unittest
+import csv
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+class TestApi(unittest.TestCase):
+  TESTS = "# a\n## b\n### c\n#### d\n:: cond\nx\n#### e\n:: cond &&\n"
+
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def test_build(self):
+    table = main.build(self.TESTS, self.config)
+    self.assertIsInstance(table, main.Table)
+    self.assertEqual(table[2][:6], ["1-1-1-2", "a", "b", "c", "e", ["x"]])
+    self.assertIs(table.config, self.config)
+    self.assertEqual(list(main.build(self.TESTS, "./sample/config.yml")), list(table))
+
+  def test_write(self):
+    table = main.build(self.TESTS, self.config)
+    main.write(table, self.dir / "out.xlsx")
+    self.assertEqual(openpyxl.load_workbook(self.dir / "out.xlsx").worksheets[0].cell(main.START_ROW + 2, 5).value, "e")
+    main.write(table, self.dir / "out.txt", format="csv")
+    with open(self.dir / "out.txt", encoding="utf-8", newline="") as f:
+      self.assertEqual(len(list(csv.reader(f))), 3)
+
+  def test_write_without_config(self):
+    with self.assertRaises(Exception):
+      main.write(main.build(self.TESTS, self.config).tolist(), self.dir / "out.csv")
+
+  def test_cli(self):
+    tests = self.dir / "tests.md"
+    tests.write_text(self.TESTS, encoding="utf-8")
+    self.assertEqual(main.main(["-o", str(self.dir / "out.jsonl"), "-c", "./sample/config.yml", str(tests)]), 0)
+    self.assertTrue((self.dir / "out.jsonl").exists())
+
+  def test_lazy_imports(self):
+    code = "import sys, src.main; print(sorted(m for m in ['openpyxl', 'yaml', 'dictknife'] if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    self.assertEqual(result.stdout.strip(), "[]")
+
+if __name__ == "__main__":
+  unittest.main()
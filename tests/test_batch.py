@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+class TestBatch(unittest.TestCase):
+  GOOD = """
+# test
+## testb
+### testc
+:: aaa
+bbb
+"""
+  BAD = """
+# test
+### testc
+:: aaa
+bbb
+"""
+
+  def setUp(self) -> None:
+    with open("./tests/test_config.yml") as f: self.config = yaml.safe_load(f)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def test_batch(self):
+    for name, text in [("a.md", self.GOOD), ("b.md", self.BAD), ("c.md", self.GOOD)]:
+      (self.dir / name).write_text(text, encoding="utf-8")
+    tests = main.expand_inputs([str(self.dir / "*.md")])
+    self.assertEqual([Path(t).name for t in tests], ["a.md", "b.md", "c.md"])
+    results = main.run_batch(self.config, tests, str(self.dir / "out"), workers=2)
+    self.assertEqual([r[2] is None for r in results], [True, False, True])
+    for _, out, error in results:
+      self.assertEqual(Path(out).exists(), error is None)
+    ws = openpyxl.load_workbook(results[0][1]).worksheets[-1]
+    self.assertEqual(ws.cell(main.START_ROW + 1, 2).value, "test")
+
+  def test_duplicate_names(self):
+    with self.assertRaises(Exception):
+      main.run_batch(self.config, ["x/a.md", "y/a.md"], str(self.dir))
@@ -0,0 +1,31 @@
+import unittest
+import tempfile
+
+import yaml
+
+import bench.benchmark as benchmark
+import src.main as main
+
+class TestBenchmark(unittest.TestCase):
+  def test_generate_sheet(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = benchmark.generate_sheet(tmp, 100, depth=3, sections=2, reuse=0.5, includes=10)
+      with open(path, encoding="utf-8") as f:
+        exams = main.generate_testlist(f, base=path.parent, includes=main.IncludeEngine())
+    self.assertEqual(len(exams), 100)
+    self.assertTrue(all(len(e["items"]) == 3 for e in exams))
+    self.assertTrue(all(len(e["exams"]) == 2 for e in exams))
+
+  def test_bench_size(self):
+    with open("./sample/config.yml", encoding="utf-8") as f: config = benchmark.bench_config(yaml.safe_load(f), 4)
+    with tempfile.TemporaryDirectory() as tmp:
+      path = benchmark.generate_sheet(tmp, 20)
+      stages = benchmark.bench_size(config, path)
+    self.assertEqual(list(stages.keys()), benchmark.STAGES)
+    self.assertTrue(all("time" in v and "peak" in v for v in stages.values()))
+
+  def test_compare(self):
+    baseline = {"results": [{"items": 10, "stages": {"save": {"time": 1.0, "peak": 10_000_000}, "create_excel": {"time": 0.001}}}]}
+    current = {"results": [{"items": 10, "stages": {"save": {"time": 1.5, "peak": 10_500_000}, "create_excel": {"time": 0.005}}}]}
+    regressions = benchmark.compare(baseline, current)
+    self.assertEqual([(r["stage"], r["metric"]) for r in regressions], [("save", "time")])
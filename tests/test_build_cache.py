@@ -0,0 +1,66 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import yaml
+
+import src.main as main
+
+class TestBuildCache(unittest.TestCase):
+  def setUp(self) -> None:
+    with open("./tests/test_config.yml") as f: self.config = yaml.safe_load(f)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    self.tests = self.dir / "tests.md"
+    self.tests.write_text('# test\n## testb\n### testc\n:: aaa\nbbb\n&include({"name":"inc.md"})\n', encoding="utf-8")
+    (self.dir / "inc.md").write_text("### testd\n:: aaa\nccc\n", encoding="utf-8")
+    self.out = str(self.dir / "out.xlsx")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def build(self, config=None, force=False) -> tuple[bool, main.BuildCache]:
+    cache = main.BuildCache(self.dir / "cache", force)
+    written = main.build_file_cached(config or self.config, str(self.tests), self.out, cache=cache)
+    cache.save()
+    return (written, cache)
+
+  def test_unchanged(self):
+    written, cache = self.build()
+    self.assertTrue(written)
+    self.assertEqual((cache.hits, cache.misses), ({"tables": 0, "outputs": 0}, {"tables": 1, "outputs": 1}))
+    written, cache = self.build()
+    self.assertFalse(written)
+    self.assertEqual(cache.hits["outputs"], 1)
+
+  def test_include_changed(self):
+    self.build()
+    (self.dir / "inc.md").write_text("### testd\n:: aaa\nddd\n", encoding="utf-8")
+    written, cache = self.build()
+    self.assertTrue(written)
+    self.assertEqual(cache.misses["tables"], 1)
+
+  def test_config_changed(self):
+    self.build()
+    config = yaml.safe_load(yaml.safe_dump(self.config))
+    config["Sheet"]["Name"] = "Other"
+    written, cache = self.build(config)
+    self.assertTrue(written)
+    self.assertEqual((cache.hits["tables"], cache.misses["outputs"]), (1, 1))
+    config["Headers"]["TestItemsLabel"].append("x")
+    written, cache = self.build(config)
+    self.assertEqual(cache.misses["tables"], 1)
+
+  def test_force(self):
+    self.build()
+    written, cache = self.build(force=True)
+    self.assertTrue(written)
+    self.assertEqual(cache.misses, {"tables": 1, "outputs": 1})
+
+  def test_cached_table(self):
+    self.build()
+    Path(self.out).unlink()
+    cache = main.BuildCache(self.dir / "cache")
+    self.assertEqual(cache.load_table(self.config, str(self.tests)), list(main.build_table(self.config, str(self.tests))))
@@ -0,0 +1,106 @@
+import unittest
+import copy
+import tempfile
+from pathlib import Path
+
+import yaml
+
+import src.main as main
+
+class TestConfig(unittest.TestCase):
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.raw = yaml.safe_load(f)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def assertInvalid(self, config, path):
+    with self.assertRaises(Exception) as cm:
+      main.Config(config)
+    self.assertIn(path, str(cm.exception))
+
+  def test_compile(self):
+    config = main.Config(self.raw)
+    self.assertEqual(config, self.raw)
+    self.assertEqual((config.sheetname, config.caption, config.captionheight), ("試験票", "テスト一覧", 18.75))
+    self.assertEqual(config.captionfont, {"name": "游ゴシック", "size": 14})
+    self.assertIs(main.compile_config(config), config)
+
+  def test_resolved_columns(self):
+    columnset = main.Config(self.raw).columnset
+    no = columnset.get("No")
+    self.assertEqual(no.headvalue, "No.")
+    self.assertEqual(no.headalign, {"vertical": "top", "horizontal": "left"})
+    self.assertEqual(no.titlealign, {"vertical": "center", "horizontal": "center"})
+    self.assertEqual(no.bodyvalue, "=ROW()-3")
+    self.assertEqual(no.bodyfont, {"name": "游ゴシック", "size": 10})
+    date = columnset.get("実施日")
+    self.assertEqual((date.width, date.bodyfont["size"], date.bodyalign["wrapText"]), (9, 8, True))
+    self.assertIs(columnset.get("unknown"), columnset.common)
+    self.assertIs(columnset.get(None), columnset.common)
+    self.assertNotIn("TestResultHeader", columnset.columns)
+    self.assertEqual((columnset.titleheight, columnset.headerheight), (24, 36))
+
+  def test_invalid(self):
+    cases = [
+      (lambda c: c["Headers"].pop("TestItemsLabel"), "Headers.TestItemsLabel"),
+      (lambda c: c["Headers"].update(BackColor=2060), "Headers.BackColor"),
+      (lambda c: c["Headers"]["TestResult"].update(PrintCount="2"), "Headers.TestResult.PrintCount"),
+      (lambda c: c["Headers"].update(Sections=["手順", "手順"]), "Headers.Sections"),
+      (lambda c: c["Headers"]["TestResult"].update(Verdict={"Label": "判定"}), "Headers.TestResult.Verdict.Label"),
+      (lambda c: c["Headers"]["TestResult"].update(Verdict={"Pass": "OK"}), "Headers.TestResult.Verdict.Pass"),
+      (lambda c: c.pop("Sheet"), "Sheet"),
+      (lambda c: c["Sheet"].update(Captoin="x"), "Sheet.Captoin"),
+      (lambda c: c["Sheet"].update(Name=123), "Sheet.Name"),
+      (lambda c: c["Sheet"].update(Name=["a"]), "Sheet.Name"),
+      (lambda c: c["Sheet"].update(Name="a/b"), "Sheet.Name"),
+      (lambda c: c["Sheet"].update(Name=""), "Sheet.Name"),
+      (lambda c: c["Sheet"].update(Caption={"a": 1}), "Sheet.Caption"),
+      (lambda c: c["Headers"].update(BackColor="zz"), "Headers.BackColor"),
+      (lambda c: c["Headers"].update(TextColor="FFFFF"), "Headers.TextColor"),
+      (lambda c: c["ColumnSet"]["No"]["Header"].update(FontColor="white"), "ColumnSet.No.Header.FontColor"),
+      (lambda c: c["Sheet"].update(FontColor=255), "Sheet.FontColor"),
+      (lambda c: c.update(Rearrange=["no", False]), "Rearrange"),
+      (lambda c: c.update(Rearrange=["no", "result"]), "Rearrange[1]"),
+      (lambda c: c["ColumnSet"]["No"]["Header"].update(FontSiz=10), "ColumnSet.No.Header.FontSiz"),
+      (lambda c: c["ColumnSet"]["No"]["Body"].update(Width=10), "ColumnSet.No.Body.Width"),
+      (lambda c: c["ColumnSet"]["No"].update(Footer={}), "ColumnSet.No.Footer"),
+      (lambda c: c["ColumnSet"]["HeaderRow"].update(Height="36"), "ColumnSet.HeaderRow.Height"),
+    ]
+    for change, path in cases:
+      config = copy.deepcopy(self.raw)
+      change(config)
+      with self.subTest(path=path):
+        self.assertInvalid(config, path)
+    self.assertInvalid(None, "<root>")
+
+  def test_valid_values(self):
+    config = copy.deepcopy(self.raw)
+    config["Headers"].update(BackColor="FF002060", TextColor="ffffff")
+    config["Sheet"].update(Name="試験票 (1)", Caption=2024)
+    config["ColumnSet"]["No"]["Header"].update(FontColor="00FF00")
+    main.Config(config)
+
+  def test_cached(self):
+    path = self.dir / "config.yml"
+    path.write_text(Path("./sample/config.yml").read_text(encoding="utf-8"), encoding="utf-8")
+    cache = main.BuildCache(self.dir / "cache")
+    config = cache.load_config(path)
+    self.assertFalse(cache.confighit)
+    cache = main.BuildCache(self.dir / "cache")
+    cached = main.load_config(path, cache)
+    self.assertTrue(cache.confighit)
+    self.assertIn("config hit", cache.report())
+    self.assertEqual(cached, config)
+    self.assertEqual(cached.columnset.get("No").bodyvalue, "=ROW()-3")
+    path.write_text(path.read_text(encoding="utf-8").replace("テスト一覧", "一覧"), encoding="utf-8")
+    cached = main.load_config(path, cache)
+    self.assertFalse(cache.confighit)
+    self.assertEqual(cached.caption, "一覧")
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import io
+import tempfile
+import zipfile
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+
+class TestCreateExcelFast(unittest.TestCase):
+  TEST_CELLS = [
+    ["No", "ステップ", "中項目", "小項目", "詳細項目", "cond", "proc"] + ["実施担当", "確認担当", "実施日", "結果"] * 2,
+    ["1-1-1-1", "test", "test", "test", "test", ["testcond", "testcond2"], "testproc"] + [""] * 8,
+    ["1-1-1-2", "test", "test", "test", "test2", "a & <b>", [" leading", "trailing "]] + [""] * 8,
+    ["1-1-2-1", "test", "test", "test3", "test", "", "testproc"] + [""] * 8,
+    ["1-1-2-2", "test", "test", "test3", "short"],
+  ]
+
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.out = Path(self.tmp.name) / "out.xlsx"
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def build_both(self, config=None):
+    config = config or self.config
+    wb = main.create_excel(config, [line.copy() for line in self.TEST_CELLS])
+    if "ColumnSet" in config:
+      main.adjusttable(wb.worksheets[-1], config["ColumnSet"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    expected = openpyxl.load_workbook(buf).worksheets[-1]
+    main.create_excel_fast(config, [line.copy() for line in self.TEST_CELLS], self.out)
+    actual = openpyxl.load_workbook(self.out).worksheets[-1]
+    return expected, actual
+
+  def test_same_values(self):
+    expected, actual = self.build_both()
+    self.assertEqual(actual.title, expected.title)
+    self.assertEqual(actual.max_row, expected.max_row)
+    self.assertEqual(actual.max_column, expected.max_column)
+    for er, ar in zip(expected.iter_rows(), actual.iter_rows()):
+      self.assertEqual([c.value for c in ar], [c.value for c in er])
+    # empty strings are blank cells, as openpyxl writes them
+    self.assertEqual(actual.cell(main.START_ROW + 1, 8).value, None)
+    self.assertEqual(actual.cell(main.START_ROW + 3, 6).value, None)
+
+  def test_same_styles(self):
+    plain = {n: v for n, v in self.config.items() if n != "ColumnSet"}
+    for config in [self.config, plain]:
+      expected, actual = self.build_both(config)
+      for er, ar in zip(expected.iter_rows(min_row=main.START_ROW - 1), actual.iter_rows(min_row=main.START_ROW - 1)):
+        for e, a in zip(er, ar):
+          if e.value is None: continue
+          self.assertEqual(repr(a.font), repr(e.font), e.coordinate)
+          self.assertEqual(repr(a.alignment), repr(e.alignment), e.coordinate)
+          self.assertEqual(repr(a.fill), repr(e.fill), e.coordinate)
+          self.assertEqual(repr(a.border), repr(e.border), e.coordinate)
+
+  def test_layout(self):
+    expected, actual = self.build_both()
+    self.assertEqual(set(map(str, actual.merged_cells.ranges)), set(map(str, expected.merged_cells.ranges)))
+    for r in range(1, main.START_ROW + 1):
+      self.assertEqual(actual.row_dimensions[r].height, expected.row_dimensions[r].height, r)
+    for c in range(1, expected.max_column + 1):
+      letter = openpyxl.utils.get_column_letter(c)
+      self.assertAlmostEqual(actual.column_dimensions[letter].width, expected.column_dimensions[letter].width, msg=letter)
+      self.assertEqual(repr(actual.column_dimensions[letter].font), repr(expected.column_dimensions[letter].font), letter)
+      self.assertEqual(repr(actual.column_dimensions[letter].alignment), repr(expected.column_dimensions[letter].alignment), letter)
+
+  def test_shared_strings(self):
+    main.create_excel_fast(self.config, [line.copy() for line in self.TEST_CELLS], self.out)
+    with zipfile.ZipFile(self.out) as zf:
+      sst = zf.read("xl/sharedStrings.xml").decode("utf-8")
+    self.assertEqual(sst.count("<si>"), len(set(sst.split("<si>")[1:])))
+    self.assertIn("a &amp; &lt;b&gt;", sst)
+
+  def test_illegal_character(self):
+    cells = [line.copy() for line in self.TEST_CELLS]
+    cells[1][1] = "bad\x01"
+    with self.assertRaises(Exception):
+      main.create_excel_fast(self.config, cells, self.out)
+
+  def test_invalid_title(self):
+    for title in ["a/b", "x[1]", "what?"]:
+      with self.subTest(title=title):
+        with self.assertRaises(ValueError):
+          main.create_excel_fast(self.config, [line.copy() for line in self.TEST_CELLS], self.out, title)
+    # the openpyxl engine fails the same way, and no unreadable file is left
+    self.assertFalse(self.out.exists())
+    self.config["Sheet"]["Name"] = "a/b"
+    with self.assertRaises(Exception):
+      main.create_excel_fast(self.config, [line.copy() for line in self.TEST_CELLS], self.out)
+    with self.assertRaises(Exception):
+      main.create_excel(self.config, [line.copy() for line in self.TEST_CELLS])
+    self.assertFalse(self.out.exists())
+    # a long title is written with a warning and can be read back
+    title = "t" * 40
+    with self.assertLogs("testsheetmaker", "WARNING"):
+      main.create_excel_fast({**self.config, "Sheet": {**self.config["Sheet"], "Name": "x"}}, [line.copy() for line in self.TEST_CELLS], self.out, title)
+    self.assertEqual(openpyxl.load_workbook(self.out).sheetnames, [title])
+
+  def test_invalid_color(self):
+    self.config["Headers"]["BackColor"] = "zz"
+    with self.assertRaises(Exception) as cm:
+      main.create_excel_fast(self.config, [line.copy() for line in self.TEST_CELLS], self.out)
+    self.assertIn("Headers.BackColor", str(cm.exception))
+    self.assertFalse(self.out.exists())
+
+  def test_build_file(self):
+    tests = Path(self.tmp.name) / "tests.md"
+    tests.write_text("# a\n## b\n### c\n#### d\n:: cond\nx\n", encoding="utf-8")
+    main.build_file(self.config, str(tests), str(self.out), engine="fast")
+    ws = openpyxl.load_workbook(self.out).worksheets[-1]
+    self.assertEqual(ws.cell(main.START_ROW + 1, 2).value, "a")
+
+  def test_sample_same_values(self):
+    expected = Path(self.tmp.name) / "expected.xlsx"
+    main.build_file(self.config, "./sample/sample.md", str(expected))
+    main.build_file(self.config, "./sample/sample.md", str(self.out), engine="fast")
+    er = [[c.value for c in row] for row in openpyxl.load_workbook(expected).worksheets[-1].iter_rows()]
+    ar = [[c.value for c in row] for row in openpyxl.load_workbook(self.out).worksheets[-1].iter_rows()]
+    self.assertEqual(ar, er)
+    # the result columns are left blank for the tester
+    ws = openpyxl.load_workbook(self.out).worksheets[-1]
+    self.assertTrue(all(c.value is None for row in ws["I4:P6"] for c in row))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import io
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+
+class TestCreateExcelStreaming(unittest.TestCase):
+  TEST_CELLS = [
+    ["No", "ステップ", "中項目", "小項目", "詳細項目", "cond", "proc"] + ["実施担当", "確認担当", "実施日", "結果"] * 2,
+    ["1-1-1-1", "test", "test", "test", "test", ["testcond", "testcond2"], "testproc"] + [""] * 8,
+    ["1-1-1-2", "test", "test", "test", "test2", "testcond", ["testproc"]] + [""] * 8,
+    ["1-1-2-1", "test", "test", "test3", "test", "", "testproc"] + [""] * 8,
+  ]
+
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    return super().setUp()
+
+  def reload(self, wb: openpyxl.Workbook) -> openpyxl.Workbook:
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return openpyxl.load_workbook(buf)
+
+  def build_both(self):
+    wb = main.create_excel(self.config, [line.copy() for line in self.TEST_CELLS])
+    main.adjusttable(wb.worksheets[-1], self.config["ColumnSet"])
+    expected = self.reload(wb).worksheets[-1]
+    actual = self.reload(main.create_excel_streaming(self.config, [line.copy() for line in self.TEST_CELLS])).worksheets[-1]
+    return expected, actual
+
+  def test_same_values(self):
+    expected, actual = self.build_both()
+    self.assertEqual(actual.title, expected.title)
+    self.assertEqual(actual.max_row, expected.max_row)
+    self.assertEqual(actual.max_column, expected.max_column)
+    for er, ar in zip(expected.iter_rows(), actual.iter_rows()):
+      self.assertEqual([c.value for c in ar], [c.value for c in er])
+
+  def test_same_styles(self):
+    expected, actual = self.build_both()
+    for er, ar in zip(expected.iter_rows(min_row=main.START_ROW - 1), actual.iter_rows(min_row=main.START_ROW - 1)):
+      for e, a in zip(er, ar):
+        if e.value is None: continue
+        self.assertEqual(repr(a.font), repr(e.font), e.coordinate)
+        self.assertEqual(repr(a.alignment), repr(e.alignment), e.coordinate)
+        self.assertEqual(repr(a.fill), repr(e.fill), e.coordinate)
+        self.assertEqual(repr(a.border), repr(e.border), e.coordinate)
+
+  def test_layout(self):
+    expected, actual = self.build_both()
+    self.assertEqual(set(map(str, actual.merged_cells.ranges)), set(map(str, expected.merged_cells.ranges)))
+    for r in range(1, main.START_ROW + 1):
+      self.assertEqual(actual.row_dimensions[r].height, expected.row_dimensions[r].height, r)
+    for c in range(1, expected.max_column + 1):
+      letter = openpyxl.utils.get_column_letter(c)
+      self.assertAlmostEqual(actual.column_dimensions[letter].width, expected.column_dimensions[letter].width, msg=letter)
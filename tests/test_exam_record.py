@@ -0,0 +1,60 @@
+import unittest
+import pickle
+
+import src.main as main
+
+class TestExamRecord(unittest.TestCase):
+  TESTS = (
+    "# a\n## b\n### c\n:: aaa\n* same\nx\n:: bbb\ny\n"
+    "### d\n:: aaa &&\n:: bbb &&\nz\n"
+    "## e\n### c\n:: aaa\n* same\n"
+    "# a\n## b\n### c\n:: bbb\nw\n"
+  )
+
+  def setUp(self) -> None:
+    self.records = list(main.iter_records(self.TESTS))
+    return super().setUp()
+
+  def test_same_as_dict(self):
+    self.assertEqual(self.records, main.generate_testlist(self.TESTS))
+    self.assertEqual([r.asdict() for r in self.records], main.generate_testlist(self.TESTS))
+    self.assertEqual(self.records[0]["items"], ["a", "b", "c"])
+    self.assertEqual(self.records[0]["exams"], {"aaa": ["* same", "x"], "bbb": ["y"]})
+    self.assertEqual(list(self.records[0].keys()), ["items", "exams"])
+    with self.assertRaises(KeyError):
+      self.records[0]["other"]
+
+  def test_trie(self):
+    first, second, third, fourth = self.records
+    self.assertIs(first.node.parent, second.node.parent)
+    self.assertEqual(third.items, ["a", "e", "c"])
+    # a repeated path points to the same node, and the same path list
+    self.assertIs(fourth.node, first.node)
+    self.assertIs(fourth.items, first.items)
+    self.assertEqual(first.node.ancestor(1).name, "a")
+
+  def test_shared_storage(self):
+    first, second, third, _ = self.records
+    self.assertIs(second.exams["aaa"], first.exams["aaa"])
+    self.assertEqual(second.exams["bbb"], ["y", "z"])
+    self.assertIsNot(second.exams["bbb"], first.exams["bbb"])
+    self.assertEqual(first.exams["bbb"], ["y"])
+    # equal lines and names share one string object
+    self.assertIs(third.exams["aaa"][0], first.exams["aaa"][0])
+    self.assertIs(third.node.name, first.node.name)
+
+  def test_slots(self):
+    with self.assertRaises(AttributeError):
+      self.records[0].extra = 1
+
+  def test_normalize(self):
+    labels = ["l", "m", "s"]
+    self.assertEqual(main.normalize_table(labels, self.records).tolist(), main.cells_normalization(labels, main.generate_testlist(self.TESTS)))
+
+  def test_pickle(self):
+    records = pickle.loads(pickle.dumps(self.records))
+    self.assertEqual(records, self.records)
+    self.assertIs(records[3].node, records[0].node)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+import src.main as main
+
+class TestExpandvars(unittest.TestCase):
+  CONSTS = {"env": "staging", "host": "{{env}}.example.com", "url": "https://{{host}}/"}
+
+  def test_table(self):
+    cells = [["No", "{{env}}"], ["1", ["open {{url}}", "plain"]]]
+    data = main.expandvars(cells, self.CONSTS)
+    self.assertEqual(data, [["No", "staging"], ["1", ["open https://staging.example.com/", "plain"]]])
+
+  def test_string(self):
+    self.assertEqual(main.expandvars("{{env}}/{{env}}", self.CONSTS), "staging/staging")
+    self.assertEqual(main.expandvars("no consts", self.CONSTS), "no consts")
+
+  def test_undefined(self):
+    expander = main.ConstExpander({"a": "{{b}}-{{c}}", "c": "C"})
+    self.assertEqual(expander.expand("{{a}} {{d}}"), "{{b}}-C {{d}}")
+    self.assertEqual(expander.undefined, {"b", "d"})
+
+  def test_circular(self):
+    with self.assertRaises(Exception):
+      main.ConstExpander({"a": "{{b}}", "b": "x{{c}}", "c": "{{a}}"})
+    with self.assertRaises(Exception):
+      main.ConstExpander({"a": "{{a}}"})
@@ -0,0 +1,86 @@
+import unittest
+import io
+import pickle
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+class TestExpression(unittest.TestCase):
+  def test_evaluate(self):
+    cases = [
+      ('"%%".upper()', "ab", "AB"),
+      ("%%.upper()", "ab", "AB"),
+      ("int(%%) * 2 if %% else ''", "21", 42),
+      ('"No." + str(row - 3)', "x", "No.2"),
+      ("value[1:] + value[0]", "abc", "bca"),
+      ("len(%%) > 2 and 'long' or 'short'", "ab", "short"),
+      ("'x' if 'b' in %% else 'y'", "abc", "x"),
+      ("col * 10 + row", "", 25),
+      ("%%.replace('-', '/').zfill(6)", "1-2", "0001/2"),
+    ]
+    for source, value, expected in cases:
+      with self.subTest(source=source):
+        self.assertEqual(main.Expression(source).evaluate(value, 5, 2), expected)
+
+  def test_numeric_value(self):
+    # %% outside a string literal is a number when the cell looks like one, as when it was pasted into the source
+    self.assertEqual(main.compile_replacement("@%%*2").apply("3", 1, 1), 6)
+    self.assertEqual(main.compile_replacement("@%%+1").apply("1.5", 1, 1), 2.5)
+    self.assertEqual(main.compile_replacement("@%% * 2").apply("ab", 1, 1), "abab")
+    self.assertEqual(main.compile_replacement("@'%%' * 2").apply("3", 1, 1), "33")
+    self.assertEqual(main.compile_replacement("@value * 2").apply("3", 1, 1), "33")
+
+  def test_uses(self):
+    self.assertEqual(main.Expression("col * 2").uses, {"col"})
+    self.assertEqual(main.Replacement("@col").column(["a", "b"], 1, 3), [3, 3])
+
+  def test_rejected(self):
+    for source in ['__import__("os")', "value.__class__", "(lambda: 1)()", "open('x')", "x + 1", "[value]", "f'{value}'", "value.split()"]:
+      with self.subTest(source=source):
+        with self.assertRaises(Exception):
+          main.Expression(source)
+
+  def test_limits(self):
+    for source in ["'a' * 10 ** 6", "2 ** 10 ** 5", "%%.zfill(10 ** 6)"]:
+      with self.subTest(source=source):
+        with self.assertRaises(Exception):
+          main.Expression(source).evaluate("a", 1, 1)
+
+  def test_column(self):
+    replace = main.Replacement("@%%.lower() + str(row)")
+    self.assertEqual(replace.column(["A", None, "B"], 4, 1), ["a4", None, "b6"])
+    self.assertEqual(replace.column(["A", "B"], 4, 1), [replace.apply("A", 4, 1), replace.apply("B", 5, 1)])
+    self.assertEqual(main.Replacement("@'fixed'").column(["a", "b"]), ["fixed", "fixed"])
+    self.assertEqual(main.Replacement("<%%>").column(["a", None]), ["<a>", None])
+
+  def test_cell_value_is_not_evaluated(self):
+    self.assertEqual(main.body_value("%%", "@__import__('os')"), "@__import__('os')")
+    self.assertEqual(main.body_value("@%%", "1+1"), "1+1")
+
+  def test_pickle(self):
+    replace = pickle.loads(pickle.dumps(main.Replacement("@%%.upper()")))
+    self.assertEqual(replace.apply("a"), "A")
+
+  def test_config(self):
+    with open("./sample/config.yml", encoding="utf-8") as f: config = yaml.safe_load(f)
+    del config["Headers"]["TestResult"]
+    config["ColumnSet"]["中項目"] = {"Body": {"Replace": "@%%.upper() + str(row)"}}
+    cells = [["No", "ステップ", "中項目"], ["1", "a", "b"], ["2", "c", "d"]]
+    wb = main.create_excel(config, [line.copy() for line in cells])
+    main.adjusttable(wb.worksheets[-1], main.Config(config).columnset)
+    ws = wb.worksheets[-1]
+    self.assertEqual([ws.cell(r, 3).value for r in (4, 5)], ["B4", "D5"])
+    out = io.BytesIO()
+    main.create_excel_fast(config, [line.copy() for line in cells], out)
+    out.seek(0)
+    fast = openpyxl.load_workbook(out).worksheets[-1]
+    self.assertEqual([fast.cell(r, 3).value for r in (4, 5)], ["B4", "D5"])
+    config["ColumnSet"]["中項目"]["Body"]["Replace"] = "@eval(%%)"
+    with self.assertRaises(Exception) as cm:
+      main.Config(config)
+    self.assertIn("ColumnSet.中項目.Body.Replace", str(cm.exception))
+
+if __name__ == "__main__":
+  unittest.main()
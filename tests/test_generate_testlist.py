@@ -1,3 +1,4 @@
+import io
 import unittest
 import src.main as main
 
@@ -190,3 +191,37 @@ class TestGenerateTestlist(unittest.TestCase):
     self.assertEqual(data[0]["exams"], {"aaa": ["bbb"], "bbb": ["ccc"]})
     self.assertEqual(data[1]["items"], ["test", "teste", "testf"])
     self.assertEqual(data[1]["exams"], {"aaa": ["bbb"], "bbb": ["ccc"]})
+
+  def test_ampersand_append(self):
+    testdata = """
+    # test
+    ## testb
+    :: aaa
+    bbb
+    ## testc
+    :: aaa &&
+    ccc"""
+    data = main.generate_testlist(testdata)
+    self.assertEqual(len(data), 2)
+    self.assertEqual(data[0]["exams"], {"aaa": ["bbb"]})
+    self.assertEqual(data[1]["exams"], {"aaa": ["bbb", "ccc"]})
+
+  def test_iterator(self):
+    testdata = """
+    # test
+    ## testb
+    :: aaa
+    bbb
+    ## testc
+    :: aaa
+    ccc"""
+    it = main.iter_testlist(testdata.split("\n"))
+    self.assertEqual(next(it), {"items": ["test", "testb"], "exams": {"aaa": ["bbb"]}})
+    self.assertEqual(next(it), {"items": ["test", "testc"], "exams": {"aaa": ["ccc"]}})
+    with self.assertRaises(StopIteration):
+      next(it)
+
+  def test_file_object(self):
+    f = io.StringIO("# test\n## testb\n:: aaa\nbbb\n\n:: bbb\nccc\n")
+    data = main.generate_testlist(f)
+    self.assertEqual(data, [{"items": ["test", "testb"], "exams": {"aaa": ["bbb"], "bbb": ["ccc"]}}])
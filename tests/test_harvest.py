@@ -0,0 +1,100 @@
+import unittest
+import csv
+import json
+import tempfile
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+class TestHarvest(unittest.TestCase):
+  TESTS = "# A\n## a\n### x\n#### y\n:: 手順\nq\n#### z\n:: 手順\ns\n# B\n## b\n### x\n#### y\n:: 手順\nt\n"
+
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = main.Config(yaml.safe_load(f))
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    (self.dir / "tests.md").write_text(self.TESTS, encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def workbook(self, name, results):
+    """
+    results: 行ごとの(1回目, 2回目)の結果
+    """
+    out = self.dir / name
+    main.build_file(self.config, str(self.dir / "tests.md"), str(out))
+    wb = openpyxl.load_workbook(out)
+    ws = wb.worksheets[0]
+    header = [c.value for c in ws[main.START_ROW]]
+    columns = [c + 1 for c, v in enumerate(header) if v == "結果"]
+    for r, values in enumerate(results):
+      for c, v in zip(columns, values):
+        ws.cell(main.START_ROW + 1 + r, c).value = v
+    wb.save(out)
+    return str(out)
+
+  def test_sheet_columns(self):
+    self.assertEqual(main.sheet_columns(self.config, ["No.", "STEP", "中項目", "小項目", "詳細項目", "手順", "結果", "実施日", "結果"]), ([1, 2, 3, 4], [6, 8]))
+    self.assertIsNone(main.sheet_columns(self.config, ["File", "Sheet", "Items"]))
+
+  def test_classify(self):
+    _, passed, failed = main.verdict_rules(self.config)
+    self.assertEqual([main.classify(v, passed, failed) for v in ["ok", " NG ", "保留", None, "", 1]], [0, 1, 2, 3, 3, 2])
+
+  def test_harvest_workbook(self):
+    path = self.workbook("one.xlsx", [("NG", "OK"), ("OK", None), (None, None)])
+    harvest = main.harvest_workbook(self.config, path)
+    self.assertEqual(harvest.files, [(path, ["試験票"], 3, None)])
+    self.assertEqual(harvest.items(), 3)
+    self.assertEqual(harvest.counts[((), 1)], [1, 1, 0, 1])
+    self.assertEqual(harvest.counts[((), 2)], [1, 0, 0, 2])
+    self.assertEqual(harvest.counts[((), main.LATEST)], [2, 0, 0, 1])
+    self.assertEqual(harvest.counts[(("A",), main.LATEST)], [2, 0, 0, 0])
+    self.assertEqual(harvest.counts[(("A", "a", "x", "z"), 1)], [1, 0, 0, 0])
+    self.assertEqual(main.harvest_workbook(self.config, path, levels=1).counts.keys(), {(p, a) for p in [(), ("A",), ("B",)] for a in [1, 2, main.LATEST]})
+
+  def test_harvest_files(self):
+    paths = [self.workbook(f"{i}.xlsx", [("OK", None), ("NG", "OK"), (None, None)]) for i in range(3)]
+    broken = self.dir / "broken.xlsx"
+    broken.write_text("not a workbook")
+    with self.assertLogs("testsheetmaker", "ERROR"):
+      harvest = main.harvest_files(self.config, paths + [str(broken)], workers=2)
+    self.assertEqual(harvest.items(), 9)
+    self.assertEqual(harvest.counts[((), main.LATEST)], [6, 0, 0, 3])
+    self.assertEqual(len(harvest.files), 4)
+    self.assertIsNotNone(dict((f[0], f[3]) for f in harvest.files)[str(broken)])
+    sequential = main.harvest_files(self.config, paths, workers=1)
+    self.assertEqual(sequential.counts, main.harvest_files(self.config, paths, workers=2).counts)
+
+  def test_multisheet(self):
+    (self.dir / "second.md").write_text(self.TESTS, encoding="utf-8")
+    wb = main.build_multisheet(self.config, [str(self.dir / "tests.md"), str(self.dir / "second.md")], workers=1, summary=True)
+    wb.save(self.dir / "sheets.xlsx")
+    harvest = main.harvest_workbook(self.config, str(self.dir / "sheets.xlsx"))
+    self.assertEqual(harvest.files[0][1:], (["tests", "second"], 6, None))
+
+  def test_cli(self):
+    self.workbook("one.xlsx", [("NG", "OK"), ("OK", None), (None, None)])
+    self.workbook("two.xlsx", [("OK", None), ("OK", None), ("OK", None)])
+    (self.dir / "out").mkdir()
+    out = self.dir / "out" / "summary.json"
+    self.assertEqual(main.main(["harvest", "-c", "./sample/config.yml", "-o", str(out), "--workbook", str(self.dir / "out" / "summary.xlsx"), str(self.dir)]), 0)
+    summary = json.loads(out.read_text(encoding="utf-8"))
+    self.assertEqual((summary["items"], summary["attempts"], len(summary["files"])), (6, 2, 2))
+    self.assertEqual(summary["levels"][0]["attempts"]["latest"], {"pass": 5, "fail": 0, "other": 0, "blank": 1})
+    self.assertEqual(summary["levels"][1]["path"], ["A"])
+    self.assertEqual(main.main(["harvest", "-c", "./sample/config.yml", "-o", str(self.dir / "summary.csv"), str(self.dir / "*.xlsx")]), 0)
+    with open(self.dir / "summary.csv", encoding="utf-8-sig") as f: rows = list(csv.reader(f))
+    self.assertEqual(rows[0], ["level", "ステップ", "中項目", "小項目", "詳細項目", "attempt", "pass", "fail", "other", "blank"])
+    self.assertEqual(rows[1], ["0", "", "", "", "", "1", "4", "1", "0", "1"])
+    ws = openpyxl.load_workbook(self.dir / "out" / "summary.xlsx")["Harvest"]
+    self.assertEqual([c.value for c in ws[3]][:5], ["Total", None, None, None, 4])
+
+if __name__ == "__main__":
+  unittest.main()
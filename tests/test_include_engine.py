@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+from pathlib import Path
+
+import src.main as main
+
+class TestIncludeEngine(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    self.engine = main.IncludeEngine()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def write(self, name: str, text: str) -> Path:
+    path = self.dir / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+  def test_nested(self):
+    self.write("outer.md", '## //**title**//\n&include({"name":"sub/inner.md","value":"//**title**//-x"})\n')
+    self.write("sub/inner.md", ":: aaa\n//**value**//\n")
+    testdata = """
+    # test
+    &include({"name":"outer.md","title":"testb"})"""
+    data = main.generate_testlist(testdata, self.dir, includes=self.engine)
+    self.assertEqual(data, [{"items": ["test", "testb"], "exams": {"aaa": ["testb-x"]}}])
+
+  def test_circular(self):
+    self.write("a.md", '&include({"name":"b.md"})\n')
+    self.write("b.md", '&include({"name":"a.md"})\n')
+    with self.assertRaises(Exception):
+      main.generate_testlist('&include({"name":"a.md"})', self.dir, includes=self.engine)
+
+  def test_cache(self):
+    path = self.write("frag.md", "aaa //**x**// bbb //**y**//")
+    self.assertEqual(self.engine.render(path, {"x": "1", "y": "2"}), "aaa 1 bbb 2")
+    self.assertEqual(self.engine.render(path, {"x": "3"}), "aaa 3 bbb //**y**//")
+    self.assertEqual(len(self.engine.fragments), 1)
+    path.write_text("ccc //**x**//", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    self.assertEqual(self.engine.render(path, {"x": "4"}), "ccc 4")
+
+  def test_dependency_graph(self):
+    self.write("main.md", '&include({"name":"a.md"})\n&include({"name":"b.md"})\n')
+    self.write("a.md", '&include({"name":"c.md"})\n')
+    self.write("b.md", "")
+    self.write("c.md", "")
+    source = self.dir / "main.md"
+    with open(source, encoding="utf-8") as f:
+      main.generate_testlist(f, self.dir, source=source, includes=self.engine)
+    graph = self.engine.dependency_graph()
+    resolved = lambda n: str((self.dir / n).resolve())
+    self.assertEqual(graph[resolved("main.md")], [resolved("a.md"), resolved("b.md")])
+    self.assertEqual(graph[resolved("a.md")], [resolved("c.md")])
+    self.assertEqual(self.engine.dependencies(source), {resolved("a.md"), resolved("b.md"), resolved("c.md")})
@@ -0,0 +1,50 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import yaml
+
+import src.main as main
+
+class TestMultisheet(unittest.TestCase):
+  TESTS = """
+# test
+## testb
+### testc
+:: aaa
+bbb
+### testd
+:: aaa
+ccc
+"""
+
+  def setUp(self) -> None:
+    with open("./tests/test_config.yml") as f: self.config = yaml.safe_load(f)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    for name in ["first.md", "second.md"]:
+      (self.dir / name).write_text(self.TESTS, encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def test_sheets(self):
+    tests = main.expand_inputs([str(self.dir)])
+    wb = main.build_multisheet(self.config, tests, workers=2)
+    self.assertEqual(wb.sheetnames, ["first", "second"])
+    for ws in wb.worksheets:
+      self.assertEqual([c.value for c in ws[main.START_ROW + 2]][:4], ["1-1-2", "test", "testb", "testd"])
+
+  def test_summary(self):
+    tests = main.expand_inputs([str(self.dir)])
+    wb = main.build_multisheet(self.config, tests, workers=2, summary=True)
+    self.assertEqual(wb.sheetnames, ["Summary", "first", "second"])
+    rows = [[c.value for c in r] for r in wb["Summary"].rows]
+    self.assertEqual(rows[1:], [[tests[0], "first", 2], [tests[1], "second", 2], ["Total", None, 4]])
+
+  def test_sheet_title(self):
+    self.assertEqual(main.sheet_title("a[1]:b", []), "a_1__b")
+    self.assertEqual(main.sheet_title("x" * 40, []), "x" * 31)
+    self.assertEqual(main.sheet_title("Test", ["test"]), "Test_2")
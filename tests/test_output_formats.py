@@ -0,0 +1,84 @@
+import unittest
+import csv
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+import src.main as main
+
+class TestOutputFormats(unittest.TestCase):
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.config["Rearrange"] = ["no", "itemname", "results", "content"]
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    self.tests = self.dir / "tests.md"
+    self.tests.write_text("# a\n## b\n### c\n#### d\n:: cond\n* x\n* <y> & z\n:: proc\np\n#### e\n:: proc\nq\n", encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def test_output_format(self):
+    self.assertEqual(main.output_format("a/b.CSV"), "csv")
+    self.assertEqual(main.output_format("b.htm"), "html")
+    self.assertEqual(main.output_format("b.xlsx"), "xlsx")
+    self.assertEqual(main.output_format("b.out"), "xlsx")
+    self.assertEqual(main.output_format("b.csv", "jsonl"), "jsonl")
+    with self.assertRaises(Exception):
+      main.output_format("b.csv", "pdf")
+
+  def test_csv(self):
+    out = self.dir / "out.csv"
+    main.build_file(self.config, str(self.tests), str(out))
+    with open(out, encoding="utf-8", newline="") as f: rows = list(csv.reader(f))
+    self.assertEqual(rows, [list(map(main.cell_text, line)) for line in main.build_table(self.config, str(self.tests))])
+    self.assertEqual(rows[1][-2], "* x\n* <y> & z")
+
+  def test_tsv(self):
+    out = self.dir / "out.txt"
+    main.build_file(self.config, str(self.tests), str(out), format="tsv")
+    with open(out, encoding="utf-8", newline="") as f: rows = list(csv.reader(f, delimiter="\t"))
+    self.assertEqual(rows[0][:2], ["No", "ステップ"])
+    self.assertEqual(len(rows), 3)
+
+  def test_jsonl(self):
+    out = self.dir / "out.jsonl"
+    main.build_file(self.config, str(self.tests), str(out))
+    with open(out, encoding="utf-8") as f: records = [json.loads(line) for line in f]
+    self.assertEqual(records, [
+      {"no": "1-1-1-1", "path": ["a", "b", "c", "d"], "sections": {"cond": "* x\n* <y> & z", "proc": "p"}},
+      {"no": "1-1-1-2", "path": ["a", "b", "c", "e"], "sections": {"cond": "", "proc": "q"}},
+    ])
+
+  def test_column_kinds(self):
+    table = main.build_table(self.config, str(self.tests))
+    self.assertEqual(main.column_kinds(self.config, table.tolist()), main.column_kinds(self.config, table))
+
+  def test_html(self):
+    out = self.dir / "out.html"
+    main.build_file(self.config, str(self.tests), str(out))
+    text = out.read_text(encoding="utf-8")
+    self.assertIn("<th>No</th>", text)
+    self.assertIn("<td>* x\n* &lt;y&gt; &amp; z</td>", text)
+    self.assertEqual(text.count("<tr>"), 3)
+    self.assertIn("background: #002060; color: #FFFFFF;", text)
+    # aRGB colors are written as RGB
+    self.config["Headers"]["BackColor"] = "FF123456"
+    main.build_file(self.config, str(self.tests), str(out))
+    self.assertIn("background: #123456;", out.read_text(encoding="utf-8"))
+
+  def test_without_openpyxl(self):
+    out = self.dir / "out.csv"
+    code = f"import sys, yaml, src.main as main; main.build_file(yaml.safe_load(open('./sample/config.yml', encoding='utf-8')), {str(self.tests)!r}, {str(out)!r}); print('openpyxl' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    self.assertEqual(result.stdout.strip(), "False")
+    self.assertTrue(out.exists())
+
+if __name__ == "__main__":
+  unittest.main()
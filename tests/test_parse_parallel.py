@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import openpyxl
+
+import bench.benchmark as benchmark
+import src.main as main
+
+class TestParseParallel(unittest.TestCase):
+  # "&&" at the start of a chunk refers to the last test of the previous chunk, also across a chunk without tests
+  BOUNDARY = (
+    "preamble\n# A\n## a\n### x\n#### y\n:: c\nq\n:: d\nr\n"
+    "# B\n## b\n### x\n#### y\n:: c &&\n:: d &&\ns\n"
+    "# C\n"
+    "# D\n## d\n### x\n#### y\n:: d &&\n#### z\n:: c &&\n"
+    "# E\n## e\n### x\n#### y\n:: e &&\n:: c\nt\n"
+  )
+
+  def test_same_as_sequential(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = benchmark.generate_sheet(tmp, 2000, depth=4, sections=3, reuse=0.5, includes=20)
+      text = path.read_text(encoding="utf-8")
+      expected = main.generate_testlist(text, base=path.parent, includes=main.IncludeEngine())
+      actual = main.parse_parallel(text, base=path.parent, includes=main.IncludeEngine(), workers=2, threshold=0)
+    self.assertEqual(actual, expected)
+
+  def test_boundary(self):
+    chunks = main.split_chunks(self.BOUNDARY.split("\n"), 100)
+    self.assertEqual([c[0] for c in chunks], ["preamble", "# A", "# B", "# C", "# D", "# E"])
+    # one chunk per top-level heading
+    self.assertEqual(main.parse_parallel(self.BOUNDARY, workers=50, threshold=0), main.generate_testlist(self.BOUNDARY))
+    self.assertEqual(main.normalize_table(["l", "m", "s", "d"], main.parse_parallel(self.BOUNDARY, workers=50, threshold=0)).tolist(),
+      main.cells_normalization(["l", "m", "s", "d"], main.generate_testlist(self.BOUNDARY)))
+
+  def test_split_chunks(self):
+    lines = ["# a", "## b", "x", "# c", "  #d", "## e", "#f"]
+    self.assertEqual(main.split_chunks(lines, 100), [["# a", "## b", "x"], ["# c"], ["  #d", "## e"], ["#f"]])
+    self.assertEqual(main.split_chunks(lines, 3), [["# a", "## b", "x"], ["# c", "  #d", "## e"], ["#f"]])
+    self.assertEqual(main.split_chunks(lines, 1), [lines])
+
+  def test_threshold(self):
+    # below the threshold the sequential parser is used in this process
+    self.assertEqual(main.parse_parallel(self.BOUNDARY, workers=2), main.generate_testlist(self.BOUNDARY))
+
+  def test_error(self):
+    with self.assertRaises(Exception):
+      main.parse_parallel("# a\n## b\n# c\n### d\n:: x\ny\n", workers=2, threshold=0)
+
+  def test_cli(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      tests = Path(tmp) / "tests.md"
+      tests.write_text(self.BOUNDARY.replace("preamble\n", ""), encoding="utf-8")
+      self.assertEqual(main.main(["-o", str(Path(tmp) / "out.xlsx"), "-c", "./sample/config.yml", "--parallel-parse", "0", str(tests)]), 0)
+      ws = openpyxl.load_workbook(Path(tmp) / "out.xlsx").worksheets[0]
+      self.assertEqual(ws.cell(main.START_ROW + 1, 2).value, "A")
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import contextlib
+import io
+import pstats
+import tempfile
+from pathlib import Path
+
+import yaml
+
+import src.main as main
+
+class TestProfiler(unittest.TestCase):
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.config["Rearrange"] = ["no", "itemname", "content", "results"]
+    self.config["Consts"] = {"Environment": "env"}
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    self.tests = self.dir / "tests.md"
+    self.tests.write_text("# test\n## testb\n### testc\n#### testd\n:: aaa\nbbb\n:: ccc\nddd\n#### teste\n:: aaa &&\n", encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def test_report(self):
+    profiler = main.Profiler()
+    main.build_file(self.config, str(self.tests), str(self.dir / "out.xlsx"), profiler=profiler)
+    report = profiler.report()
+    for stage in ["generate_testlist", "cells_normalization", "add_examcells", "rearrange_cells", "expandvars", "create_excel", "adjusttable", "save"]:
+      self.assertIn(stage, report["stages"])
+      self.assertEqual(report["stages"][stage]["calls"], 1)
+    self.assertEqual(report["counters"]["rows"], 2)
+    self.assertGreater(report["counters"]["cells"], report["counters"]["columns"])
+    self.assertIn(report["slowest"], report["stages"])
+    self.assertAlmostEqual(report["total"]["wall"], sum(v["wall"] for v in report["stages"].values()))
+
+  def test_dump(self):
+    profiler = main.Profiler(cprofile=True)
+    main.build_file(self.config, str(self.tests), str(self.dir / "out.xlsx"), profiler=profiler)
+    profiler.dump(str(self.dir / "out.prof"))
+    self.assertGreater(pstats.Stats(str(self.dir / "out.prof")).total_calls, 0)
+
+  def test_dump_disabled(self):
+    with self.assertRaises(Exception):
+      main.Profiler().dump(str(self.dir / "out.prof"))
+
+  def test_quiet(self):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      main.build_file(self.config, str(self.tests), str(self.dir / "out.xlsx"))
+    self.assertEqual(out.getvalue(), "")
+
+if __name__ == "__main__":
+  unittest.main()
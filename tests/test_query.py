@@ -0,0 +1,126 @@
+import unittest
+import tempfile
+import random
+import os
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+def generate_sheet(path, items, seed=0):
+  # four levels of headings, three sections per item, some of them inherited by "&&", some tagged headings and empty items
+  rng = random.Random(seed)
+  lines = []
+  for n in range(items):
+    for level, size in enumerate([27, 9, 3]):
+      if n % size == 0:
+        lines.append(f"{'#' * (level + 1)} 見出し{level + 1}-{n // size % 3}" + (" [tag]" if rng.random() < 0.2 else ""))
+    lines.append(f"#### 項目{n}")
+    if rng.random() < 0.1:
+      continue
+    for s in range(3):
+      lines += [f":: 項目{s} &&"] if n > 0 and rng.random() < 0.6 else [f":: 項目{s}", f"* 手順{n}-{s}"]
+  path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+  return path
+
+class TestQuery(unittest.TestCase):
+  TESTS = "# STEP 1 [smoke]\n## 画面\n### 正常系\n#### 表示\n:: 手順\na\n### 異常系 [web] [slow]\n#### 入力\n:: 手順\nb\n# STEP 2\n## API [web]\n### 正常系\n#### 取得\n:: 手順\nc\n#### 更新\n:: 確認\nd\n:: 手順 &&\n"
+
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.tests = self.dir / "tests.md"
+    self.tests.write_text(self.TESTS, encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def select(self, *queries):
+    selector = main.Selector(queries)
+    return [r["items"] for r in main.iter_records(self.TESTS, self.dir, select=selector)]
+
+  def test_selector(self):
+    self.assertEqual(self.select("STEP 1"), [["STEP 1 [smoke]", "画面", "正常系", "表示"], ["STEP 1 [smoke]", "画面", "異常系 [web] [slow]", "入力"]])
+    self.assertEqual(self.select("*/*/正常*"), [["STEP 1 [smoke]", "画面", "正常系", "表示"], ["STEP 2", "API [web]", "正常系", "取得"], ["STEP 2", "API [web]", "正常系", "更新"]])
+    self.assertEqual(self.select("[web]"), [["STEP 1 [smoke]", "画面", "異常系 [web] [slow]", "入力"], ["STEP 2", "API [web]", "正常系", "取得"], ["STEP 2", "API [web]", "正常系", "更新"]])
+    self.assertEqual(self.select("[smoke] [web]"), [["STEP 1 [smoke]", "画面", "異常系 [web] [slow]", "入力"]])
+    self.assertEqual(self.select("STEP 2/*/*/更新", "STEP 1 [slow]"), [["STEP 1 [smoke]", "画面", "異常系 [web] [slow]", "入力"], ["STEP 2", "API [web]", "正常系", "更新"]])
+    with self.assertRaises(ValueError):
+      main.Selector([" / "])
+
+  def test_inherited_sections(self):
+    records = list(main.iter_records(self.TESTS, self.dir, select=main.Selector(["*/*/*/更新"])))
+    self.assertEqual([r["exams"] for r in records], [{"確認": ["d"], "手順": ["c"]}])
+
+  def test_index_same_as_filter(self):
+    tests = generate_sheet(self.dir / "generated.md", 500, seed=1)
+    text = tests.read_text(encoding="utf-8")
+    full = list(main.iter_records(text, tests.parent))
+    fullnumbers = [row[0] for row in main.normalize_table(["a", "b", "c", "d"], full).tolist()[1:]]
+    for queries in [["見出し1-0"], ["*/見出し2-0"], ["見出し1-*/*/見出し3-1*"], ["*/*/*/項目2*", "見出し1-1"], ["[tag]"]]:
+      selector = main.Selector(queries)
+      lines, numbers = main.select_lines(tests, selector)
+      self.assertLess(len(lines), len(text.split("\n")))
+      actual = list(main.iter_records(lines, tests.parent, str(tests), select=selector, numbers=numbers))
+      self.assertEqual([r.asdict() for r in actual], [r.asdict() for r in full if selector.match(r.node)], queries)
+      # the selected items keep the number they have in the whole sheet, with or without the index
+      expected = [no for r, no in zip(full, fullnumbers) if selector.match(r.node)]
+      self.assertEqual([row[0] for row in main.normalize_table(["a", "b", "c", "d"], actual).tolist()[1:]], expected, queries)
+      filtered = main.iter_records(text, tests.parent, select=selector)
+      self.assertEqual([row[0] for row in main.normalize_table(["a", "b", "c", "d"], filtered).tolist()[1:]], expected, queries)
+
+  def test_index_file(self):
+    selector = main.Selector(["STEP 2"])
+    self.assertIsNotNone(main.select_lines(self.tests, selector))
+    path = main.index_path(self.tests)
+    self.assertTrue(path.exists())
+    index = main.HeadingIndex.load(self.tests)
+    self.assertTrue(index.fresh(self.tests))
+    self.assertEqual([e[4] for e in index.entries[1:4]], ["STEP 1", "画面", "正常系"])
+    self.assertEqual(index.entries[1][5], ["smoke"])
+    self.assertEqual([e[8] for e in index.entries[1:5]], [None, None, None, [1, 1, 1, 1]])
+    # an edited file is indexed again
+    self.tests.write_text(self.TESTS + "#### 削除\n:: 手順\ne\n", encoding="utf-8")
+    os.utime(self.tests, ns=(0, 0))
+    self.assertFalse(index.fresh(self.tests))
+    lines, numbers = main.select_lines(self.tests, selector)
+    self.assertEqual([r["items"][-1] for r in main.iter_records(lines, self.dir, select=selector, numbers=numbers)], ["取得", "更新", "削除"])
+
+  def test_include_with_headings(self):
+    (self.dir / "part.md").write_text("#### 追加\n:: 手順\nx\n", encoding="utf-8")
+    (self.dir / "body.md").write_text("y\n", encoding="utf-8")
+    self.tests.write_text(self.TESTS + "#### 本文\n:: 手順\n&include({\"name\": \"body.md\"})\n", encoding="utf-8")
+    self.assertIsNotNone(main.select_lines(self.tests, main.Selector(["STEP 2"])))
+    self.tests.write_text(self.TESTS + "&include({\"name\": \"part.md\"})\n", encoding="utf-8")
+    self.assertIsNone(main.select_lines(self.tests, main.Selector(["STEP 2"])))
+    cells = main.build_table(self.config, str(self.tests), select=main.Selector(["STEP 2"]))
+    self.assertEqual([line[:5] for line in cells.tolist()[1:]], [["2-1-1-1", "STEP 2", "API [web]", "正常系", "取得"], ["2-1-1-2", "STEP 2", "API [web]", "正常系", "更新"], ["2-1-1-3", "STEP 2", "API [web]", "正常系", "追加"]])
+
+  def test_full_sheet_numbers(self):
+    full = main.build_table(self.config, str(self.tests)).tolist()[1:]
+    for query in ["STEP 2/*/*/更新", "[web]", "*/*/異常系"]:
+      cells = main.build_table(self.config, str(self.tests), select=main.Selector([query])).tolist()[1:]
+      self.assertEqual([line[:5] for line in cells], [line[:5] for line in full if line[1:5] in [c[1:5] for c in cells]], query)
+    self.assertEqual(main.build_table(self.config, str(self.tests), select=main.Selector(["STEP 2/*/*/更新"])).tolist()[1][0], "2-1-1-2")
+
+  def test_tags_kept_in_output(self):
+    # tags are only read by --select; the headings are written as they are
+    cells = main.build_table(self.config, str(self.tests))
+    self.assertEqual(cells.tolist()[1][1:5], ["STEP 1 [smoke]", "画面", "正常系", "表示"])
+    self.assertEqual(cells.tolist()[2][3], "異常系 [web] [slow]")
+
+  def test_cli(self):
+    out = self.dir / "cli.xlsx"
+    self.assertEqual(main.main(["-c", "./sample/config.yml", "--select", "[web]", "--select", "STEP 1/*/正常系", "-o", str(out), str(self.tests)]), 0)
+    ws = openpyxl.load_workbook(out).worksheets[0]
+    self.assertEqual([ws.cell(r, 5).value for r in range(main.START_ROW + 1, ws.max_row + 1)], ["表示", "入力", "取得", "更新"])
+    with self.assertRaises(SystemExit):
+      main.main(["-c", "./sample/config.yml", "--select", "[web]", "--low-memory", "-o", str(out), str(self.tests)])
+
+if __name__ == "__main__":
+  unittest.main()
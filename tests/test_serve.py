@@ -0,0 +1,104 @@
+import unittest
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import openpyxl
+
+import src.main as main
+
+class TestServe(unittest.TestCase):
+  TESTS = "# A\n## a\n### x\n#### y\n:: 手順\nq\n"
+
+  @classmethod
+  def setUpClass(cls) -> None:
+    cls.service = main.RenderService("./sample", workers=1, queue=2, cachesize=4)
+    cls.server = main.create_server(cls.service, port=0)
+    cls.url = "http://%s:%d" % cls.server.server_address[:2]
+    cls.thread = threading.Thread(target=cls.server.serve_forever)
+    cls.thread.start()
+
+  @classmethod
+  def tearDownClass(cls) -> None:
+    cls.server.shutdown()
+    cls.server.server_close()
+    cls.thread.join()
+    cls.service.close()
+
+  def request(self, path, body=None):
+    try:
+      with urllib.request.urlopen(urllib.request.Request(self.url + path, data=body)) as res:
+        return (res.status, res.headers["Content-Type"], res.read())
+    except urllib.error.HTTPError as e:
+      return (e.code, e.headers["Content-Type"], e.read())
+
+  def test_render(self):
+    status, content_type, body = self.request("/render?config=config", self.TESTS.encode("utf-8"))
+    self.assertEqual((status, content_type), (200, main.CONTENT_TYPES["xlsx"]))
+    ws = openpyxl.load_workbook(io.BytesIO(body)).worksheets[0]
+    self.assertEqual(ws.cell(main.START_ROW + 1, 6).value, "q")
+    status, _, body = self.request("/render?config=config&format=csv", self.TESTS.encode("utf-8"))
+    self.assertEqual(status, 200)
+    self.assertIn("q", body.decode("utf-8"))
+    status, _, body = self.request("/render?config=config&engine=fast", self.TESTS.encode("utf-8"))
+    self.assertEqual(openpyxl.load_workbook(io.BytesIO(body)).worksheets[0].cell(main.START_ROW + 1, 6).value, "q")
+
+  def test_errors(self):
+    self.assertEqual(self.request("/render?config=missing", b"")[0], 404)
+    self.assertEqual(self.request("/render?config=../config", b"")[0], 404)
+    self.assertEqual(self.request("/render", b"")[0], 400)
+    self.assertEqual(self.request("/render?config=config&format=pdf", b"")[0], 400)
+    status, _, body = self.request("/render?config=config", "# a\n### b\n:: x\ny\n".encode("utf-8"))
+    self.assertEqual(status, 422)
+    self.assertIn("error", json.loads(body))
+
+  def test_include_outside_base(self):
+    for name in ["../README.md", "/etc/hostname", "sample/../../README.md"]:
+      with self.subTest(name=name):
+        status, _, body = self.request("/render?config=config", f'# A\n## a\n### x\n#### y\n:: 手順\n&include({{"name": "{name}"}})\n'.encode("utf-8"))
+        self.assertEqual(status, 403)
+        self.assertIn("outside", json.loads(body)["error"])
+    status, _, _ = self.request("/render?config=config", '# A\n## a\n### x\n#### y\n:: 手順\n&include({"name": "sample/../LICENSE"})\n'.encode("utf-8"))
+    self.assertEqual(status, 200)
+
+  def test_stats(self):
+    self.request("/render?config=config", self.TESTS.encode("utf-8"))
+    self.request("/render?config=config", self.TESTS.encode("utf-8"))
+    status, _, body = self.request("/stats")
+    stats = json.loads(body)
+    self.assertEqual((status, stats["workers"], stats["inflight"], stats["queue_limit"]), (200, 1, 0, 2))
+    self.assertGreaterEqual(stats["requests"], 2)
+    self.assertGreaterEqual(stats["latency_ms"]["count"], 2)
+    self.assertGreaterEqual(stats["caches"]["configs"]["hits"], 1)
+    self.assertEqual(stats["caches"]["configs"]["size"], 1)
+
+  def test_busy(self):
+    service = main.RenderService("./sample", workers=1, queue=0)
+    try:
+      service.slots.acquire()
+      with self.assertRaises(main.ServiceBusy):
+        service.render("config", self.TESTS)
+      self.assertEqual(service.stats()["rejected"], 1)
+    finally:
+      service.close()
+
+class TestIncludeCache(unittest.TestCase):
+  def test_lru(self):
+    import tempfile
+    from pathlib import Path
+    engine = main.IncludeEngine(maxsize=2)
+    with tempfile.TemporaryDirectory() as tmp:
+      paths = [Path(tmp) / f"{i}.md" for i in range(3)]
+      for p in paths:
+        p.write_text(p.name, encoding="utf-8")
+      engine.fragment(paths[0])
+      engine.fragment(paths[1])
+      engine.fragment(paths[0])
+      engine.fragment(paths[2])
+      self.assertEqual(list(engine.fragments), [str(paths[0]), str(paths[2])])
+      self.assertEqual((engine.hits, engine.misses, engine.evictions), (1, 3, 1))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import bench.benchmark as benchmark
+import src.main as main
+
+class TestStream(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.config["Consts"] = {"Name": "const"}
+    self.tests = benchmark.generate_sheet(self.dir, 300, depth=4, sections=3, reuse=0.5, includes=10)
+    self.tests.write_text(self.tests.read_text(encoding="utf-8") + "# S\n## s\n### s\n#### s\n:: 追加\n{{Name}}の値\n", encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def load(self, path):
+    ws = openpyxl.load_workbook(path).worksheets[0]
+    widths = [ws.column_dimensions[openpyxl.utils.get_column_letter(c)].width for c in range(1, ws.max_column + 1)]
+    return ([[c.value for c in row] for row in ws.iter_rows()], widths)
+
+  def test_same_as_streaming(self):
+    main.build_file(self.config, str(self.tests), str(self.dir / "expected.xlsx"), streaming=True)
+    self.assertEqual(main.build_file_stream(self.config, str(self.tests), str(self.dir / "actual.xlsx")), 301)
+    self.assertEqual(self.load(self.dir / "actual.xlsx"), self.load(self.dir / "expected.xlsx"))
+
+  def test_stream_rows(self):
+    cells = main.table_from_lines(self.config, self.tests.read_text(encoding="utf-8"), self.dir)
+    expander = main.ConstExpander(self.config["Consts"])
+    sections, widths = main.scan_sections(self.config, main.iter_records(self.tests.read_text(encoding="utf-8"), self.dir, retain=False), expander)
+    self.assertEqual(sections, cells.header[5:])
+    self.assertEqual(len(widths), cells.width)
+    rows = main.stream_rows(self.config, main.iter_records(self.tests.read_text(encoding="utf-8"), self.dir, retain=False), sections, expander)
+    self.assertEqual(list(rows), cells.tolist())
+
+  def test_declared_sections(self):
+    self.config["Headers"]["Sections"] = ["追加"]
+    with self.assertRaisesRegex(Exception, "Undeclared section"):
+      main.build_file_stream(self.config, str(self.tests), str(self.dir / "out.xlsx"))
+    text = "# A\n## a\n### x\n#### y\n:: 手順\nq\n"
+    self.tests.write_text(text, encoding="utf-8")
+    self.config["Headers"]["Sections"] = ["追加", "手順"]
+    main.build_file_stream(self.config, str(self.tests), str(self.dir / "out.xlsx"))
+    values, _ = self.load(self.dir / "out.xlsx")
+    self.assertEqual(values[main.START_ROW - 1][5:7], ["追加", "手順"])
+    self.assertEqual(values[main.START_ROW][5:7], [None, "q"])
+
+  def test_unretained_records(self):
+    text = self.tests.read_text(encoding="utf-8")
+    expected = [(r["items"], r["exams"]) for r in main.iter_records(text, self.dir)]
+    self.assertEqual([(r["items"], r["exams"]) for r in main.iter_records(text, self.dir, retain=False)], expected)
+
+  def test_cli(self):
+    out = self.dir / "out" / "cli.xlsx"
+    self.assertEqual(main.main(["-c", "./sample/config.yml", "--low-memory", "-o", str(out), str(self.tests)]), 0)
+    self.assertEqual(openpyxl.load_workbook(out).worksheets[0].max_row, main.START_ROW + 301)
+    with self.assertRaises(SystemExit):
+      main.main(["-c", "./sample/config.yml", "--low-memory", "-o", str(self.dir / "out.csv"), str(self.tests)])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import openpyxl
+import openpyxl.styles as styles
+import yaml
+
+import src.main as main
+
+class TestStyleRegistry(unittest.TestCase):
+  def test_interning(self):
+    wb = openpyxl.Workbook()
+    registry = main.StyleRegistry(wb)
+    a = registry.get("Body", styles.Font(size=10), alignment=styles.Alignment(horizontal="left"))
+    b = registry.get("Body", styles.Font(size=10), alignment=styles.Alignment(horizontal="left"))
+    c = registry.get("Body", styles.Font(size=12))
+    self.assertEqual(a, b)
+    self.assertEqual((a, c), ("Body", "Body 2"))
+    self.assertEqual(main.StyleRegistry(wb).get("Other", styles.Font(size=10), alignment=styles.Alignment(horizontal="left")), "Body")
+
+  def test_apply(self):
+    wb = openpyxl.Workbook()
+    registry = main.StyleRegistry(wb)
+    name = registry.get("Body", styles.Font(size=10))
+    cellobj = wb.active.cell(1, 1)
+    registry.apply(cellobj, name)
+    self.assertEqual(cellobj.style, "Body")
+    self.assertEqual(cellobj.font.size, 10)
+
+  def test_workbook_styles(self):
+    with open("./sample/config.yml", encoding="utf-8") as f: config = yaml.safe_load(f)
+    cells = [["No", "ステップ", "中項目", "小項目", "詳細項目", "cond"] + ["実施担当", "確認担当", "実施日", "結果"] * 2]
+    cells += [[f"1-1-1-{i}", "a", "b", "c", "d", "e"] + [""] * 8 for i in range(200)]
+    wb = main.create_excel(config, cells)
+    main.adjusttable(wb.worksheets[-1], config["ColumnSet"])
+    # one style per distinct combination, not per cell
+    self.assertLess(len(wb.named_styles), 20)
+    ws = wb.worksheets[-1]
+    self.assertEqual(ws.cell(main.START_ROW + 1, 9).font.size, 8)
+    self.assertEqual(ws.cell(main.START_ROW + 1, 9).border.left.style, "thin")
+    self.assertEqual(ws.column_dimensions["I"].font.size, 8)
@@ -0,0 +1,45 @@
+import unittest
+
+import src.main as main
+
+class TestTable(unittest.TestCase):
+  EXAMS = [{
+    "items": ["test", "testb", "testc"],
+    "exams": {"aaa": "bbb"}
+  }, {
+    "items": ["test", "testd"],
+    "exams": {"aaa": "bbb", "ddd": "eee"}
+  }]
+  EXAMINFO = {"PrintCount": 2, "Labels": ["tester", "result"]}
+
+  def test_normalize(self):
+    table = main.normalize_table(["l", "m", "s"], self.EXAMS)
+    self.assertEqual(len(table), 3)
+    self.assertEqual(table.width, 6)
+    self.assertEqual(table.rows[0], ["1-1-1", "test", "testb", "testc", "bbb"])
+    self.assertEqual(table[1], ["1-1-1", "test", "testb", "testc", "bbb", ""])
+    self.assertEqual(table[-1], ["1-2-1", "test", "testd", "", "bbb", "eee"])
+
+  def test_results(self):
+    table = main.add_examcells(self.EXAMINFO, main.normalize_table(["l", "m", "s"], self.EXAMS))
+    self.assertEqual(table.width, 10)
+    self.assertEqual(table[0], ["No", "l", "m", "s", "aaa", "ddd", "tester", "result", "tester", "result"])
+    self.assertEqual(table[1], ["1-1-1", "test", "testb", "testc", "bbb", "", "", "", "", ""])
+
+  def test_rearrange_twice(self):
+    table = main.add_examcells(self.EXAMINFO, main.normalize_table(["l", "m", "s"], self.EXAMS))
+    main.rearrange_cells({}, table, ["results", "content", "itemname", "no"])
+    self.assertEqual(table[0], ["tester", "result", "tester", "result", "aaa", "ddd", "l", "m", "s", "No"])
+    main.rearrange_cells({}, table, ["no", "itemname", "results"])
+    self.assertEqual(table[0], ["No", "l", "m", "s", "tester", "result", "tester", "result"])
+    self.assertEqual(table.width, 8)
+    self.assertEqual(table[2], ["1-2-1", "test", "testd", "", "", "", "", ""])
+    with self.assertRaises(Exception):
+      main.rearrange_cells({}, table, ["no", "items"])
+    with self.assertRaises(Exception):
+      main.add_examcells(self.EXAMINFO, table)
+
+  def test_expandvars(self):
+    table = main.normalize_table(["l", "m", "s"], [{"items": ["{{a}}"], "exams": {"x": ["{{a}}", "b"]}}])
+    main.expandvars(table, {"a": "A"})
+    self.assertEqual(table.tolist(), [["No", "l", "m", "s", "x"], ["1-1-1", "A", "", "", ["A", "b"]]])
@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import openpyxl
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import PatternFill
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.worksheet.datavalidation import DataValidation
+import yaml
+
+import src.main as main
+import testsheetmaker.template as template
+
+class TestTemplate(unittest.TestCase):
+  TESTS = "# A\n## a\n### x\n#### y\n:: 手順\nq\n#### z\n:: 手順\nr\n#### w\n:: 手順\ns\n"
+
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = yaml.safe_load(f)
+    self.tests = self.dir / "tests.md"
+    self.tests.write_text(self.TESTS, encoding="utf-8")
+    self.template = self.dir / "template.xlsx"
+    wb = openpyxl.Workbook()
+    cover = wb.active
+    cover.title = "表紙"
+    cover["A1"] = "品質保証部"
+    wb.defined_names["Project"] = DefinedName("Project", attr_text="'表紙'!$A$1")
+    ws = wb.create_sheet("試験票")
+    # placeholder rows of the template are replaced by the table
+    ws.merge_cells("G2:J2")
+    for r in range(2, 8):
+      ws.cell(r, 2, "placeholder")
+    # 結果 of the first attempt is the 10th column
+    dv = DataValidation(type="list", formula1='"OK,NG"')
+    ws.add_data_validation(dv)
+    dv.add("J4")
+    whole = DataValidation(type="list", formula1='"OK,NG"')
+    ws.add_data_validation(whole)
+    whole.add("N4:N1048576")
+    ws.conditional_formatting.add("J4", CellIsRule(operator="equal", formula=['"NG"'], fill=PatternFill(bgColor="FFC7CE")))
+    ws.print_area = "A1:N4"
+    ws.page_setup.orientation = "landscape"
+    wb.save(self.template)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def test_stamp(self):
+    out = self.dir / "out.xlsx"
+    main.build_file(self.config, str(self.tests), str(out), template=str(self.template))
+    wb = openpyxl.load_workbook(out)
+    self.assertEqual(wb.sheetnames, ["表紙", "試験票"])
+    self.assertEqual(wb["表紙"]["A1"].value, "品質保証部")
+    self.assertIn("Project", wb.defined_names)
+    ws = wb["試験票"]
+    self.assertEqual([ws.cell(r, 6).value for r in range(main.START_ROW + 1, ws.max_row + 1)], ["q", "r", "s"])
+    self.assertEqual(ws.cell(main.START_ROW, 10).value, "結果")
+    self.assertEqual(ws.max_row, main.START_ROW + 3)
+    self.assertEqual(ws.page_setup.orientation, "landscape")
+    self.assertEqual(sorted(str(dv.sqref) for dv in ws.data_validations.dataValidation), ["J4:J6", "N4:N1048576"])
+    self.assertEqual([str(cf.sqref) for cf in ws.conditional_formatting], ["J4:J6"])
+    self.assertEqual(ws.print_area, "'試験票'!$A$1:$N$6")
+    self.assertEqual(sorted(map(str, ws.merged_cells.ranges)), ["G2:J2", "K2:N2"])
+
+  def test_new_sheet(self):
+    self.config["Sheet"]["Name"] = "別シート"
+    out = self.dir / "out.xlsx"
+    main.build_file(self.config, str(self.tests), str(out), template=str(self.template))
+    wb = openpyxl.load_workbook(out)
+    self.assertEqual(wb.sheetnames, ["表紙", "試験票", "別シート"])
+    self.assertEqual(wb["試験票"]["B3"].value, "placeholder")
+
+  def test_cached(self):
+    main.open_template(self.template)
+    info = template._load_template.cache_info()
+    first, second = main.open_template(self.template), main.open_template(self.template)
+    self.assertIsNot(first, second)
+    self.assertEqual(template._load_template.cache_info().misses, info.misses)
+    self.assertEqual(template._load_template.cache_info().hits, info.hits + 2)
+
+  def test_cli(self):
+    out = self.dir / "cli.xlsx"
+    self.assertEqual(main.main(["-c", "./sample/config.yml", "--template", str(self.template), "-o", str(out), str(self.tests)]), 0)
+    self.assertEqual(openpyxl.load_workbook(out).sheetnames, ["表紙", "試験票"])
+    with self.assertRaises(SystemExit):
+      main.main(["-c", "./sample/config.yml", "--template", str(self.template), "--engine", "fast", "-o", str(out), str(self.tests)])
+
+if __name__ == "__main__":
+  unittest.main()
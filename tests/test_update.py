@@ -0,0 +1,117 @@
+import unittest
+import datetime
+import tempfile
+from pathlib import Path
+
+import openpyxl
+import yaml
+
+import src.main as main
+
+class TestUpdate(unittest.TestCase):
+  TESTS = "# A\n## a\n### x\n#### y\n:: 手順\nq\n:: 期待値\nr\n#### z\n:: 手順\ns\n# B\n## b\n### x\n#### y\n:: 手順\nt\n"
+
+  def setUp(self) -> None:
+    with open("./sample/config.yml", encoding="utf-8") as f: self.config = main.Config(yaml.safe_load(f))
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    self.tests = self.dir / "tests.md"
+    self.out = self.dir / "tests.xlsx"
+    self.tests.write_text(self.TESTS, encoding="utf-8")
+    main.build_file(self.config, str(self.tests), str(self.out))
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def header(self, ws):
+    return [c.value for c in ws[main.START_ROW]]
+
+  def enter_results(self):
+    wb = openpyxl.load_workbook(self.out)
+    ws = wb.worksheets[0]
+    header = self.header(ws)
+    date = header.index("実施日") + 1
+    result = len(header) - [*reversed(header)].index("結果")
+    ws.cell(main.START_ROW + 1, date).value = datetime.datetime(2024, 4, 1)
+    ws.cell(main.START_ROW + 1, result).value = "OK"
+    ws.cell(main.START_ROW + 3, result).value = "NG"
+    wb.save(self.out)
+    return (date, result)
+
+  def test_carry_results(self):
+    date, result = self.enter_results()
+    wb = openpyxl.load_workbook(self.out)
+    wb.worksheets[0].cell(main.START_ROW + 2, result).value = "OK"
+    wb.save(self.out)
+    # y under "A" changes its content, z is removed and a new item is added
+    self.tests.write_text(self.TESTS.replace("r\n", "r2\n").replace("#### z\n:: 手順\ns\n", "#### w\n:: 手順\nu\n"), encoding="utf-8")
+    with self.assertLogs("testsheetmaker", "WARNING"):
+      written, stats = main.update_file(self.config, str(self.tests), self.out)
+    self.assertTrue(written)
+    self.assertEqual(stats, {"unchanged": 1, "changed": 1, "new": 1, "removed": 1, "current": 0})
+    ws = openpyxl.load_workbook(self.out).worksheets[0]
+    self.assertEqual(ws.cell(main.START_ROW + 1, date).value, datetime.datetime(2024, 4, 1))
+    self.assertEqual(ws.cell(main.START_ROW + 1, result).value, "OK")
+    self.assertEqual(ws.cell(main.START_ROW + 2, result).value, None)
+    # "B" moved up one row and kept its result
+    self.assertEqual(ws.cell(main.START_ROW + 3, 2).value, "B")
+    self.assertEqual(ws.cell(main.START_ROW + 3, result).value, "NG")
+
+  def test_up_to_date(self):
+    self.enter_results()
+    mtime = self.out.stat().st_mtime_ns
+    written, stats = main.update_file(self.config, str(self.tests), self.out)
+    self.assertFalse(written)
+    self.assertEqual((stats["unchanged"], stats["current"]), (3, 1))
+    self.assertEqual(self.out.stat().st_mtime_ns, mtime)
+    other = self.dir / "other.xlsx"
+    self.assertTrue(main.update_file(self.config, str(self.tests), self.out, other)[0])
+    self.assertEqual(openpyxl.load_workbook(other).worksheets[0].cell(main.START_ROW + 3, len(self.header(openpyxl.load_workbook(other).worksheets[0]))).value, "NG")
+
+  def test_duplicate_items(self):
+    self.tests.write_text("# A\n## a\n### x\n#### y\n:: 手順\nq\n#### y\n:: 手順\ns\n", encoding="utf-8")
+    main.build_file(self.config, str(self.tests), str(self.out))
+    date, result = self.enter_results()
+    self.tests.write_text("# A\n## a\n### x\n#### y\n:: 手順\nq\n#### y\n:: 手順\ns2\n", encoding="utf-8")
+    written, stats = main.update_file(self.config, str(self.tests), self.out)
+    self.assertEqual((stats["unchanged"], stats["changed"]), (1, 1))
+    ws = openpyxl.load_workbook(self.out).worksheets[0]
+    self.assertEqual([ws.cell(main.START_ROW + r, result).value for r in (1, 2)], ["OK", None])
+
+  def test_body_replace(self):
+    # the item names in the old workbook are the replaced values
+    config = yaml.safe_load(open("./sample/config.yml", encoding="utf-8"))
+    config["ColumnSet"]["詳細項目"]["Body"] = {"Replace": "[%%]"}
+    config["ColumnSet"]["手順"] = {"Body": {"Replace": "@%%.upper()"}}
+    self.config = main.Config(config)
+    main.build_file(self.config, str(self.tests), str(self.out))
+    date, result = self.enter_results()
+    self.assertEqual(openpyxl.load_workbook(self.out).worksheets[0].cell(main.START_ROW + 1, 5).value, "[y]")
+    self.tests.write_text(self.TESTS.replace("t\n", "t2\n"), encoding="utf-8")
+    written, stats = main.update_file(self.config, str(self.tests), self.out)
+    self.assertEqual(stats, {"unchanged": 2, "changed": 1, "new": 0, "removed": 0, "current": 0})
+    ws = openpyxl.load_workbook(self.out).worksheets[0]
+    self.assertEqual([ws.cell(main.START_ROW + r, result).value for r in (1, 2, 3)], ["OK", None, "NG"])
+    self.assertEqual(ws.cell(main.START_ROW + 1, date).value, datetime.datetime(2024, 4, 1))
+
+  def test_mismatch(self):
+    wb = openpyxl.Workbook()
+    wb.active.cell(main.START_ROW, 1).value = "No."
+    wb.save(self.out)
+    with self.assertRaises(Exception):
+      main.update_file(self.config, str(self.tests), self.out)
+
+  def test_cli(self):
+    date, result = self.enter_results()
+    self.tests.write_text(self.TESTS + "#### v\n:: 手順\nw\n", encoding="utf-8")
+    self.assertEqual(main.main(["-c", "./sample/config.yml", "--update", str(self.out), str(self.tests)]), 0)
+    ws = openpyxl.load_workbook(self.out).worksheets[0]
+    self.assertEqual(ws.cell(main.START_ROW + 3, result).value, "NG")
+    self.assertEqual(ws.cell(main.START_ROW + 4, 5).value, "v")
+    with self.assertRaises(SystemExit):
+      main.main(["-c", "./sample/config.yml", "--update", str(self.out), "--engine", "fast", str(self.tests)])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import openpyxl
+
+import bench.benchmark as benchmark
+import src.main as main
+
+class TestSectionParser(unittest.TestCase):
+  TESTS = "# A\n## a\n### x\n#### y\n:: c\nq\n:: d\nr\n# B\n## b\n### x\n#### y\n:: c &&\n:: d\ns\n# C\n## c\n### x\n#### y\n:: c\nt\n"
+
+  def test_same_as_iter_records(self):
+    parser = main.SectionParser()
+    self.assertEqual(parser.parse(self.TESTS), main.generate_testlist(self.TESTS))
+    self.assertEqual(parser.parsed, 3)
+    # only the edited section is parsed again, "&&" still refers to the previous section
+    edited = self.TESTS.replace("q\n", "q2\n")
+    self.assertEqual(parser.parse(edited), main.generate_testlist(edited))
+    self.assertEqual(parser.parsed, 1)
+    self.assertEqual(parser.parse(edited), main.generate_testlist(edited))
+    self.assertEqual(parser.parsed, 0)
+    removed = edited.replace("# C\n## c\n### x\n#### y\n:: c\nt\n", "")
+    self.assertEqual(parser.parse(removed), main.generate_testlist(removed))
+    self.assertEqual(len(parser.sections), 2)
+
+  def test_generated(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = benchmark.generate_sheet(tmp, 500, depth=4, sections=3, reuse=0.5, includes=10)
+      text = path.read_text(encoding="utf-8")
+      parser = main.SectionParser()
+      self.assertEqual(parser.parse(text, base=path.parent), main.generate_testlist(text, base=path.parent, includes=main.IncludeEngine()))
+
+class TestWatcher(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+    self.tests = self.dir / "tests.md"
+    self.part = self.dir / "part.md"
+    self.out = self.dir / "tests.xlsx"
+    self.part.write_text(":: 手順\np\n", encoding="utf-8")
+    self.tests.write_text('# A\n## a\n### x\n#### y\n&include({"name": "part.md"})\n# B\n## b\n### x\n#### y\n:: 手順\nt\n', encoding="utf-8")
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.tmp.cleanup()
+    return super().tearDown()
+
+  def touch(self, path, text):
+    # make sure the modification time changes on file systems with a coarse clock
+    mtime = path.stat().st_mtime_ns
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+
+  def steps(self):
+    ws = openpyxl.load_workbook(self.out).worksheets[0]
+    return [ws.cell(r, 6).value for r in range(main.START_ROW + 1, ws.max_row + 1)]
+
+  def test_build(self):
+    watcher = main.Watcher("./sample/config.yml", str(self.tests), str(self.out))
+    self.assertTrue(watcher.build())
+    self.assertEqual(self.steps(), ["p", "t"])
+    self.assertEqual(watcher.changed(), [])
+    self.assertIn(str(self.part.resolve()), watcher.mtimes)
+    self.touch(self.part, ":: 手順\np2\n")
+    self.assertEqual(watcher.changed(), [str(self.part.resolve())])
+    self.assertTrue(watcher.build())
+    self.assertEqual(self.steps(), ["p2", "t"])
+    self.assertEqual(watcher.parser.parsed, 1)
+    # errors are reported and the watcher keeps the last output
+    self.touch(self.tests, "# A\n### x\n")
+    with self.assertLogs("testsheetmaker", "ERROR"):
+      self.assertFalse(watcher.build())
+    self.assertEqual(watcher.changed(), [])
+
+  def test_consts(self):
+    # sections kept from the previous build must not hold the constants expanded with the old config
+    config = self.dir / "config.yml"
+    base = Path("./sample/config.yml").read_text(encoding="utf-8")
+    config.write_text(base + "Consts:\n  ver: v1\n", encoding="utf-8")
+    self.tests.write_text("# A\n## a\n### x\n#### y\n:: 手順\nrun {{ver}}\n", encoding="utf-8")
+    watcher = main.Watcher(str(config), str(self.tests), str(self.out))
+    self.assertTrue(watcher.build())
+    self.assertEqual(self.steps(), ["run v1"])
+    self.touch(config, base + "Consts:\n  ver: v2\n")
+    self.assertEqual(watcher.changed(), [str(config)])
+    self.assertTrue(watcher.build())
+    self.assertEqual(self.steps(), ["run v2"])
+
+  def test_run(self):
+    watcher = main.Watcher("./sample/config.yml", str(self.tests), str(self.out))
+    builds = []
+    build = watcher.build
+    watcher.build = lambda: builds.append(build())
+    done = threading.Event()
+    thread = threading.Thread(target=watcher.run, kwargs={"interval": 0.01, "debounce": 0.1, "stop": done.is_set})
+    thread.start()
+    try:
+      while builds == []: time.sleep(0.01)
+      # saves in quick succession are built once
+      for i in range(3):
+        self.touch(self.tests, self.tests.read_text(encoding="utf-8").replace("t\n", f"t{i}\n").replace(f"t{i - 1}\n", f"t{i}\n"))
+        time.sleep(0.02)
+      deadline = time.time() + 5
+      while len(builds) < 2 and time.time() < deadline: time.sleep(0.01)
+      time.sleep(0.3)
+    finally:
+      done.set()
+      thread.join()
+    self.assertEqual(builds, [True, True])
+    self.assertEqual(self.steps(), ["p", "t2"])
+
+if __name__ == "__main__":
+  unittest.main()